@@ -49,11 +49,19 @@ self.addEventListener('fetch', event => {
     // For API calls, use stale-while-revalidate strategy
     event.respondWith(
       caches.open(API_CACHE).then(cache => {
+        // The browser HTTP cache revalidates with If-None-Match, so an unchanged
+        // list comes back as a 304 and is served from the cached copy.
         return fetch(event.request)
           .then(networkResponse => {
-            // Only cache GET responses
+            // Only cache GET responses, and skip the write when the ETag is unchanged
             if (event.request.method === 'GET' && networkResponse.ok) {
-              cache.put(event.request, networkResponse.clone());
+              return cache.match(event.request).then(cached => {
+                const etag = networkResponse.headers.get('ETag');
+                if (!etag || !cached || cached.headers.get('ETag') !== etag) {
+                  cache.put(event.request, networkResponse.clone());
+                }
+                return networkResponse;
+              });
             }
             return networkResponse;
           })
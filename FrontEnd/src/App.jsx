@@ -52,6 +52,7 @@ export default function App() {
         loading: todosLoading,
         error: todosError,
         fetchData: fetchTodos,
+        refreshData: refreshTodos,
         optimisticUpdate: optimisticTodosUpdate
     } = useApiCache([])
 
@@ -60,6 +61,7 @@ export default function App() {
         loading: archivesLoading,
         error: archivesError,
         fetchData: fetchArchives,
+        refreshData: refreshArchives,
         optimisticUpdate: optimisticArchivesUpdate
     } = useApiCache([])
 
@@ -375,7 +377,35 @@ export default function App() {
         } else if (activeTab === 'archives') {
             loadArchives();
         }
-    }, []);  // Map data from backend format to frontend format
+    }, []);
+
+    // Keep both lists current with changes pushed by the server (including
+    // those made in other tabs), instead of waiting for a manual refresh.
+    // Bursts of events are coalesced into one reload per list.
+    useEffect(() => {
+        const stale = new Set()
+        let timer = null
+        const flush = () => {
+            timer = null
+            if (stale.has('tasks')) refreshTodos(() => api.getTodos())
+            if (stale.has('archives')) refreshArchives(() => api.getArchives())
+            stale.clear()
+        }
+        const unsubscribe = api.subscribeToChanges((change) => {
+            if (change.op === 'reset' || change.op === 'archive' || change.op === 'unarchive') {
+                stale.add('tasks').add('archives')
+            } else {
+                stale.add(change.list)
+            }
+            if (timer === null) {
+                timer = setTimeout(flush, 250)
+            }
+        })
+        return () => {
+            unsubscribe()
+            if (timer !== null) clearTimeout(timer)
+        }
+    }, [refreshTodos, refreshArchives]);  // Map data from backend format to frontend format
     const mappedTodos = useMemo(() => {
         // Handle case where todos is null, undefined or not an array
         if (!todos || !Array.isArray(todos) || todos.length === 0) {
@@ -75,3 +75,23 @@ export const unarchiveTodo = (id) => {
   return API.post('/unArchive', { archive_id: archiveId });
 }
 export const getArchives = () => API.get('/archives')
+
+// Server-Sent Events from /api/events. `onChange` gets each change payload,
+// e.g. { op: 'archive', list: 'tasks', id: 4, archive_id: 9 }; { op: 'reset' }
+// means events were missed and both lists should be reloaded. The browser
+// reconnects by itself and resumes from the last event id it saw.
+// Returns a function that closes the stream.
+export const subscribeToChanges = (onChange) => {
+  if (typeof EventSource === 'undefined') {
+    return () => {}
+  }
+  const source = new EventSource(`${API.defaults.baseURL}/events`)
+  source.addEventListener('change', (event) => {
+    try {
+      onChange(JSON.parse(event.data))
+    } catch (error) {
+      console.error('Invalid change event:', event.data, error)
+    }
+  })
+  return () => source.close()
+}
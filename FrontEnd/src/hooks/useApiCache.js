@@ -104,12 +104,27 @@ export default function useApiCache(initialData = []) {
         }
     }, [])
 
+    // Re-fetch in the background, keeping the current list on screen
+    const refreshData = useCallback(async (apiCall) => {
+        try {
+            const response = await apiCall()
+            const payload = response && response.data !== undefined
+                ? response.data
+                : response
+            setData(Array.isArray(payload) || payload == null ? payload || [] : payload)
+            return response
+        } catch (err) {
+            console.error('Background refresh failed:', err)
+        }
+    }, [])
+
     return {
         data,
         loading,
         error,
         setData,
         optimisticUpdate,
-        fetchData
+        fetchData,
+        refreshData
     }
 }
@@ -1,33 +1,35 @@
 import logging
-from logging.handlers import RotatingFileHandler
 from flask import Flask, jsonify
 from flask_cors import CORS 
 import os
-from .models import init_db, close_db_session
+from .models import Database, close_db_session, describe_engine
 from .control_endpoints import api
 from .config import Config
+from .cache import ResponseCache
+from .events import EventHub
+from .writer import WriteQueue
+from .models.lists import ListRegistry
+from .models.migrations import pending_migrations
+from .models.read_model import TaskReadModel
+from .maintenance import MaintenanceWorker
+from .metrics import init_metrics, instrument_engine
+from .admission import init_admission
+from .compression import init_compression
+from .log import LogPipeline
 
 def create_app(config_object=None):
     if config_object is None:
         config_object = Config
 
-    # Logging setup
-    log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'logs')
-    os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, 'app.log')
-
-    handler = RotatingFileHandler(log_file, maxBytes=100000, backupCount=3)
-    formatter = logging.Formatter('[%(asctime)s] %(levelname)s in %(module)s: %(message)s')
-    handler.setFormatter(formatter)
-    handler.setLevel(logging.INFO)
-
     # Flask app initialization
     app = Flask(__name__)
     app.config.from_object(config_object)
-    app.logger.addHandler(handler)
+    # All apps share the "app" logger; the latest app's pipeline decides where it writes
+    log_pipeline = app.extensions['log_pipeline'] = LogPipeline()
+    log_pipeline.configure(app)
     app.logger.setLevel(logging.INFO)
 
-    CORS(app)
+    CORS(app, expose_headers=['ETag'])
 
     app.logger.info('Flask app initialized with logging.')
 
@@ -44,19 +46,55 @@ def create_app(config_object=None):
         db_dir = os.path.dirname(actual_db_file_path)
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir, exist_ok=True)
-            app.logger.info(f"Created directory for SQLite database: {db_dir}")
+            app.logger.info("Created directory for SQLite database: %s", db_dir)
 
         if not os.path.exists(actual_db_file_path):
-            app.logger.info(f"SQLite Database file not found at {actual_db_file_path}. Initializing new database...")
+            app.logger.info("SQLite Database file not found at %s. It is created on first use.", actual_db_file_path)
         else:
-            app.logger.info(f"SQLite Database file found at {actual_db_file_path}. Ensuring tables exist...")
+            app.logger.info("SQLite Database file found at %s. Tables are checked on first use.", actual_db_file_path)
     else:
-        app.logger.info(f"Database URI: {database_uri}. Proceeding with initialization (file existence check skipped or not applicable for this URI type).")
-
-    init_db()
+        app.logger.info("Database URI: %s. Proceeding with initialization (file existence check skipped or not applicable for this URI type).", database_uri)
+
+    # The engine is built, and the schema created or migrated, by the first query
+    database = Database(config_object)
+    app.extensions['database'] = database
+    # Committed sessions publish their change events to the hub in their info
+    event_hub = app.extensions['event_hub'] = database.session_info['event_hub'] = EventHub()
+    event_hub.configure(app)
+
+    def report_database(engine):
+        pending = pending_migrations(engine)
+        if pending:
+            app.logger.warning("%s schema migrations pending; run 'python manage.py migrate'.", len(pending))
+        app.logger.info("Database engine settings: %s", describe_engine(engine))
+
+    database.on_create(report_database)
+
+    # Loaded along with the engine, so startup stays as lazy as the database itself
+    if app.config.get('READ_MODEL_ENABLED', False):
+        read_model = TaskReadModel(app.config.get('READ_MODEL_MAX_BYTES', 64 * 1024 * 1024),
+                                   app.config.get('READ_MODEL_CHECK_INTERVAL_SECONDS', 60.0))
+        app.extensions['read_model'] = database.session_info['read_model'] = read_model
+        database.on_create(read_model.start)
     # --- End database initialization integration ---
 
+    # Services of this app only; a second app gets its own
+    app.extensions['response_cache'] = ResponseCache()
+    app.extensions['response_cache'].configure(app)
+    app.extensions['write_queue'] = WriteQueue()
+    app.extensions['write_queue'].configure(app)
+    init_metrics(app)
+    init_admission(app)
+    init_compression(app)
+    instrument = instrument_engine if app.config.get('METRICS_ENABLED', True) else None
+    if instrument is not None:
+        database.on_create(instrument)
+    app.extensions['list_registry'] = ListRegistry()
+    app.extensions['list_registry'].configure(app, on_open=instrument, session_info={'event_hub': event_hub})
     app.register_blueprint(api, url_prefix='/api')
+    app.register_blueprint(api, url_prefix='/api/lists/<list_key>', name='lists')
+    app.extensions['maintenance_worker'] = MaintenanceWorker()
+    app.extensions['maintenance_worker'].configure(app)
 
     @app.teardown_appcontext
     def shutdown_session(exc=None): # Added exc=None argument
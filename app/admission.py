@@ -0,0 +1,139 @@
+"""
+Admission control: per-class concurrency limits with bounded wait queues.
+
+With `ADMISSION_ENABLED`, every request to a read endpoint (`/tasks`,
+`/archives`, `/sync`) or a write endpoint (`/add`, `/archive`,
+`/unArchive`, `/perm_delete`, `/batch`), of the default database or a named
+list, first takes a slot of its class. At most `ADMISSION_<CLASS>_LIMIT`
+requests of a class run at once; up to `ADMISSION_<CLASS>_QUEUE` more wait,
+first come first served, for at most `ADMISSION_<CLASS>_TIMEOUT_MS`. A
+request that finds the queue full, or whose wait runs out, is answered at
+once with `503` and `Retry-After` instead of piling up behind SQLite's write
+lock. The classes have separate slots, so saturated writes never take the
+threads that reads need. Other endpoints are not limited.
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from flask import abort, g, jsonify
+
+# View names of the blueprint (see `control_endpoints.py`) by admission class.
+ENDPOINT_CLASSES = {
+    'get_tasks': 'read', 'get_archives': 'read', 'sync_data': 'read',
+    'add_task': 'write', 'archive': 'write', 'unArchive': 'write', 'delete_from_archive': 'write', 'batch': 'write',
+}
+
+
+class Gate:
+    """`limit` slots and a FIFO queue of at most `queue_size` waiting for one.
+
+    A released slot is handed straight to the oldest waiter, so a request
+    arriving meanwhile cannot overtake the queue.
+    """
+
+    def __init__(self, limit: int, queue_size: int, timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: Deque[threading.Event] = deque()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.queued = 0
+        self.shed_full = 0
+        self.shed_timeout = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if there is room. False if the request is shed."""
+        with self._lock:
+            if self.active < self.limit:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if len(self._waiters) >= self.queue_size:
+                self.shed_full += 1
+                return False
+            granted = threading.Event()
+            self._waiters.append(granted)
+            self.queued += 1
+        if granted.wait(self.timeout):
+            return True
+        with self._lock:
+            # Granted between the timeout and taking the lock: the slot is ours after all
+            if granted.is_set():
+                return True
+            self._waiters.remove(granted)
+            self.shed_timeout += 1
+            return False
+
+    def release(self) -> None:
+        """Give the slot to the oldest waiter, or free it."""
+        with self._lock:
+            if self._waiters:
+                self.admitted += 1
+                self._waiters.popleft().set()
+            else:
+                self.active -= 1
+
+
+def build_gates(config) -> Dict[str, Gate]:
+    """The `read` and `write` gates for the `ADMISSION_*` settings of `config`."""
+    return {
+        name: Gate(config.get(f'ADMISSION_{name.upper()}_LIMIT', default_limit),
+                   config.get(f'ADMISSION_{name.upper()}_QUEUE', default_queue),
+                   config.get(f'ADMISSION_{name.upper()}_TIMEOUT_MS', default_timeout) / 1000)
+        for name, default_limit, default_queue, default_timeout in (('read', 16, 64, 1000), ('write', 4, 16, 500))
+    }
+
+
+def init_admission(app) -> Optional[Dict[str, Gate]]:
+    """Register the admission hooks on `app` if `ADMISSION_ENABLED`; the gates are kept in its extensions."""
+    if not app.config.get('ADMISSION_ENABLED', False):
+        return None
+    gates = app.extensions['admission'] = build_gates(app.config)
+    retry_after = str(app.config.get('ADMISSION_RETRY_AFTER_SECONDS', 1))
+
+    # App URL value preprocessors run before the blueprint's, so a shed request never opens a named list
+    @app.url_value_preprocessor
+    def admit_request(endpoint, values):
+        name = ENDPOINT_CLASSES.get((endpoint or '').rsplit('.', 1)[-1])
+        if name is None:
+            return
+        gate = gates[name]
+        if not gate.acquire():
+            response = jsonify({'error': 'Server is busy, try again later'})
+            response.status_code = 503
+            response.headers['Retry-After'] = retry_after
+            abort(response)
+        g.admission_gate = gate
+
+    @app.teardown_request
+    def release_slot(exc=None):
+        gate = g.pop('admission_gate', None)
+        if gate is not None:
+            gate.release()
+
+    return gates
+
+
+def admission_metrics(gates: Optional[Dict[str, Gate]]) -> Dict[str, Tuple[str, str, float]]:
+    """Gate counters in the `extra` format of `Metrics.render`; empty when admission control is off."""
+    extra = {}
+    for name, gate in (gates or {}).items():
+        prefix = f'todo_admission_{name}'
+        extra.update({
+            f'{prefix}_active': ('gauge', f'{name.capitalize()} requests running.', gate.active),
+            f'{prefix}_waiting': ('gauge', f'{name.capitalize()} requests waiting for a slot.', gate.waiting),
+            f'{prefix}_admitted_total': ('counter', f'{name.capitalize()} requests admitted.', gate.admitted),
+            f'{prefix}_queued_total': ('counter', f'{name.capitalize()} requests that had to wait.', gate.queued),
+            f'{prefix}_shed_queue_full_total': (
+                'counter', f'{name.capitalize()} requests answered 503 because the queue was full.', gate.shed_full),
+            f'{prefix}_shed_timeout_total': (
+                'counter', f'{name.capitalize()} requests answered 503 after waiting too long.', gate.shed_timeout),
+        })
+    return extra
@@ -0,0 +1,614 @@
+"""
+Asyncio (ASGI) serving mode for the `/api/*` endpoints.
+
+`create_asgi_app()` sets up configuration, logging, the schema, the response
+cache and metrics exactly like `create_app()`, then serves the API from a
+plain ASGI callable backed by `AsyncMainLogic`. Requests, responses, ETags
+and error bodies are the same as the Flask blueprint's; a request waiting on
+the database parks a coroutine instead of a thread, so idle and slow
+connections cost next to nothing.
+
+Run it with any ASGI server, e.g. ``uvicorn asgi:app`` (see `asgi.py`).
+"""
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+from werkzeug.http import parse_etags, quote_etag, unquote_etag
+from . import create_app
+from .compression import StreamCompressor, choose_coding, coded_etag, compress, should_compress
+from .config import Config
+from .encoding import JSON, encode, negotiate, rows_payload
+from .control_endpoints import (
+    FETCH_BY_ID, batch_response, cache_metrics, delta_response, last_event_id, list_body, make_etag, matching_etag,
+    ndjson_line, page_totals, search_page, search_plan, sync_ids, validate_batch, wants_total, _keyset_bounds,
+    _sync_pages,
+)
+from .events import HEARTBEAT, EventStream, format_event
+from .metrics import finish_request, instrument_engine, start_request
+from .models.async_control import AsyncMainLogic, build_async_engine
+from .models.pagination import next_cursor
+from .models.read_model import read_model_metrics
+
+
+class Request:
+    """The parts of an ASGI HTTP request the endpoints need."""
+
+    def __init__(self, scope, receive):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self._receive = receive
+        self._body: Optional[bytes] = None
+        # Table versions read by `AsyncAPI.conditional`, keying the response cache, and the negotiated format
+        self.versions: Optional[Dict[str, int]] = None
+        self.format = JSON
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Yield the body as it arrives."""
+        while True:
+            message = await self._receive()
+            if message['type'] == 'http.disconnect':
+                return
+            yield message.get('body', b'')
+            if not message.get('more_body'):
+                return
+
+    async def body(self) -> bytes:
+        if self._body is None:
+            self._body = b''.join([chunk async for chunk in self.stream()])
+        return self._body
+
+    async def json(self) -> Any:
+        """The decoded JSON body, None if it is empty or malformed."""
+        try:
+            return json.loads(await self.body() or b'null')
+        except ValueError:
+            return None
+
+    def int_arg(self, name: str, default: int) -> int:
+        """Like Flask's ``request.args.get(name, default, type=int)``."""
+        try:
+            return int(self.args[name])
+        except (KeyError, ValueError):
+            return default
+
+
+class Response:
+    """A complete response, or a streamed one when `body` is an async iterator of strings or bytes."""
+
+    def __init__(self, body: Any = b'', status: int = 200, content_type: str = 'application/json',
+                 headers: Optional[Dict[str, str]] = None):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.status = status
+        self.headers = {'Content-Type': content_type} if content_type else {}
+        self.headers.update(headers or {})
+
+    async def send(self, send, receive=None) -> None:
+        """Send the response. A streamed body is cancelled as soon as `receive` reports a disconnect."""
+        streamed = not isinstance(self.body, bytes)
+        headers = dict(self.headers)
+        if not streamed:
+            headers['Content-Length'] = str(len(self.body))
+        await send({
+            'type': 'http.response.start',
+            'status': self.status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+        })
+        if not streamed:
+            await send({'type': 'http.response.body', 'body': self.body})
+            return
+        if receive is None:
+            await self._stream(send)
+            return
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        streaming = asyncio.ensure_future(self._stream(send))
+        watcher = asyncio.ensure_future(disconnected())
+        await asyncio.wait({streaming, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        for task in (streaming, watcher):
+            task.cancel()
+        await asyncio.gather(streaming, watcher, return_exceptions=True)
+
+    async def _stream(self, send) -> None:
+        async for chunk in self.body:
+            await send({'type': 'http.response.body', 'body': _bytes(chunk), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+class AsyncAPI:
+    """ASGI application serving the same routes as the `controls` blueprint."""
+
+    def __init__(self, flask_app, logic: AsyncMainLogic):
+        self.config = flask_app.config
+        self.logger = flask_app.logger
+        self.json = flask_app.json
+        self.metrics = flask_app.extensions['metrics']
+        self.database = flask_app.extensions['database']
+        self.response_cache = flask_app.extensions['response_cache']
+        self.event_hub = flask_app.extensions['event_hub']
+        self.maintenance_worker = flask_app.extensions['maintenance_worker']
+        self.log_pipeline = flask_app.extensions['log_pipeline']
+        self.logic = logic
+        self.routes: Dict[Tuple[str, str], Callable[[Request], Awaitable[Response]]] = {
+            ('POST', '/api/add'): self.add_task,
+            ('POST', '/api/archive'): self.archive,
+            ('POST', '/api/unArchive'): self.unArchive,
+            ('POST', '/api/perm_delete'): self.delete_from_archive,
+            ('POST', '/api/batch'): self.batch,
+            ('GET', '/api/tasks'): self.get_tasks,
+            ('GET', '/api/archives'): self.get_archives,
+            ('GET', '/api/search'): self.search,
+            ('GET', '/api/events'): self.events,
+            ('GET', '/api/export'): self.export_data,
+            ('POST', '/api/import'): self.import_data,
+            ('GET', '/api/metrics'): self.get_metrics,
+            ('GET', '/api/stats'): self.stats,
+            ('GET', '/api/cache_stats'): self.cache_stats,
+            ('POST', '/api/sync'): self.sync_data,
+        }
+        self.paths = {path for _, path in self.routes}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        request = Request(scope, receive)
+        started = time.perf_counter()
+        start_request()
+        response = self._compress(request, await self._dispatch(request))
+        if 'origin' in request.headers:
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            response.headers['Access-Control-Expose-Headers'] = 'ETag'
+        await response.send(send, receive)
+        self._record(request, response, time.perf_counter() - started)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.to_thread(self.maintenance_worker.stop)
+                if self.logic.read_model is not None:
+                    await asyncio.to_thread(self.logic.read_model.stop)
+                await self.logic.engine.dispose()
+                self.database.dispose()
+                await asyncio.to_thread(self.log_pipeline.stop)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if request.method == 'OPTIONS' and request.path in self.paths:
+                return self._preflight(request)
+            if request.path in self.paths:
+                return self.error('Method Not Allowed', 405)
+            return self.error('Not Found', 404)
+        try:
+            return await handler(request)
+        except Exception:
+            self.logger.exception("Unhandled error in %s %s", request.method, request.path)
+            return self.error('Internal server error', 500)
+
+    def _compress(self, request: Request, response: Response) -> Response:
+        """Compress `response` as the blueprint's `init_compression` hook does."""
+        if not self.config.get('COMPRESS_ENABLED', True):
+            return response
+        mimetype = response.headers.get('Content-Type', '').split(';')[0].strip()
+        if not should_compress(mimetype, response.status, response.headers):
+            return response
+        vary = response.headers.get('Vary')
+        response.headers['Vary'] = f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'
+        coding = choose_coding(request.headers.get('accept-encoding'))
+        if coding is None:
+            return response
+        level = self.config.get('COMPRESS_LEVEL', 6)
+        brotli_quality = self.config.get('COMPRESS_BROTLI_QUALITY', 4)
+        if isinstance(response.body, bytes):
+            if len(response.body) < self.config.get('COMPRESS_MIN_SIZE', 1024):
+                return response
+            response.body = compress(response.body, coding, level, brotli_quality)
+        else:
+            response.body = _compress_stream(response.body, StreamCompressor(coding, level, brotli_quality))
+        response.headers['Content-Encoding'] = coding
+        if 'ETag' in response.headers:
+            response.headers['ETag'] = quote_etag(coded_etag(unquote_etag(response.headers['ETag'])[0], coding))
+        return response
+
+    def _preflight(self, request: Request) -> Response:
+        methods = sorted({method for method, path in self.routes if path == request.path} | {'OPTIONS'})
+        return Response(status=200, content_type=None, headers={
+            'Access-Control-Allow-Methods': ', '.join(methods),
+            'Access-Control-Allow-Headers': request.headers.get('access-control-request-headers', ''),
+        })
+
+    def _record(self, request: Request, response: Response, seconds: float) -> None:
+        stats = finish_request()
+        if not self.config.get('METRICS_ENABLED', True):
+            return
+        slow_ms = self.config.get('SLOW_REQUEST_MS')
+        slow = slow_ms is not None and seconds * 1000 >= slow_ms
+        endpoint = request.path if request.path in self.paths else 'unmatched'
+        self.metrics.record(endpoint, request.method, response.status, seconds,
+                            stats['queries'], stats['db_seconds'], stats['commits'], slow)
+        if slow:
+            self.logger.warning(
+                "Slow request %s %s -> %s: %.1f ms, %d queries, %.1f ms in DB", request.method, request.path,
+                response.status, seconds * 1000, stats['queries'], stats['db_seconds'] * 1000,
+            )
+
+    def jsonify(self, payload: Any, status: int = 200) -> Response:
+        return Response(self.json.dumps(payload) + '\n', status)
+
+    def error(self, message: str, status: int) -> Response:
+        return self.jsonify({'error': message}, status)
+
+    async def conditional(self, request: Request, tables: Tuple[str, ...],
+                          view: Callable[[], Awaitable[Response]], vary_on_body: bool = False) -> Response:
+        """Async counterpart of the blueprint's `conditional` decorator.
+
+        Leaves the versions in `request.versions` and the negotiated format in `request.format`.
+        """
+        fmt = request.format = negotiate(request.headers.get('accept'))
+        versions = request.versions = await self.logic.get_versions(*tables)
+        if versions is None:
+            return await view()
+        etag = make_etag(tables, versions, await request.body() if vary_on_body else None, fmt)
+        matched = matching_etag(parse_etags(request.headers.get('if-none-match')), etag)
+        if matched:
+            response = Response(status=304, content_type=None)
+            etag = matched
+        else:
+            response = await view()
+            if response.status != 200:
+                return response
+        response.headers['ETag'] = quote_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept'
+        return response
+
+    async def add_task(self, request: Request) -> Response:
+        """Add a new task to TODO List."""
+        data = await request.json()
+        if not data or 'task_description' not in data:
+            return self.error('task description is required', 400)
+        task = data['task_description']
+        if not isinstance(task, str):
+            return self.error('task description must be a string', 400)
+        new_task = await self.logic.add_todo(task)
+        if new_task is None:
+            return self.error('Failed to add task', 500)
+        return self.jsonify({'message': 'Task added successfully', 'id': new_task.id, 'task': task}, 201)
+
+    async def archive(self, request: Request) -> Response:
+        """Archive a task."""
+        data = await request.json()
+        if not data or 'task_id' not in data:
+            return self.error('task_id is required', 400)
+        archived_id = await self.logic.archive(data['task_id'])
+        if archived_id is None:
+            return self.error('Failed to archive task or task not found', 404)
+        return self.jsonify({'message': 'Task archived successfully', 'archived_task_id': archived_id})
+
+    async def unArchive(self, request: Request) -> Response:
+        """UnArchive a task"""
+        data = await request.json()
+        if not data or 'archive_id' not in data:
+            return self.error('archive_id is required', 400)
+        task_id = await self.logic.unArchive(data['archive_id'])
+        if task_id is None:
+            return self.error('Failed to unArchived task or task not found', 404)
+        return self.jsonify({'message': 'Task unArchived succesfully', 'task_id': task_id})
+
+    async def delete_from_archive(self, request: Request) -> Response:
+        """Permenanatly delete a task from archive."""
+        data = await request.json()
+        if not data or 'archive_id' not in data:
+            return self.error('archive_id is required', 400)
+        if not await self.logic.perm_delete(data['archive_id']):
+            return self.error('Failed to delete archive or archive not found', 404)
+        return self.jsonify({'message': 'Archive permanently deleted successfully'})
+
+    async def batch(self, request: Request) -> Response:
+        """Add, archive, unArchive and permanently delete many items in one transaction."""
+        items, error, status = validate_batch(await request.json(), self.config.get('BATCH_MAX_ITEMS', 10000))
+        if error:
+            return self.error(error, status)
+        results = await self.logic.apply_batch(
+            add=items['add'],
+            archive=items['archive'],
+            unarchive=items['unArchive'],
+            perm_delete=items['perm_delete'],
+        )
+        if results is None:
+            return self.error('Failed to apply batch', 500)
+        return self.jsonify(batch_response(items, results))
+
+    async def get_tasks(self, request: Request) -> Response:
+        """Get tasks. Accepts `page` or the keyset parameters, and `total`, like the blueprint."""
+        return await self._list(request, 'Tasks', 'tasks', 'TODO', self.logic.get_task_rows)
+
+    async def get_archives(self, request: Request) -> Response:
+        """Get Archives."""
+        async def fetch(version=None, **bounds):
+            return await self.logic.get_archive_rows(**bounds)
+
+        return await self._list(request, 'Archived', 'archives', 'Finished', fetch)
+
+    async def _list(self, request: Request, table: str, name: str, column: str, fetch) -> Response:
+        async def view():
+            page = request.int_arg('page', 1)
+            with_total = wants_total(request.args)
+            try:
+                before_id, after_id = _keyset_bounds(request.args)
+            except ValueError as e:
+                return self.error(str(e), 400)
+
+            async def build():
+                per_page = self.config.get('TASKS_PER_PAGE', 10)
+                bounds = dict(page=page, before_id=before_id, after_id=after_id)
+                if not with_total:
+                    # At the version the ETag was built from, the read model can answer
+                    rows = await fetch(**bounds, version=request.versions and request.versions[table])
+                    return list_body(name, column, rows, per_page, before_id, after_id, request.format)
+                async with self.logic.read_snapshot():
+                    counts = await self.logic.get_counts(table)
+                    model_version = await self.logic.read_model_version() if table == 'Tasks' else None
+                    rows = await fetch(**bounds, version=model_version)
+                return list_body(name, column, rows, per_page, before_id, after_id, request.format,
+                                 page_totals(counts and counts[table], per_page))
+
+            version = request.versions and request.versions.get(table)
+            key = (name, page, before_id, after_id, with_total, request.format)
+            body = await self.response_cache.get_or_build_async(table, version, key, build)
+            return Response(body, content_type=request.format)
+
+        return await self.conditional(request, (table,), view)
+
+    async def search(self, request: Request) -> Response:
+        """Full-text search over task and/or archive descriptions. See the blueprint for the cursor caveat."""
+        match, plan, error = search_plan(request.args)
+        if error:
+            return self.error(error, 400)
+        per_page = self.config.get('TASKS_PER_PAGE', 10)
+        response = {}
+        for name, model, column, after in plan:
+            hits = await self.logic.search(model, match, after)
+            if hits is None:
+                return self.error('Search is not available', 503)
+            response[name] = search_page(hits, column, per_page)
+        return self.jsonify(response)
+
+    async def events(self, request: Request) -> Response:
+        """Stream change events as Server-Sent Events. An idle stream is one parked coroutine."""
+        try:
+            last_rev = last_event_id(request.args, {'Last-Event-ID': request.headers.get('last-event-id')})
+        except ValueError:
+            return self.error('invalid Last-Event-ID', 400)
+        subscription = self.event_hub.subscribe(asynchronous=True)
+        if subscription is None:
+            return self.error('Too many event streams', 503)
+        heartbeat = self.config.get('SSE_HEARTBEAT_SECONDS', 15)
+        max_replay = self.config.get('CHANGELOG_MAX_DELTA', 5000)
+
+        async def generate():
+            try:
+                yield f"retry: {self.config.get('SSE_RETRY_MS', 3000)}\n\n"
+                stream = EventStream(subscription, last_rev or 0, replay=last_rev is not None)
+                if last_rev is None:
+                    stream.sent = await self.logic.get_head_rev()
+                    yield format_event(stream.sent, {'rev': stream.sent}, 'ready')
+                while True:
+                    if stream.needs_replay:
+                        replay = await self.logic.get_events(stream.sent, max_replay + 1)
+                        if replay is not None and len(replay) > max_replay:
+                            replay = None
+                        head_rev = await self.logic.get_head_rev() if replay is None else None
+                        yield ''.join(stream.replayed(replay, head_rev))
+                    messages = stream.live()
+                    if messages:
+                        yield ''.join(messages)
+                    elif not stream.needs_replay and not await subscription.wait_async(heartbeat):
+                        yield HEARTBEAT
+            finally:
+                self.event_hub.unsubscribe(subscription)
+
+        return Response(generate(), content_type='text/event-stream', headers={
+            'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no',
+        })
+
+    async def export_data(self, request: Request) -> Response:
+        """Stream every task and archive as NDJSON, one object per line."""
+        async def generate():
+            lines: List[str] = []
+            async for row in self.logic.export_rows():
+                lines.append(ndjson_line(*row))
+                if len(lines) >= 1000:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+            if lines:
+                yield '\n'.join(lines) + '\n'
+
+        return Response(generate(), content_type='application/x-ndjson', headers={
+            'Content-Disposition': 'attachment; filename=todo-export.ndjson',
+        })
+
+    async def import_data(self, request: Request) -> Response:
+        """Import NDJSON produced by `/export`, parsed as the body arrives."""
+        keep_ids = request.int_arg('keep_ids', 0) == 1
+
+        async def records():
+            number = 0
+            pending = b''
+            async for chunk in request.stream():
+                *lines, pending = (pending + chunk).split(b'\n')
+                for line in lines:
+                    number += 1
+                    if line.strip():
+                        yield _parse_line(line, number)
+            if pending.strip():
+                yield _parse_line(pending, number + 1)
+
+        counts = await self.logic.import_rows(records(), keep_ids=keep_ids)
+        if counts['error']:
+            status = 500 if counts['failed'] else 400
+            return self.jsonify({'error': counts['error'], 'tasks': counts['tasks'], 'archives': counts['archives']}, status)
+        return self.jsonify({'message': 'Import finished', 'tasks': counts['tasks'], 'archives': counts['archives']})
+
+    async def get_metrics(self, request: Request) -> Response:
+        """Request, query and cache metrics in Prometheus text format."""
+        body = self.metrics.render(dict(cache_metrics(self.response_cache), **self.event_hub.metrics(),
+                                        **self.maintenance_worker.metrics(), **self.log_pipeline.metrics(),
+                                        **read_model_metrics(self.logic.read_model)))
+        return Response(body, content_type='text/plain; version=0.0.4')
+
+    async def stats(self, request: Request) -> Response:
+        """Number of tasks and archives, from the row counters."""
+        async def view():
+            counts = await self.logic.get_counts('Tasks', 'Archived')
+            if counts is None:
+                return self.error('Failed to read counters', 500)
+            body = {'tasks': counts['Tasks'], 'archives': counts['Archived']}
+            return Response(encode(body, request.format), content_type=request.format)
+
+        return await self.conditional(request, ('Tasks', 'Archived'), view)
+
+    async def cache_stats(self, request: Request) -> Response:
+        """Hit/miss/eviction counters of the list response cache."""
+        return self.jsonify(self.response_cache.stats())
+
+    async def sync_data(self, request: Request) -> Response:
+        """Sync data from the server based on request params. Same body and response as the blueprint."""
+        async def view():
+            data = await request.json()
+            if not isinstance(data, dict):
+                return self.error('Bad Request', 400)
+            response: Dict[str, Any] = {}
+            try:
+                tasks_bounds = _keyset_bounds(data, 'tasks_')
+                archives_bounds = _keyset_bounds(data, 'archives_')
+            except ValueError as e:
+                return self.error(str(e), 400)
+            try:
+                tasks_page, archives_page = _sync_pages(data)
+            except ValueError as e:
+                return self.error(str(e), 400)
+
+            ids, error, status = sync_ids(data, self.config.get('BATCH_MAX_ITEMS', 10000))
+            if error:
+                return self.error(error, status)
+            since_rev = None
+            if data.get('since_rev') is not None:
+                try:
+                    since_rev = int(data['since_rev'])
+                except (TypeError, ValueError):
+                    return self.error('since_rev must be an integer', 400)
+
+            async with self.logic.read_snapshot():
+                error = await self._sync_reads(request, data, response, since_rev, ids,
+                                               (tasks_page,) + tasks_bounds, (archives_page,) + archives_bounds)
+            if error:
+                return self.error(error, 500)
+            return Response(encode(response, request.format), content_type=request.format)
+
+        return await self.conditional(request, ('Tasks', 'Archived'), view, vary_on_body=True)
+
+    async def _sync_reads(self, request: Request, data: Dict[str, Any], response: Dict[str, Any],
+                          since_rev: Optional[int], ids: Dict[str, List[int]],
+                          tasks_query: Tuple[int, Optional[int], Optional[int]],
+                          archives_query: Tuple[int, Optional[int], Optional[int]]) -> Optional[str]:
+        """Fill `response` with what a `/sync` body asks for. See the blueprint's `_sync_reads`."""
+        per_page = self.config.get('TASKS_PER_PAGE', 10)
+        if since_rev is not None:
+            changes = await self.logic.get_changes(since_rev)
+            if changes is None:
+                return 'Failed to read changes'
+            response['rev'] = changes['rev']
+            response['reset'] = changes['reset']
+            if not changes['reset']:
+                response['changes'] = delta_response(changes)
+        else:
+            # Read before any list so a client resuming from it never misses a change
+            response['rev'] = await self.logic.get_head_rev()
+        tasks_version = await self.logic.read_model_version()
+
+        if data.get('fetch_task_id'):
+            task = await self.logic.get_task_by_id(data['fetch_task_id'], tasks_version)
+            if task:
+                response['task'] = {'id': task.id, 'TODO': task.TODO}
+        if data.get('fetch_archive_id'):
+            archive = await self.logic.get_archive_by_id(data['fetch_archive_id'])
+            if archive:
+                response['archive'] = {'id': archive.id, 'Finished': archive.Finished}
+        for name, (model, column) in FETCH_BY_ID.items():
+            if ids[name]:
+                fetched = await self.logic.get_rows_by_id(model, ids[name], tasks_version)
+                if fetched is None:
+                    return f'Failed to fetch {name}s by id'
+                rows, missing = fetched
+                response[f'{name}s_by_id'] = rows_payload(rows, column, request.format)
+                response[f'missing_{name}_ids'] = missing
+        if data.get('fetch_tasks'):
+            page, before_id, after_id = tasks_query
+            rows = await self.logic.get_task_rows(page=page, before_id=before_id, after_id=after_id,
+                                                  version=tasks_version)
+            response['tasks'] = rows_payload(rows, 'TODO', request.format)
+            response['tasks_next_cursor'] = next_cursor([row[0] for row in rows], per_page, after_id)
+        if data.get('fetch_archives'):
+            page, before_id, after_id = archives_query
+            rows = await self.logic.get_archive_rows(page=page, before_id=before_id, after_id=after_id)
+            response['archives'] = rows_payload(rows, 'Finished', request.format)
+            response['archives_next_cursor'] = next_cursor([row[0] for row in rows], per_page, after_id)
+        if data.get('fetch_totals'):
+            counts = await self.logic.get_counts('Tasks', 'Archived')
+            if counts is None:
+                return 'Failed to read counters'
+            response['tasks_total'] = counts['Tasks']
+            response['archives_total'] = counts['Archived']
+        return None
+
+
+def _bytes(chunk: Any) -> bytes:
+    return chunk if isinstance(chunk, bytes) else chunk.encode()
+
+
+async def _compress_stream(chunks: AsyncIterator[Any], compressor: StreamCompressor) -> AsyncIterator[bytes]:
+    """Async counterpart of `compression.compress_stream`."""
+    async for chunk in chunks:
+        data = _bytes(chunk)
+        if data:
+            yield compressor.chunk(data)
+    yield compressor.finish()
+
+
+def _parse_line(line: bytes, number: int) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError:
+        raise ValueError(f"line {number} is not valid JSON") from None
+
+
+def create_asgi_app(config_object=None) -> AsyncAPI:
+    """Create the ASGI app. Runs the same setup as `create_app`, then swaps in the async data layer."""
+    config_object = config_object or Config
+    flask_app = create_app(config_object)
+    # Create or migrate the schema with the sync engine before the async one uses it
+    flask_app.extensions['database'].engine
+    # Writes on the event loop are committed by AsyncMainLogic; the group-commit writer is for threads
+    flask_app.extensions['write_queue'].stop()
+    engine = build_async_engine(config_object)
+    if flask_app.config.get('METRICS_ENABLED', True):
+        instrument_engine(engine.sync_engine)
+    flask_app.logger.info('ASGI app initialized.')
+    return AsyncAPI(flask_app, AsyncMainLogic(engine, flask_app.config, flask_app.logger,
+                                              flask_app.extensions.get('read_model'),
+                                              flask_app.extensions['event_hub']))
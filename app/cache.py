@@ -0,0 +1,128 @@
+"""
+Response cache for the list endpoints.
+
+Serialized pages are stored under a key that includes the version of the
+table they were read from: the `Counters` row that every committed mutation
+bumps in the same transaction, and that the ETag of the response is built
+from. A change made by any process, including `manage.py import`, moves the
+version on, so pages built before it are never looked up again and simply
+age out of the LRU. Every app has its own, in
+``app.extensions['response_cache']``.
+
+The storage is pluggable: `LocalLRUBackend` keeps everything in this process.
+A backend shared between workers (e.g. Redis) only has to implement
+`CacheBackend`.
+"""
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class CacheBackend(ABC):
+    """Storage interface used by `ResponseCache`."""
+
+    @abstractmethod
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for `key`, or None."""
+
+    @abstractmethod
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store `value` under `key`."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Drop all entries."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and the current size."""
+
+
+class LocalLRUBackend(CacheBackend):
+    """In-process, thread-safe LRU bounded to `max_entries` values."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self.max_entries,
+            }
+
+
+class ResponseCache:
+    """Versioned cache of serialized responses, keyed per table."""
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.backend = backend or LocalLRUBackend()
+        self.enabled = True
+
+    def configure(self, app) -> None:
+        """Apply `RESPONSE_CACHE_*` settings from the app config and start empty."""
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        backend = app.config.get('RESPONSE_CACHE_BACKEND')
+        self.backend = backend() if backend else LocalLRUBackend(app.config.get('RESPONSE_CACHE_SIZE', 512))
+
+    def get_or_build(self, table: str, version: Optional[int], key: Hashable, build: Callable[[], Any]) -> Any:
+        """Return the cached value for `key` at `version` of `table`, building it on a miss.
+
+        `version` is the table's change counter, read before `build` runs; with
+        None (the counters could not be read) the value is built uncached.
+        """
+        if not self.enabled or version is None:
+            return build()
+        versioned_key = (table, version, key)
+        value = self.backend.get(versioned_key)
+        if value is None:
+            value = build()
+            self.backend.set(versioned_key, value)
+        return value
+
+    async def get_or_build_async(self, table: str, version: Optional[int], key: Hashable,
+                                 build: Callable[[], Awaitable[Any]]) -> Any:
+        """`get_or_build` for a coroutine `build`, as used by the ASGI app."""
+        if not self.enabled or version is None:
+            return await build()
+        versioned_key = (table, version, key)
+        value = self.backend.get(versioned_key)
+        if value is None:
+            value = await build()
+            self.backend.set(versioned_key, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.backend.stats(), enabled=self.enabled)
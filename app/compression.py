@@ -0,0 +1,144 @@
+"""
+Negotiated response compression.
+
+Responses are compressed with brotli when it is installed and the client
+accepts ``br``, otherwise with gzip, following the qualities of its
+``Accept-Encoding``. Complete bodies smaller than `COMPRESS_MIN_SIZE` are
+sent as they are; streamed bodies (`/export`) are compressed chunk by chunk
+and flushed after every chunk, so the client still receives data as it is
+produced. Server-Sent Events are never compressed: proxies and browsers
+would hold events back in their buffers.
+
+A compressed response gets its own strong ETag, the plain one with
+``-gzip`` or ``-br`` appended; `etag_variants` lets conditional requests
+match either form.
+"""
+import gzip
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from flask import request
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+CODINGS = ('br', 'gzip')
+
+COMPRESSIBLE = frozenset((
+    'application/json',
+    'application/vnd.todo.columnar+json',
+    'application/msgpack',
+    'application/x-ndjson',
+    'text/plain',
+    'text/html',
+))
+
+
+def available_codings():
+    """Content codings this server can produce, preferred first."""
+    return [coding for coding in CODINGS if coding != 'br' or brotli is not None]
+
+
+def choose_coding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The coding to use for an ``Accept-Encoding`` header, or None to send the body as it is."""
+    accept = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0
+    for coding in available_codings():
+        quality = accept.quality(coding)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body: bytes, coding: str, level: int = 6, brotli_quality: int = 4) -> bytes:
+    """`body` compressed with `coding`."""
+    if coding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class StreamCompressor:
+    """Compresses a body chunk by chunk, flushing each so it can be sent right away."""
+
+    def __init__(self, coding: str, level: int = 6, brotli_quality: int = 4):
+        self.coding = coding
+        if coding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.coding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.coding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def compress_stream(chunks: Iterable[bytes], compressor: StreamCompressor) -> Iterator[bytes]:
+    """Yield `chunks` compressed."""
+    for data in chunks:
+        if data:
+            yield compressor.chunk(data)
+    yield compressor.finish()
+
+
+def coded_etag(etag: str, coding: str) -> str:
+    return f'{etag}-{coding}'
+
+
+def etag_variants(etag: str) -> Iterator[str]:
+    """`etag` and the ETags of its compressed representations."""
+    yield etag
+    for coding in CODINGS:
+        yield coded_etag(etag, coding)
+
+
+def should_compress(mimetype: str, status: int, headers) -> bool:
+    """Whether a response of this type and status may be compressed at all."""
+    return (
+        mimetype in COMPRESSIBLE
+        and 200 <= status < 300 and status != 204
+        and 'Content-Encoding' not in headers
+    )
+
+
+def init_compression(app) -> None:
+    """Compress the responses of `app` according to its `COMPRESS_*` settings."""
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    level = app.config.get('COMPRESS_LEVEL', 6)
+    brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', 4)
+
+    @app.after_request
+    def compress_response(response):
+        if not should_compress(response.mimetype, response.status_code, response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        coding = choose_coding(request.headers.get('Accept-Encoding'))
+        if coding is None:
+            return response
+        if response.is_streamed:
+            source = response.response
+            response.response = compress_stream(response.iter_encoded(), StreamCompressor(coding, level, brotli_quality))
+            if hasattr(source, 'close'):
+                # Closing the response must still end the original generator and its context
+                response.call_on_close(source.close)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < min_size:
+                return response
+            response.set_data(compress(body, coding, level, brotli_quality))
+        response.headers['Content-Encoding'] = coding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(coded_etag(etag, coding), weak)
+        return response
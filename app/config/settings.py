@@ -9,4 +9,99 @@ class Config:
         'sqlite:///' + os.path.join(base_dir, 'MyTODO.db')
     
     TASKS_PER_PAGE = 25
+    BATCH_MAX_ITEMS = 10000
+
+    # NDJSON export/import
+    EXPORT_YIELD_PER = 1000             # rows fetched from the database at a time
+    IMPORT_BATCH_SIZE = 5000            # rows per import transaction
+
+    # Schema migrations (app/models/migrations.py)
+    MIGRATE_ON_STARTUP = os.environ.get('MIGRATE_ON_STARTUP', '1').lower() in ('1', 'true', 'yes')
+    MIGRATION_BATCH_SIZE = 10000        # rows backfilled per transaction
+    MIGRATION_BATCH_PAUSE_MS = 5        # pause between backfill transactions
+
+    # Change log behind delta sync (`since_rev` in /api/sync)
+    CHANGELOG_RETENTION = 10000         # newest entries kept when compacting
+    CHANGELOG_COMPACT_INTERVAL = 1000   # compact every this many revisions
+    CHANGELOG_MAX_DELTA = 5000          # beyond this many changes clients are told to refetch
+
+    # Server-Sent Events at /api/events
+    SSE_HEARTBEAT_SECONDS = 15          # keep-alive comment sent on idle streams
+    SSE_RETRY_MS = 3000                 # reconnect delay suggested to EventSource clients
+    SSE_QUEUE_SIZE = 256                # events buffered per subscriber before it falls back to the change log
+    SSE_MAX_SUBSCRIBERS = 10000         # streams beyond this are answered with 503
+
+    # Group commit of /api/add and /api/archive by one writer thread (threaded server only)
+    WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    WRITE_QUEUE_MAX_BATCH = 256         # writes committed together at most
+    WRITE_QUEUE_MAX_DELAY_MS = 2        # longest a write waits for others to join its batch
+    WRITE_QUEUE_SIZE = 10000            # queued writes before callers wait for room
+
+    # Named lists at /api/lists/<key>/..., one SQLite file each in LISTS_DIR
+    LISTS_DIR = os.environ.get('LISTS_DIR') or os.path.join(base_dir, 'lists')
+    LISTS_MAX_OPEN = 64                 # open list engines; least recently used idle ones are closed beyond this
+    LISTS_IDLE_SECONDS = 300            # unused list engines are closed after this long
+    LISTS_POOL_SIZE = 2                 # connections kept per open list
+    LISTS_MAX_OVERFLOW = 8
+    LISTS_SQLITE_CACHE_SIZE = -2000     # ~2 MB page cache per list connection
+
+    # Archive retention and compaction by a background worker (app.maintenance)
+    MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get('MAINTENANCE_INTERVAL_SECONDS', 0))  # 0 disables the worker
+    RETENTION_MAX_AGE_DAYS = float(os.environ['RETENTION_MAX_AGE_DAYS']) if os.environ.get('RETENTION_MAX_AGE_DAYS') else None
+    RETENTION_MAX_ARCHIVES = int(os.environ['RETENTION_MAX_ARCHIVES']) if os.environ.get('RETENTION_MAX_ARCHIVES') else None
+    RETENTION_BATCH_SIZE = 500          # archives deleted per transaction
+    RETENTION_BATCH_PAUSE_MS = 20       # pause between batches so requests get the write lock
+    VACUUM_PAGES_PER_STEP = 1000        # pages freed per incremental vacuum step
+
+    # Log file, written by a listener thread fed through a bounded queue (app/log.py)
+    LOG_FILE = os.environ.get('LOG_FILE') or os.path.join(base_dir, '..', 'logs', 'app.log')
+    LOG_MAX_BYTES = 100000              # the file is rotated beyond this size
+    LOG_BACKUP_COUNT = 3
+    LOG_QUEUE_ENABLED = os.environ.get('LOG_QUEUE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    LOG_QUEUE_SIZE = 10000              # queued records; more are dropped and counted
+    LOG_INFO_SAMPLE_EVERY = 1           # keep one in N INFO records per message; 1 keeps all
+
+    # Request/query metrics served at /api/metrics
+    METRICS_ENABLED = True
+    SLOW_REQUEST_MS = float(os.environ['SLOW_REQUEST_MS']) if os.environ.get('SLOW_REQUEST_MS') else None
+
+    # In-process cache of serialized /tasks and /archives pages
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_SIZE = 512           # pages kept before least recently used ones are evicted
+    RESPONSE_CACHE_BACKEND = None       # CacheBackend subclass to use instead of the local LRU
+
+    # In-memory copy of the Tasks table serving task pages and lookups (app/models/read_model.py)
+    READ_MODEL_ENABLED = os.environ.get('READ_MODEL_ENABLED', '').lower() in ('1', 'true', 'yes')
+    READ_MODEL_MAX_BYTES = 64 * 1024 * 1024     # beyond this estimate the model is dropped and SQL serves
+    READ_MODEL_CHECK_INTERVAL_SECONDS = 60.0    # how often it is compared with the database
+
+    # Concurrency limits and wait queues for read and write endpoints (app/admission.py)
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '').lower() in ('1', 'true', 'yes')
+    ADMISSION_READ_LIMIT = 16           # /tasks, /archives and /sync requests running at once
+    ADMISSION_READ_QUEUE = 64           # more of them waiting for a slot; beyond this they get 503
+    ADMISSION_READ_TIMEOUT_MS = 1000    # longest wait for a slot before a 503
+    ADMISSION_WRITE_LIMIT = 4           # /add, /archive, /unArchive, /perm_delete and /batch
+    ADMISSION_WRITE_QUEUE = 16
+    ADMISSION_WRITE_TIMEOUT_MS = 500
+    ADMISSION_RETRY_AFTER_SECONDS = 1   # Retry-After sent with the 503
+
+    # gzip (or brotli, when installed) for clients that send Accept-Encoding
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 1024            # bytes; smaller complete bodies are sent uncompressed
+    COMPRESS_LEVEL = 6                  # gzip level, 1-9
+    COMPRESS_BROTLI_QUALITY = 4         # brotli quality, 0-11
     PORT = int(os.environ.get('FLASK_RUN_PORT', 5000))
+
+    # SQLite tuning, applied to every new connection
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = 5000
+    SQLITE_CACHE_SIZE = -20000          # negative means KiB, so ~20 MB per connection
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLITE_TEMP_STORE = 'MEMORY'
+    SQLITE_AUTO_VACUUM = 'INCREMENTAL'  # lets maintenance return freed pages to the file system
+
+    # Connection pool (file databases only)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_RECYCLE = 3600
@@ -1,12 +1,279 @@
 """
 API endpoints.
 """
-from flask import Blueprint, request, jsonify
-from .models import MainLogic
+import hashlib
+import io
+import json
+from functools import wraps
+from flask import Blueprint, abort, current_app, g, make_response, request, jsonify, stream_with_context
+from .models import MainLogic, Tasks, Archived, close_db_session
+from .models.control import fts_query
+from .models.database import current_list, current_list_key
+from .models.lists import enter_list, exit_list
+from .models.pagination import decode_cursor, decode_search_cursor, encode_search_cursor, next_cursor
+from .models.read_model import read_model_metrics
+from .admission import admission_metrics
+from .compression import etag_variants
+from .encoding import FORMAT_TAGS, JSON, encode, negotiate, rows_payload
+from .events import HEARTBEAT, EventStream, format_event
 
 api = Blueprint("controls", __name__)
 controller = MainLogic()
 
+def make_etag(tables, versions, body=None, fmt=JSON):
+    """ETag for data read from `tables` at `versions`, optionally varying on a request body and format."""
+    etag = '.'.join(f"{table[0].lower()}{versions[table]}" for table in tables)
+    if body is not None:
+        etag += '.' + hashlib.blake2b(body, digest_size=8).hexdigest()
+    if FORMAT_TAGS[fmt]:
+        etag += '.' + FORMAT_TAGS[fmt]
+    return etag
+
+def matching_etag(if_none_match, etag):
+    """The form of `etag` (plain or compressed) that `if_none_match` holds, or None."""
+    return next((tag for tag in etag_variants(etag) if if_none_match.contains(tag)), None)
+
+def conditional(*tables, vary_on_body=False):
+    """Serve a view with a strong ETag built from the change counters of `tables`.
+
+    A matching `If-None-Match` is answered with `304 Not Modified` before the
+    view runs. The counters are read before the view builds its payload, so
+    an ETag can only ever be older than the data it is sent with. They are
+    left in `g.versions` for `cached_body`, and the format negotiated from
+    `Accept` in `g.format`.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            fmt = g.format = negotiate(request.headers.get('Accept'))
+            versions = g.versions = controller.get_versions(*tables)
+            if versions is None:
+                return view(*args, **kwargs)
+            etag = make_etag(tables, versions, request.get_data() if vary_on_body else None, fmt)
+            matched = matching_etag(request.if_none_match, etag)
+            if matched:
+                response = current_app.response_class(status=304)
+                etag = matched
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.vary.add('Accept')
+            return response
+        return wrapper
+    return decorator
+
+def cached_body(table, key, build):
+    """`build()` through the response cache, at the version of `table` that `conditional` read."""
+    versions = g.get('versions')
+    return current_app.extensions['response_cache'].get_or_build(table, versions and versions.get(table), (current_list_key(),) + key, build)
+
+@api.url_value_preprocessor
+def open_list(endpoint, values):
+    """Make the list of an `/api/lists/<list_key>/...` request current for the whole request."""
+    key = values.pop('list_key', None) if values else None
+    if key is None:
+        current_list.set(None)
+        return
+    try:
+        g.list_db = enter_list(key)
+    except ValueError:
+        abort(404)
+
+@api.after_request
+def keep_list_open(response):
+    """Hold the list until the response is closed, which for a stream is after its last chunk."""
+    db = g.pop('list_db', None)
+    if db is not None:
+        response.call_on_close(lambda: exit_list(db))
+    return response
+
+@api.teardown_request
+def close_list(exc=None):
+    """Release the list if the request failed before `keep_list_open` ran."""
+    db = g.pop('list_db', None)
+    if db is not None:
+        exit_list(db)
+
+def list_body(name, column, rows, per_page, before_id, after_id, fmt=JSON, totals=None):
+    """Body of a `/tasks` or `/archives` page of ``(id, text)`` rows, encoded in `fmt`.
+
+    Plain `page` requests get the bare rows, keyset requests an object with
+    the rows under `name` and a `next_cursor`. `totals` (see `page_totals`)
+    are added to that object, and make plain requests get one too.
+    """
+    result = rows_payload(rows, column, fmt)
+    if before_id is None and after_id is None and totals is None:
+        return encode(result, fmt)
+    body = {name: result}
+    if before_id is not None or after_id is not None:
+        body['next_cursor'] = next_cursor([row[0] for row in rows], per_page, after_id)
+    body.update(totals or {})
+    return encode(body, fmt)
+
+def page_totals(count, per_page):
+    """`total` rows and `pages` of `per_page` for a list response; both None if the count failed."""
+    if count is None:
+        return {'total': None, 'pages': None}
+    return {'total': count, 'pages': -(-count // per_page)}
+
+def wants_total(params):
+    """Whether a list request asked for its `total` with ``total=1``."""
+    return str(params.get('total', '')).lower() in ('1', 'true', 'yes')
+
+def _keyset_bounds(params, prefix=''):
+    """Read `cursor` or `before_id`/`after_id` (with optional key prefix) from `params`.
+
+    Returns ``(before_id, after_id)``; both are None for page-based requests.
+    A `cursor` takes precedence over the ids. Raises ValueError on a malformed
+    cursor or id, and when both ids are given.
+    """
+    cursor = params.get(prefix + 'cursor')
+    if cursor:
+        return decode_cursor(str(cursor))
+    before_id, after_id = _optional_int(params, prefix + 'before_id'), _optional_int(params, prefix + 'after_id')
+    if before_id is not None and after_id is not None:
+        raise ValueError(f'{prefix}before_id and {prefix}after_id cannot be combined')
+    return before_id, after_id
+
+def _optional_int(params, key, default=None):
+    """`params[key]` as an int, or `default` when absent. Raises ValueError for anything else, bools included."""
+    value = params.get(key)
+    if value is None:
+        return default
+    if isinstance(value, (bool, float)):
+        raise ValueError(f'{key} must be an integer')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be an integer') from None
+
+def _sync_pages(data):
+    """`tasks_page` and `archives_page` of a `/sync` body. Raises ValueError if either is not an integer."""
+    return _optional_int(data, 'tasks_page', 1), _optional_int(data, 'archives_page', 1)
+
+# Item kinds a `/sync` body can fetch by `fetch_<name>_ids`: model and text column
+FETCH_BY_ID = {'task': (Tasks, 'TODO'), 'archive': (Archived, 'Finished')}
+
+def sync_ids(data, max_items):
+    """``(ids, error, status)`` for the `fetch_task_ids`/`fetch_archive_ids` of a `/sync` body.
+
+    `ids` maps every name in `FETCH_BY_ID` to the requested ids, [] when absent.
+    """
+    ids = {}
+    for name in FETCH_BY_ID:
+        key = f'fetch_{name}_ids'
+        value = data.get(key)
+        if value is None:
+            value = []
+        if not isinstance(value, list) or not all(isinstance(row_id, int) and not isinstance(row_id, bool)
+                                                  for row_id in value):
+            return None, f'{key} must be a list of integers', 400
+        if len(value) > max_items:
+            return None, f'too many ids in {key}', 413
+        ids[name] = value
+    return ids, None, 200
+
+BATCH_SECTIONS = ('add', 'archive', 'unArchive', 'perm_delete')
+
+def validate_batch(data, max_items):
+    """Check a `/batch` body. Returns ``(items, error, status)``; `items` maps every section to a list."""
+    if not isinstance(data, dict) or not any(data.get(key) for key in BATCH_SECTIONS):
+        return None, f"at least one of {', '.join(BATCH_SECTIONS)} is required", 400
+    items = {key: data.get(key) or [] for key in BATCH_SECTIONS}
+    if not all(isinstance(value, list) for value in items.values()):
+        return None, 'batch sections must be lists', 400
+    if not all(isinstance(detail, str) for detail in items['add']):
+        return None, 'add expects task descriptions', 400
+    if not all(isinstance(target_id, int) and not isinstance(target_id, bool)
+               for key in BATCH_SECTIONS[1:] for target_id in items[key]):
+        return None, 'archive, unArchive and perm_delete expect integer ids', 400
+    if sum(len(value) for value in items.values()) > max_items:
+        return None, 'too many items in batch', 413
+    return items, None, 200
+
+def batch_response(items, results):
+    """One result per requested item, in request order, from the output of `apply_batch`.
+
+    `apply_batch` moves or deletes a repeated id once; every repeat reports
+    the outcome of that one operation.
+    """
+    def moved(source_key, target_key, requested, mapping):
+        return [
+            {source_key: old_id, target_key: mapping[old_id]} if mapping[old_id] is not None
+            else {source_key: old_id, 'error': 'not found'}
+            for old_id in requested
+        ]
+
+    return {
+        'add': [
+            {'id': new_id, 'task': detail}
+            for detail, new_id in zip(items['add'], results['add'])
+        ],
+        'archive': moved('task_id', 'archived_task_id', items['archive'], results['archive']),
+        'unArchive': moved('archive_id', 'task_id', items['unArchive'], results['unArchive']),
+        'perm_delete': [
+            {'archive_id': target_id, 'deleted': results['perm_delete'][target_id]}
+            for target_id in items['perm_delete']
+        ],
+    }
+
+def delta_response(changes):
+    """The `changes` member of a delta `/sync` response."""
+    names = {'Tasks': 'tasks', 'Archived': 'archives'}
+    return {
+        'tasks': changes['Tasks'],
+        'archives': changes['Archived'],
+        'moved': [
+            dict(move, **{'from': names[move['from']], 'to': names[move['to']]})
+            for move in changes['moved']
+        ],
+    }
+
+SEARCH_SCOPES = {'tasks': (Tasks, 'TODO'), 'archives': (Archived, 'Finished')}
+
+def search_plan(args):
+    """Parse `/search` arguments into ``(match, [(name, model, column, after)], error)``."""
+    match = fts_query(args.get('q', ''))
+    if not match:
+        return None, None, 'q is required'
+    scope = args.get('scope', 'all')
+    if scope not in ('tasks', 'archives', 'all'):
+        return None, None, 'scope must be tasks, archives or all'
+    plan = []
+    for name in (list(SEARCH_SCOPES) if scope == 'all' else [scope]):
+        model, column = SEARCH_SCOPES[name]
+        cursor = args.get(f'{name}_cursor') or (args.get('cursor') if scope != 'all' else None)
+        try:
+            after = decode_search_cursor(cursor) if cursor else None
+        except ValueError:
+            return None, None, 'invalid cursor'
+        plan.append((name, model, column, after))
+    return match, plan, None
+
+def search_page(hits, column, per_page):
+    return {
+        'results': [{'id': row_id, column: value} for row_id, value, _ in hits],
+        'next_cursor': encode_search_cursor(hits[-1][2], hits[-1][0]) if len(hits) == per_page else None,
+    }
+
+def last_event_id(params, headers):
+    """The revision a reconnecting event stream resumes from, or None. Raises ValueError."""
+    value = headers.get('Last-Event-ID') or params.get('last_event_id')
+    return int(value) if value else None
+
+def cache_metrics(response_cache):
+    """Counters of `response_cache` in the `extra` format of `Metrics.render`."""
+    cache = response_cache.stats()
+    extra = {
+        f'todo_response_cache_{name}_total': ('counter', f'Response cache {name}.', cache[name])
+        for name in ('hits', 'misses', 'evictions')
+    }
+    extra['todo_response_cache_entries'] = ('gauge', 'Pages held by the response cache.', cache['size'])
+    return extra
+
 @api.route('/add', methods=['POST'])
 def add_task():
     """Add a new task to TODO List."""
@@ -15,7 +282,11 @@ def add_task():
         return jsonify({'error' : 'task description is required'}), 400
     
     task = data['task_description']
+    if not isinstance(task, str):
+        return jsonify({'error': 'task description must be a string'}), 400
     new_task = controller.add_todo(task)
+    if new_task is None:
+        return jsonify({'error': 'Failed to add task'}), 500
     return jsonify({
         'message': 'Task added successfully', 
         'id': new_task.id,
@@ -63,44 +334,264 @@ def delete_from_archive():
     else:
         return jsonify({'error': 'Failed to delete archive or archive not found'}), 404
 
+@api.route('/batch', methods=['POST'])
+def batch():
+    """Add, archive, unArchive and permanently delete many items in one transaction.
+
+    Body: any of `add` (list of descriptions), `archive` (task ids),
+    `unArchive` and `perm_delete` (archive ids). Each section of the response
+    holds one result per requested item.
+    """
+    items, error, status = validate_batch(request.json, current_app.config.get('BATCH_MAX_ITEMS', 10000))
+    if error:
+        return jsonify({'error': error}), status
+
+    results = controller.apply_batch(
+        add=items['add'],
+        archive=items['archive'],
+        unarchive=items['unArchive'],
+        perm_delete=items['perm_delete'],
+    )
+    if results is None:
+        return jsonify({'error': 'Failed to apply batch'}), 500
+    return jsonify(batch_response(items, results)), 200
+
 @api.route('/tasks', methods=['GET'])
+@conditional('Tasks')
 def get_tasks():
-    """Get tasks."""
+    """Get tasks.
+
+    With `cursor`, `before_id` or `after_id` the response is an object holding
+    the page and a `next_cursor`; plain `page` requests still get a bare list.
+    ``total=1`` adds the number of tasks and pages, read from the row counter
+    along with the page. The format follows `Accept` (see `encoding.negotiate`).
+    """
     page = request.args.get('page', default=1, type=int)
-    tasks = controller.get_tasks(page=page)
-    # Serialize tasks for JSON response
-    result = [
-        {'id': t.id, 'TODO': t.TODO}
-        for t in tasks
-    ]
-    return jsonify(result)
+    with_total = wants_total(request.args)
+    try:
+        before_id, after_id = _keyset_bounds(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        per_page = current_app.config.get('TASKS_PER_PAGE', 10)
+        if not with_total:
+            versions = g.get('versions')
+            rows = controller.get_task_rows(page=page, before_id=before_id, after_id=after_id,
+                                            version=versions and versions['Tasks'])
+            return list_body('tasks', 'TODO', rows, per_page, before_id, after_id, g.format)
+        # One snapshot, so the total counts the rows the page was read from
+        with controller.read_snapshot():
+            counts = controller.get_counts('Tasks')
+            rows = controller.get_task_rows(page=page, before_id=before_id, after_id=after_id,
+                                            version=controller.read_model_version())
+        return list_body('tasks', 'TODO', rows, per_page, before_id, after_id, g.format,
+                         page_totals(counts and counts['Tasks'], per_page))
+
+    body = cached_body('Tasks', ('tasks', page, before_id, after_id, with_total, g.format), build)
+    return current_app.response_class(body, mimetype=g.format)
 
 @api.route('/archives', methods=['GET']) 
+@conditional('Archived')
 def get_archives():
-    """Get Archives."""
+    """Get Archives. Accepts the same keyset and `total` parameters as `/tasks`."""
     page = request.args.get('page', default=1, type=int)
-    archives = controller.get_archives(page=page)
-    # Serialize archives for JSON response
-    result = [
-        {'id': a.id, 'Finished': a.Finished}
-        for a in archives
-    ]
-    return jsonify(result)
+    with_total = wants_total(request.args)
+    try:
+        before_id, after_id = _keyset_bounds(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-@api.route('/sync', methods=['POST'])
-def sync_data():
-    """Sync data from the server based on request params.
-    
-    This endpoint allows for flexible syncing of specific items or lists
-    to reduce unnecessary data transfer.
+    def build():
+        per_page = current_app.config.get('TASKS_PER_PAGE', 10)
+        if not with_total:
+            rows = controller.get_archive_rows(page=page, before_id=before_id, after_id=after_id)
+            return list_body('archives', 'Finished', rows, per_page, before_id, after_id, g.format)
+        with controller.read_snapshot():
+            counts = controller.get_counts('Archived')
+            rows = controller.get_archive_rows(page=page, before_id=before_id, after_id=after_id)
+        return list_body('archives', 'Finished', rows, per_page, before_id, after_id, g.format,
+                         page_totals(counts and counts['Archived'], per_page))
+
+    body = cached_body('Archived', ('archives', page, before_id, after_id, with_total, g.format), build)
+    return current_app.response_class(body, mimetype=g.format)
+
+def ndjson_line(kind, row_id, text):
+    """Encode one exported row, without the trailing newline."""
+    column = 'TODO' if kind == 'task' else 'Finished'
+    return json.dumps({'type': kind, 'id': row_id, column: text})
+
+def parse_ndjson(lines):
+    """Yield one decoded object per non-empty line. Raises ValueError naming the bad line."""
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise ValueError(f"line {number} is not valid JSON") from None
+
+@api.route('/search', methods=['GET'])
+def search():
+    """Full-text search over task and/or archive descriptions.
+
+    `q` holds the terms (all must match, `term*` matches a prefix) and
+    `scope` is `tasks`, `archives` or `all`. Hits are ranked best first and
+    paged with `cursor` (`tasks_cursor`/`archives_cursor` for `all`).
+
+    The cursor holds the bm25 score and id of the last hit. Scores depend on
+    statistics of the whole table, so any write between two pages can shift
+    them: a row may then be returned twice or skipped. Paging is exact only
+    while the table is unchanged; a client needing a stable snapshot of many
+    hits should fetch them before the data moves on.
     """
-    data = request.json
+    match, plan, error = search_plan(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+
+    per_page = current_app.config.get('TASKS_PER_PAGE', 10)
     response = {}
+    for name, model, column, after in plan:
+        hits = controller.search(model, match, after)
+        if hits is None:
+            return jsonify({'error': 'Search is not available'}), 503
+        response[name] = search_page(hits, column, per_page)
+    return jsonify(response)
+
+@api.route('/events', methods=['GET'])
+def events():
+    """Stream change events as Server-Sent Events.
+
+    Each event's id is its change log revision; reconnecting with
+    `Last-Event-ID` (or `?last_event_id=`) replays what was missed.
+    """
+    try:
+        last_rev = last_event_id(request.args, request.headers)
+    except ValueError:
+        return jsonify({'error': 'invalid Last-Event-ID'}), 400
+    event_hub = current_app.extensions['event_hub']
+    subscription = event_hub.subscribe(channel=current_list_key())
+    if subscription is None:
+        return jsonify({'error': 'Too many event streams'}), 503
+    config = current_app.config
+    heartbeat = config.get('SSE_HEARTBEAT_SECONDS', 15)
+    max_replay = config.get('CHANGELOG_MAX_DELTA', 5000)
+
+    def generate():
+        try:
+            yield f"retry: {config.get('SSE_RETRY_MS', 3000)}\n\n"
+            stream = EventStream(subscription, last_rev or 0, replay=last_rev is not None)
+            if last_rev is None:
+                stream.sent = controller.get_head_rev()
+                close_db_session()
+                yield format_event(stream.sent, {'rev': stream.sent}, 'ready')
+            while True:
+                if stream.needs_replay:
+                    replay = controller.get_events(stream.sent, max_replay + 1)
+                    if replay is not None and len(replay) > max_replay:
+                        replay = None
+                    head_rev = controller.get_head_rev() if replay is None else None
+                    # Never hold a read snapshot while the stream idles
+                    close_db_session()
+                    yield ''.join(stream.replayed(replay, head_rev))
+                messages = stream.live()
+                if messages:
+                    yield ''.join(messages)
+                elif not stream.needs_replay and not subscription.wait(heartbeat):
+                    yield HEARTBEAT
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@api.route('/export', methods=['GET'])
+def export_data():
+    """Stream every task and archive as NDJSON, one object per line."""
+    def generate():
+        lines = []
+        for row in controller.export_rows():
+            lines.append(ndjson_line(*row))
+            if len(lines) >= 1000:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=todo-export.ndjson'},
+    )
+
+@api.route('/import', methods=['POST'])
+def import_data():
+    """Import NDJSON produced by `/export`, read as a stream and inserted in batches.
+
+    Imported rows get new ids unless `keep_ids=1` is passed.
+    """
+    keep_ids = request.args.get('keep_ids', default=0, type=int) == 1
+    # The raw WSGI stream reads lines a byte at a time; buffer it
+    lines = io.BufferedReader(request.stream, buffer_size=64 * 1024)
+    counts = controller.import_rows(parse_ndjson(lines), keep_ids=keep_ids)
+    if counts['error']:
+        status = 500 if counts['failed'] else 400
+        return jsonify({'error': counts['error'], 'tasks': counts['tasks'], 'archives': counts['archives']}), status
+    return jsonify({'message': 'Import finished', 'tasks': counts['tasks'], 'archives': counts['archives']}), 200
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, query and cache metrics in Prometheus text format."""
+    extensions = current_app.extensions
+    body = extensions['metrics'].render(dict(
+        cache_metrics(extensions['response_cache']), **extensions['event_hub'].metrics(),
+        **extensions['write_queue'].metrics(), **extensions['list_registry'].metrics(),
+        **extensions['maintenance_worker'].metrics(), **extensions['log_pipeline'].metrics(),
+        **read_model_metrics(extensions.get('read_model')), **admission_metrics(extensions.get('admission'))
+    ))
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+@api.route('/stats', methods=['GET'])
+@conditional('Tasks', 'Archived')
+def stats():
+    """Number of tasks and archives, from the row counters kept by every write instead of a scan."""
+    counts = controller.get_counts('Tasks', 'Archived')
+    if counts is None:
+        return jsonify({'error': 'Failed to read counters'}), 500
+    body = {'tasks': counts['Tasks'], 'archives': counts['Archived']}
+    return current_app.response_class(encode(body, g.format), mimetype=g.format)
+
+@api.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters of the list response cache."""
+    return jsonify(current_app.extensions['response_cache'].stats())
+
+def _sync_reads(data, response, since_rev, ids, tasks_query, archives_query):
+    """Fill `response` with what a `/sync` body asks for. Returns an error message, or None."""
+    per_page = current_app.config.get('TASKS_PER_PAGE', 10)
+    # Delta sync: only what changed after the client's revision
+    if since_rev is not None:
+        changes = controller.get_changes(since_rev)
+        if changes is None:
+            return 'Failed to read changes'
+        response['rev'] = changes['rev']
+        response['reset'] = changes['reset']
+        if not changes['reset']:
+            response['changes'] = delta_response(changes)
+    else:
+        # Read before any list so a client resuming from it never misses a change
+        response['rev'] = controller.get_head_rev()
+    # The version this snapshot sees, so task reads can come from the read model
+    tasks_version = controller.read_model_version()
     
     # Check if specific task requested
     if data.get('fetch_task_id'):
         task_id = data.get('fetch_task_id')
-        task = controller.get_task_by_id(task_id)
+        task = controller.get_task_by_id(task_id, tasks_version)
         if task:
             response['task'] = {'id': task.id, 'TODO': task.TODO}
     
@@ -110,25 +601,75 @@ def sync_data():
         archive = controller.get_archive_by_id(archive_id)
         if archive:
             response['archive'] = {'id': archive.id, 'Finished': archive.Finished}
-    
+
+    # Many specific items at once, with the ids that no longer exist
+    for name, (model, column) in FETCH_BY_ID.items():
+        if ids[name]:
+            fetched = controller.get_rows_by_id(model, ids[name], tasks_version)
+            if fetched is None:
+                return f'Failed to fetch {name}s by id'
+            rows, missing = fetched
+            response[f'{name}s_by_id'] = rows_payload(rows, column, g.format)
+            response[f'missing_{name}_ids'] = missing
+
     # Check if tasks list requested
     if data.get('fetch_tasks'):
-        page = data.get('tasks_page', 1)
-        tasks = controller.get_tasks(page=page)
-        response['tasks'] = [
-            {'id': t.id, 'TODO': t.TODO}
-            for t in tasks
-        ]
-        
+        page, before_id, after_id = tasks_query
+        rows = controller.get_task_rows(page=page, before_id=before_id, after_id=after_id, version=tasks_version)
+        response['tasks'] = rows_payload(rows, 'TODO', g.format)
+        response['tasks_next_cursor'] = next_cursor([row[0] for row in rows], per_page, after_id)
+
     # Check if archives list requested
     if data.get('fetch_archives'):
-        page = data.get('archives_page', 1)
-        archives = controller.get_archives(page=page)
-        response['archives'] = [
-            {'id': a.id, 'Finished': a.Finished}
-            for a in archives
-        ]
-        
-    return jsonify(response)
+        page, before_id, after_id = archives_query
+        rows = controller.get_archive_rows(page=page, before_id=before_id, after_id=after_id)
+        response['archives'] = rows_payload(rows, 'Finished', g.format)
+        response['archives_next_cursor'] = next_cursor([row[0] for row in rows], per_page, after_id)
+
+    # Row counts from the counters, as of the same snapshot as the lists
+    if data.get('fetch_totals'):
+        counts = controller.get_counts('Tasks', 'Archived')
+        if counts is None:
+            return 'Failed to read counters'
+        response['tasks_total'] = counts['Tasks']
+        response['archives_total'] = counts['Archived']
+    return None
+
+@api.route('/sync', methods=['POST'])
+@conditional('Tasks', 'Archived', vary_on_body=True)
+def sync_data():
+    """Sync data from the server based on request params.
+    
+    This endpoint allows for flexible syncing of specific items or lists
+    to reduce unnecessary data transfer.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Bad Request'}), 400
+    response = {}
+    try:
+        tasks_bounds = _keyset_bounds(data, 'tasks_')
+        archives_bounds = _keyset_bounds(data, 'archives_')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        tasks_page, archives_page = _sync_pages(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
+    ids, error, status = sync_ids(data, current_app.config.get('BATCH_MAX_ITEMS', 10000))
+    if error:
+        return jsonify({'error': error}), status
+    since_rev = None
+    if data.get('since_rev') is not None:
+        try:
+            since_rev = int(data['since_rev'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'since_rev must be an integer'}), 400
 
+    # Every read below sees the same state, so the lists, ids and revision agree
+    with controller.read_snapshot():
+        error = _sync_reads(data, response, since_rev, ids, (tasks_page,) + tasks_bounds, (archives_page,) + archives_bounds)
+    if error:
+        return jsonify({'error': error}), 500
+    return current_app.response_class(encode(response, g.format), mimetype=g.format)
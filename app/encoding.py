@@ -0,0 +1,76 @@
+"""
+Fast JSON encoding for list payloads, and the list formats clients can ask for.
+
+List reads hand plain ``(id, text)`` row tuples straight to `rows_payload`
+and `encode`, without building ORM objects first. `dumps` uses orjson when
+it is installed and falls back to the standard library, producing the same
+compact JSON either way.
+
+List endpoints pick their format from the ``Accept`` header with `negotiate`:
+
+* ``application/json`` (default): rows as ``[{"id": 1, "TODO": "..."}]``.
+* ``application/vnd.todo.columnar+json``: rows as ``{"ids": [1], "texts": ["..."]}``.
+* ``application/msgpack``: the ``application/json`` document as MessagePack,
+  offered only when msgpack is installed.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional format
+    msgpack = None
+
+JSON = 'application/json'
+COLUMNAR_JSON = 'application/vnd.todo.columnar+json'
+MSGPACK = 'application/msgpack'
+
+# Appended to the ETag of a non-default format, so every representation has its own
+FORMAT_TAGS = {JSON: '', COLUMNAR_JSON: 'c', MSGPACK: 'm'}
+
+
+def dumps(payload: Any) -> bytes:
+    """Encode `payload` as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def row_dicts(rows: Iterable[Tuple[int, str]], column: str) -> List[Dict[str, Any]]:
+    """``[{'id': id, column: text}]`` for ``(id, text)`` rows, the shape the list endpoints return."""
+    return [{'id': row_id, column: value} for row_id, value in rows]
+
+
+def columns(rows: Iterable[Tuple[int, str]]) -> Dict[str, List[Any]]:
+    """``{'ids': [...], 'texts': [...]}`` for ``(id, text)`` rows, the columnar shape."""
+    rows = list(rows)
+    return {'ids': [row[0] for row in rows], 'texts': [row[1] for row in rows]}
+
+
+def formats() -> List[str]:
+    """Formats this server can produce, default first."""
+    return [JSON, COLUMNAR_JSON] + ([MSGPACK] if msgpack is not None else [])
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """The format to answer an ``Accept`` header with. Falls back to JSON when nothing offered matches."""
+    return parse_accept_header(accept, MIMEAccept).best_match(formats()) or JSON
+
+
+def rows_payload(rows: Iterable[Tuple[int, str]], column: str, fmt: str = JSON) -> Any:
+    """``(id, text)`` rows in the shape of `fmt`."""
+    return columns(rows) if fmt == COLUMNAR_JSON else row_dicts(rows, column)
+
+
+def encode(payload: Any, fmt: str = JSON) -> bytes:
+    """Encode `payload` in `fmt`."""
+    if fmt == MSGPACK:
+        return msgpack.packb(payload)
+    return dumps(payload)
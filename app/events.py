@@ -0,0 +1,219 @@
+"""
+In-process pub/sub of change events, streamed to clients from `/api/events`.
+
+`_record_changes` queues one event per change log entry on the session; they
+are published to the app's `EventHub` (``app.extensions['event_hub']``, and
+``session.info['event_hub']`` of its sessions) when that session commits and
+dropped if it rolls back. The event id is the change log revision, so a
+client resuming with `Last-Event-ID` is replayed everything it missed from
+the `ChangeLog` table, and its `id` is a valid `since_rev` for `/api/sync`.
+
+Events of a named list (see `models/lists.py`) only reach the streams of
+that list: the list key is the subscription's channel, None for the
+default database.
+
+Every subscriber has a bounded queue. A subscriber that falls more than
+`SSE_QUEUE_SIZE` events behind is not allowed to hold memory: its queue is
+dropped and the stream catches up from the change log instead, or sends a
+`reset` event when the log no longer reaches back far enough.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# (rev, payload)
+Event = Tuple[int, Dict[str, Any]]
+
+_LISTS = {'Tasks': 'tasks', 'Archived': 'archives'}
+_MOVES = {'Tasks': ('archive', 'archive_id'), 'Archived': ('unarchive', 'task_id')}
+
+HEARTBEAT = ': keepalive\n\n'
+
+
+def change_event(table: str, op: str, row_id: int, target_id: Optional[int]) -> Dict[str, Any]:
+    """Compact client payload for one change log entry."""
+    if op == 'insert':
+        return {'op': 'add', 'list': _LISTS[table], 'id': row_id}
+    if op == 'move':
+        name, key = _MOVES[table]
+        return {'op': name, 'list': _LISTS[table], 'id': row_id, key: target_id}
+    if op == 'delete':
+        return {'op': 'delete', 'list': _LISTS[table], 'id': row_id}
+    return {'op': 'reset', 'list': _LISTS[table]}
+
+
+def format_event(rev: int, data: Dict[str, Any], name: str = 'change') -> str:
+    """One SSE message."""
+    return f"id: {rev}\nevent: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    """One subscriber's bounded queue, waited on from a thread or from an event loop."""
+
+    def __init__(self, max_queued: int, asynchronous: bool = False, channel: Optional[str] = None):
+        self.max_queued = max_queued
+        self.channel = channel
+        self.overflowed = False
+        self._events: Deque[Event] = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = asyncio.get_running_loop() if asynchronous else None
+        self._async_ready = asyncio.Event() if asynchronous else None
+
+    def put(self, events: List[Event]) -> bool:
+        """Queue `events`; returns False if this made the queue overflow and be dropped."""
+        dropped = False
+        with self._lock:
+            if not self.overflowed:
+                if len(self._events) + len(events) > self.max_queued:
+                    self._events.clear()
+                    self.overflowed = dropped = True
+                else:
+                    self._events.extend(events)
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._async_ready.set)
+            except RuntimeError:
+                pass    # loop already closed; the stream is gone
+        else:
+            self._ready.set()
+        return not dropped
+
+    def drain(self) -> Tuple[List[Event], bool]:
+        """Take the queued events and whether events were lost since the last drain."""
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            overflowed, self.overflowed = self.overflowed, False
+            if self._loop is not None:
+                self._async_ready.clear()
+            else:
+                self._ready.clear()
+        return events, overflowed
+
+    def wait(self, timeout: float) -> bool:
+        """Block until events arrive or `timeout` passes; True if there is something to drain."""
+        return self._ready.wait(timeout)
+
+    async def wait_async(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._async_ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class EventHub:
+    """Fans published events out to every subscriber."""
+
+    def __init__(self):
+        self._subscribers: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self.queue_size = 256
+        self.max_subscribers = 10000
+        self.published = 0
+        self.overflows = 0
+
+    def configure(self, app) -> None:
+        """Apply `SSE_*` settings from the app config."""
+        self.queue_size = app.config.get('SSE_QUEUE_SIZE', 256)
+        self.max_subscribers = app.config.get('SSE_MAX_SUBSCRIBERS', 10000)
+
+    def subscribe(self, asynchronous: bool = False, channel: Optional[str] = None) -> Optional[Subscription]:
+        """Register a subscriber to `channel`, or return None when `max_subscribers` are connected."""
+        subscription = Subscription(self.queue_size, asynchronous, channel)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, events: List[Event], channel: Optional[str] = None) -> None:
+        if not events:
+            return
+        with self._lock:
+            subscribers = [subscription for subscription in self._subscribers if subscription.channel == channel]
+            self.published += len(events)
+        overflows = sum(not subscription.put(events) for subscription in subscribers)
+        if overflows:
+            with self._lock:
+                self.overflows += overflows
+
+    def metrics(self) -> Dict[str, Tuple[str, str, float]]:
+        """Hub counters in the `extra` format of `Metrics.render`."""
+        with self._lock:
+            return {
+                'todo_events_subscribers': ('gauge', 'Connected /api/events streams.', len(self._subscribers)),
+                'todo_events_published_total': ('counter', 'Change events published.', self.published),
+                'todo_events_overflows_total': ('counter', 'Times a slow subscriber fell back to the change log.', self.overflows),
+            }
+
+
+class EventStream:
+    """What one `/api/events` stream sends next; the endpoints only do the I/O.
+
+    Live events are sent while they follow on from the last sent revision.
+    After a gap (events published out of order, by another process, or lost
+    to an overflow) `needs_replay` is set and the endpoint reads the missing
+    revisions from the change log.
+    """
+
+    def __init__(self, subscription: Subscription, last_rev: int, replay: bool):
+        self.subscription = subscription
+        self.sent = last_rev
+        self.needs_replay = replay
+
+    def live(self) -> List[str]:
+        events, overflowed = self.subscription.drain()
+        if overflowed:
+            self.needs_replay = True
+            return []
+        messages = []
+        for rev, data in events:
+            if rev <= self.sent:
+                continue
+            if rev != self.sent + 1:
+                self.needs_replay = True
+                break
+            messages.append(format_event(rev, data))
+            self.sent = rev
+        return messages
+
+    def replayed(self, events: Optional[List[Event]], head_rev: Optional[int]) -> List[str]:
+        """Messages for events read from the change log, or a reset to `head_rev` if they were unavailable."""
+        self.needs_replay = False
+        if events is None:
+            self.sent = head_rev
+            return [format_event(head_rev, {'op': 'reset'})]
+        messages = [format_event(rev, data) for rev, data in events]
+        if events:
+            self.sent = events[-1][0]
+        return messages
+
+
+def queue_events(session, changes: List[Tuple[str, str, int, Optional[int]]], revs: List[int]) -> None:
+    """Hold the events for `changes` (logged as `revs`) until `session` commits."""
+    session.info.setdefault('pending_events', []).extend(
+        (rev, change_event(*change)) for rev, change in zip(revs, changes)
+    )
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending(session):
+    events = session.info.pop('pending_events', None)
+    hub = session.info.get('event_hub')
+    if hub is not None:
+        hub.publish(events, session.info.get('list'))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('pending_events', None)
@@ -0,0 +1,181 @@
+"""
+Logging off the request path.
+
+Records of the ``app`` logger (and its children, such as ``app.maintenance``)
+go through a `QueueHandler` into a bounded queue; a `QueueListener` thread
+formats them and writes them to the rotating log file. A request that logs
+only appends a record to the queue: formatting, file writes and rotation
+happen in the listener, never while the request holds the database write
+lock.
+
+Messages use `%`-style arguments (``logger.info("Task %d added.", task_id)``),
+so the message is only built by the listener, and not at all for records
+that are dropped or sampled out. When the queue is full (`LOG_QUEUE_SIZE`
+records) new records are dropped and counted rather than making the request
+wait. With `LOG_INFO_SAMPLE_EVERY` set to N > 1, only one in N INFO records
+of each message template is kept; warnings and errors are always kept.
+
+Flask's console handler (stderr) is moved behind the queue as well. `stop`
+writes out what is queued; it runs at interpreter exit and on ASGI lifespan
+shutdown. With `LOG_QUEUE_ENABLED` off, the handlers are attached to the
+logger directly, as before.
+
+Every app has its own `LogPipeline` in ``app.extensions['log_pipeline']``,
+but Flask names the logger after the package, so all apps log to the same
+``app`` logger. Only one pipeline can write it: configuring an app's pipeline
+detaches the one of the app configured before.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Tuple
+
+from flask.logging import default_handler
+
+LOG_FORMAT = '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
+
+# The pipeline whose handlers are attached, by logger name
+_attached: Dict[str, 'LogPipeline'] = {}
+
+
+class _BoundedQueueHandler(QueueHandler):
+    """Queues records without waiting; counts those that find the queue full."""
+
+    def __init__(self, log_queue: queue.Queue, pipeline: 'LogPipeline'):
+        super().__init__(log_queue)
+        self.pipeline = pipeline
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener is in this process, so the record is passed as is and its message built
+        # there. Only a traceback is rendered here: it keeps the frames of the caller alive.
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.count('dropped')
+
+
+class _SampleInfo(logging.Filter):
+    """Keeps one in `every` INFO records of each message template."""
+
+    def __init__(self, every: int, pipeline: 'LogPipeline'):
+        super().__init__()
+        self.every = every
+        self.pipeline = pipeline
+        self._seen: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.INFO:
+            return True
+        # Racy increments at worst keep a record too many or too few; not worth a lock per record
+        seen = self._seen.get(record.msg, 0)
+        self._seen[record.msg] = seen + 1
+        if seen % self.every == 0:
+            return True
+        self.pipeline.count('sampled')
+        return False
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room instead of failing on a full queue; the listener is draining it
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """Owns the handlers of the ``app`` logger and the listener thread writing the log file."""
+
+    def __init__(self):
+        self._listener: Optional[_Listener] = None
+        self._handlers: list = []
+        self._file_handler: Optional[RotatingFileHandler] = None
+        self._console = False
+        self._queue: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.sampled = 0
+        atexit.register(self.stop)
+
+    @property
+    def running(self) -> bool:
+        return self._listener is not None
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def configure(self, app) -> None:
+        """Attach the handlers for `app.config` to `app.logger`, replacing those of an earlier app."""
+        logger = app.logger
+        previous = _attached.get(logger.name)
+        if previous is not None:
+            previous.detach(logger)
+            self._console = previous._console
+        _attached[logger.name] = self
+        self.dropped = self.sampled = 0
+
+        # Flask's console handler, added with the logger, is managed here from then on
+        if default_handler in logger.handlers:
+            logger.removeHandler(default_handler)
+            self._console = True
+        outputs = [default_handler] if self._console else []
+        log_file = app.config.get('LOG_FILE')
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            self._file_handler = RotatingFileHandler(log_file, maxBytes=app.config.get('LOG_MAX_BYTES', 100000),
+                                                     backupCount=app.config.get('LOG_BACKUP_COUNT', 3))
+            self._file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            self._file_handler.setLevel(logging.INFO)
+            outputs.append(self._file_handler)
+        if not app.config.get('LOG_QUEUE_ENABLED', True):
+            self._handlers = outputs
+            for handler in outputs:
+                logger.addHandler(handler)
+            return
+
+        self._queue = queue.Queue(app.config.get('LOG_QUEUE_SIZE', 10000))
+        handler = _BoundedQueueHandler(self._queue, self)
+        handler.setLevel(logging.INFO)
+        every = app.config.get('LOG_INFO_SAMPLE_EVERY', 1)
+        if every > 1:
+            handler.addFilter(_SampleInfo(every, self))
+        self._handlers = [handler]
+        logger.addHandler(handler)
+        self._listener = _Listener(self._queue, *outputs, respect_handler_level=True)
+        self._listener.start()
+
+    def detach(self, logger: logging.Logger) -> None:
+        """Remove this pipeline's handlers from `logger`, write out what is queued and close the log file."""
+        for handler in self._handlers:
+            logger.removeHandler(handler)
+        self._handlers = []
+        self.stop()
+        if self._file_handler is not None:
+            self._file_handler.close()
+            self._file_handler = None
+
+    def stop(self) -> None:
+        """Write out the queued records and stop the listener thread."""
+        listener, self._listener = self._listener, None
+        if listener is None:
+            return
+        listener.stop()
+        if self._file_handler is not None:
+            self._file_handler.flush()
+
+    def metrics(self) -> Dict[str, Tuple[str, str, float]]:
+        """Logging counters in the `extra` format of `Metrics.render`."""
+        return {
+            'todo_log_dropped_total': ('counter', 'Log records dropped because the log queue was full.', self.dropped),
+            'todo_log_sampled_total': ('counter', 'INFO log records left out by LOG_INFO_SAMPLE_EVERY.', self.sampled),
+            'todo_log_queue_depth': ('gauge', 'Log records waiting to be written.',
+                                     self._queue.qsize() if self._listener is not None else 0),
+        }
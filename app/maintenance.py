@@ -0,0 +1,185 @@
+"""
+Archive retention and database upkeep.
+
+`run_maintenance` purges archives older than `RETENTION_MAX_AGE_DAYS` and
+beyond the newest `RETENTION_MAX_ARCHIVES`, `RETENTION_BATCH_SIZE` rows per
+transaction with a pause of `RETENTION_BATCH_PAUSE_MS` in between, so the
+write lock is only ever held for one short batch and requests get in
+between them. It then hands free pages back to the file system with
+incremental vacuum, also in steps, and runs ``PRAGMA optimize`` to keep the
+query planner's statistics current.
+
+`MaintenanceWorker` (``app.extensions['maintenance_worker']``) runs it every
+`MAINTENANCE_INTERVAL_SECONDS` on a background thread of its app; ``python manage.py maintenance`` runs
+it once, e.g. from cron.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+def incremental_vacuum(engine: Engine, pages_per_step: int = 1000, pause: float = 0.0) -> Tuple[int, int]:
+    """Free the pages on the free list, `pages_per_step` at a time.
+
+    Returns ``(bytes reclaimed, steps)``. Does nothing unless the database
+    uses ``auto_vacuum=INCREMENTAL``; files created before it was the
+    default need one full ``VACUUM`` first (``manage.py maintenance --full-vacuum``).
+    """
+    if engine.dialect.name != 'sqlite':
+        return 0, 0
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:    # 2 = INCREMENTAL
+            return 0, 0
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        before = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        steps = 0
+        while conn.exec_driver_sql("PRAGMA freelist_count").scalar():
+            # Executed as a script: a plain execute() only runs the first step and frees a single page
+            conn.connection.dbapi_connection.executescript(
+                f"BEGIN IMMEDIATE; PRAGMA incremental_vacuum({int(pages_per_step)}); COMMIT;"
+            )
+            steps += 1
+            time.sleep(pause)
+        after = conn.exec_driver_sql("PRAGMA page_count").scalar()
+    return (before - after) * page_size, steps
+
+
+def full_vacuum(engine: Engine) -> None:
+    """Rewrite the whole file with ``auto_vacuum=INCREMENTAL``. Blocks all writers while it runs."""
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+
+
+def optimize(engine: Engine, analyze: bool = False) -> None:
+    """Refresh planner statistics: ``PRAGMA optimize``, or a full ``ANALYZE`` if asked."""
+    if engine.dialect.name != 'sqlite':
+        return
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        # Both read before they write; taking the write lock first makes them wait for
+        # other writers instead of failing when one commits in between
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            conn.exec_driver_sql("ANALYZE" if analyze else "PRAGMA optimize")
+        except Exception:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        conn.exec_driver_sql("COMMIT")
+
+
+def run_maintenance(config: Mapping[str, Any], analyze: bool = False) -> Dict[str, Any]:
+    """Purge expired archives, vacuum and optimize the current database; returns a report.
+
+    The report holds the archives purged, the number of batches, the
+    longest and total time the purge held the write lock, the bytes
+    returned to the file system and the total run time.
+    """
+    from .models import MainLogic, close_db_session, get_engine
+    from .models.database import epoch_seconds
+
+    started = time.perf_counter()
+    max_age = config.get('RETENTION_MAX_AGE_DAYS')
+    archived_before = epoch_seconds() - int(max_age * 86400) if max_age is not None else None
+    keep_newest = config.get('RETENTION_MAX_ARCHIVES')
+    batch_size = config.get('RETENTION_BATCH_SIZE', 500)
+    pause = config.get('RETENTION_BATCH_PAUSE_MS', 20) / 1000
+    report: Dict[str, Any] = {'purged': 0, 'batches': 0, 'lock_max_ms': 0.0, 'lock_total_ms': 0.0, 'errors': 0}
+
+    logic = MainLogic()
+    while archived_before is not None or keep_newest is not None:
+        batch_started = time.perf_counter()
+        purged = logic.purge_archives(archived_before, keep_newest, batch_size)
+        held_ms = (time.perf_counter() - batch_started) * 1000
+        close_db_session()
+        if purged is None:
+            report['errors'] += 1
+            break
+        if purged == 0:
+            break
+        report['purged'] += purged
+        report['batches'] += 1
+        report['lock_max_ms'] = round(max(report['lock_max_ms'], held_ms), 3)
+        report['lock_total_ms'] = round(report['lock_total_ms'] + held_ms, 3)
+        if purged < batch_size:
+            break
+        time.sleep(pause)
+
+    engine = get_engine()
+    report['bytes_reclaimed'], report['vacuum_steps'] = incremental_vacuum(
+        engine, config.get('VACUUM_PAGES_PER_STEP', 1000), pause
+    )
+    optimize(engine, analyze)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+class MaintenanceWorker:
+    """Runs `run_maintenance` periodically on a daemon thread."""
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.runs = 0
+        self.purged = 0
+        self.bytes_reclaimed = 0
+        self.last_lock_max_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def configure(self, app) -> None:
+        """Start the worker if `MAINTENANCE_INTERVAL_SECONDS` is set; stops a previous one."""
+        self.stop()
+        interval = app.config.get('MAINTENANCE_INTERVAL_SECONDS', 0)
+        if not interval:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, args=(app, interval), name='maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the worker, waiting for a run in progress to finish its current batch loop."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, app, interval: float) -> None:
+        with app.app_context():
+            while not self._stopping.wait(interval):
+                try:
+                    self.run_once(app.config)
+                except Exception:
+                    logger.exception("Maintenance run failed")
+
+    def run_once(self, config: Mapping[str, Any], analyze: bool = False) -> Dict[str, Any]:
+        """Run maintenance now and add the report to the worker's counters."""
+        report = run_maintenance(config, analyze)
+        self.runs += 1
+        self.purged += report['purged']
+        self.bytes_reclaimed += report['bytes_reclaimed']
+        self.last_lock_max_ms = report['lock_max_ms']
+        logger.info(
+            "Maintenance: purged %d archives in %d batches (write lock held at most %.1f ms, %.1f ms in total), "
+            "reclaimed %d bytes in %.2f s", report['purged'], report['batches'], report['lock_max_ms'],
+            report['lock_total_ms'], report['bytes_reclaimed'], report['seconds'],
+        )
+        return report
+
+    def metrics(self) -> Dict[str, Tuple[str, str, float]]:
+        """Worker counters in the `extra` format of `Metrics.render`."""
+        return {
+            'todo_maintenance_runs_total': ('counter', 'Maintenance runs completed.', self.runs),
+            'todo_maintenance_purged_total': ('counter', 'Archives purged by retention.', self.purged),
+            'todo_maintenance_reclaimed_bytes_total': ('counter', 'Bytes returned to the file system by vacuum.',
+                                                       self.bytes_reclaimed),
+            'todo_maintenance_lock_max_ms': ('gauge', 'Longest write lock hold of the last maintenance run.',
+                                             self.last_lock_max_ms),
+        }
@@ -0,0 +1,208 @@
+"""
+Request and query instrumentation, exposed in Prometheus text format.
+
+Engine events count queries, DB time and commit time into a record for the
+request being served, held in a context variable so it follows the request
+whether it runs on its own thread (WSGI) or in its own task (ASGI). When the request ends, that record is
+folded into the app's `Metrics` together with the request latency. The hot
+path is a few `perf_counter` calls and one short lock per request.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Upper bounds in seconds, as in the Prometheus client defaults.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_stats = contextvars.ContextVar('todo_request_stats', default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram. Not locked itself; `Metrics` serializes access."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        sep = ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum:.6f}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+        return lines
+
+
+class Metrics:
+    """Per-app store of request, query and commit measurements."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.requests: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self.queries: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.db_seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.commits = Histogram()
+        self.slow_requests = 0
+
+    def record(self, endpoint: str, method: str, status: int, seconds: float,
+               queries: int, db_seconds: float, commits: List[float], slow: bool) -> None:
+        key = (endpoint, method)
+        with self._lock:
+            self.latency[key].observe(seconds)
+            self.requests[(endpoint, method, status)] += 1
+            self.queries[key] += queries
+            self.db_seconds[key] += db_seconds
+            for commit_seconds in commits:
+                self.commits.observe(commit_seconds)
+            if slow:
+                self.slow_requests += 1
+
+    def render(self, extra: Dict[str, Tuple[str, str, float]] = None) -> str:
+        """Prometheus text exposition of everything recorded so far.
+
+        `extra` maps metric names to ``(type, help, value)`` for gauges and
+        counters owned elsewhere, such as the response cache.
+        """
+        def labels(endpoint, method):
+            return f'endpoint="{endpoint}",method="{method}"'
+
+        lines = []
+        with self._lock:
+            lines += ['# HELP todo_request_duration_seconds Request latency by endpoint.',
+                      '# TYPE todo_request_duration_seconds histogram']
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                lines += histogram.render('todo_request_duration_seconds', labels(endpoint, method))
+            lines += ['# HELP todo_requests_total Requests by endpoint and status.',
+                      '# TYPE todo_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'todo_requests_total{{{labels(endpoint, method)},status="{status}"}} {count}')
+            lines += ['# HELP todo_db_queries_total SQL statements executed while serving requests.',
+                      '# TYPE todo_db_queries_total counter']
+            for key, count in sorted(self.queries.items()):
+                lines.append(f'todo_db_queries_total{{{labels(*key)}}} {count}')
+            lines += ['# HELP todo_db_query_seconds_total Time spent executing SQL while serving requests.',
+                      '# TYPE todo_db_query_seconds_total counter']
+            for key, seconds in sorted(self.db_seconds.items()):
+                lines.append(f'todo_db_query_seconds_total{{{labels(*key)}}} {seconds:.6f}')
+            lines += ['# HELP todo_db_commit_duration_seconds Time spent in COMMIT, including the fsync.',
+                      '# TYPE todo_db_commit_duration_seconds histogram']
+            lines += self.commits.render('todo_db_commit_duration_seconds', '')
+            lines += ['# HELP todo_slow_requests_total Requests slower than SLOW_REQUEST_MS.',
+                      '# TYPE todo_slow_requests_total counter',
+                      f'todo_slow_requests_total {self.slow_requests}']
+        for name, (kind, help_text, value) in sorted((extra or {}).items()):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+def _new_stats() -> dict:
+    return {'queries': 0, 'db_seconds': 0.0, 'commits': [], 'commit_started': None}
+
+
+def start_request() -> None:
+    """Start a fresh query/commit record for the request about to be served."""
+    _current_stats.set(_new_stats())
+
+
+def finish_request() -> dict:
+    """Return the record of the request just served and detach it.
+
+    Work outside a request, e.g. on the write queue or maintenance threads,
+    has no record, so the hooks below skip it instead of accumulating it.
+    """
+    stats = _current_stats.get() or _new_stats()
+    _current_stats.set(None)
+    return stats
+
+
+def instrument_engine(engine) -> None:
+    """Attach the query and commit timing hooks to `engine` (once)."""
+    if event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'commit', _before_commit)
+    if not event.contains(Session, 'after_commit', _after_commit):
+        event.listen(Session, 'after_commit', _after_commit)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, which ends with the statement, failed or not
+    if context is not None and _current_stats.get() is not None:
+        context.todo_query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    started = getattr(context, 'todo_query_started', None)
+    if stats is None or started is None:
+        return
+    stats['queries'] += 1
+    stats['db_seconds'] += time.perf_counter() - started
+
+
+def _before_commit(conn):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats['commit_started'] = time.perf_counter()
+
+
+def _after_commit(session):
+    stats = _current_stats.get()
+    if stats is not None and stats['commit_started'] is not None:
+        stats['commits'].append(time.perf_counter() - stats['commit_started'])
+        stats['commit_started'] = None
+
+
+def init_metrics(app) -> Metrics:
+    """Register the request hooks on `app`; engines are instrumented with `instrument_engine`."""
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+    if not app.config.get('METRICS_ENABLED', True):
+        return metrics
+    slow_ms = app.config.get('SLOW_REQUEST_MS')
+
+    @app.before_request
+    def start_request_timer():
+        start_request()
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        stats = finish_request()
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        slow = slow_ms is not None and seconds * 1000 >= slow_ms
+        metrics.record(endpoint, request.method, response.status_code, seconds,
+                       stats['queries'], stats['db_seconds'], stats['commits'], slow)
+        if slow:
+            current_app.logger.warning(
+                "Slow request %s %s -> %s: %.1f ms, %d queries, %.1f ms in DB", request.method, request.full_path,
+                response.status_code, seconds * 1000, stats['queries'], stats['db_seconds'] * 1000,
+            )
+        return response
+
+    return metrics
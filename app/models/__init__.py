@@ -2,4 +2,4 @@
 models for TODO List application.
 """
 from .control import MainLogic
-from .database import init_db, get_db_session, close_db_session, Tasks, Archived
\ No newline at end of file
+from .database import Database, init_db, get_database, get_engine, get_db_session, close_db_session, describe_engine, Tasks, Archived, Counters, ChangeLog
\ No newline at end of file
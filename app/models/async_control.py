@@ -0,0 +1,464 @@
+"""
+Async counterpart of `MainLogic`, used by the ASGI app.
+
+It runs the same statements through SQLAlchemy's asyncio extension (aiosqlite
+for SQLite), so a request waiting on the database does not hold a thread.
+"""
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, event, func, insert, select, text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from .database import Tasks, Archived, ChangeLog, _is_memory_uri, _sqlite_pragmas
+from .control import (
+    _LOG_BOUNDS_STMT, _MALFORMED_RECORD, _TEXT_COLUMN, _ImportBatch, _batch_changes, _chunks, _bump_versions_stmt,
+    _changelog_insert, _changes_body, _compaction_stmt, _counter_values, _counters_stmt, _changes_stmt,
+    _delta_reachable, _delta_usable, _events_stmt, _found_and_missing, _log_bounds, _replay_changes,
+    _rows_by_id_stmt, _page_stmt, _search_sql, _moved_row, _put_rows_stmt, _row_page_stmt, _take_rows_stmt,
+)
+from .read_model import TaskReadModel, note_task_rows, queue_task_delta
+from ..events import EventHub, change_event, queue_events
+
+# Async drivers for the sync URLs in `DATABASE_URI`.
+_ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+
+def build_async_engine(config) -> AsyncEngine:
+    """Create an async engine for `config.DATABASE_URI`, with the same PRAGMAs as `build_engine`."""
+    uri = config.DATABASE_URI
+    scheme, sep, rest = uri.partition('://')
+    async_uri = _ASYNC_DRIVERS.get(scheme.split('+')[0], scheme) + sep + rest
+    if not uri.startswith('sqlite'):
+        return create_async_engine(
+            async_uri,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+
+    in_memory = _is_memory_uri(uri)
+    kwargs = {}
+    if not in_memory:
+        kwargs = dict(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+    engine = create_async_engine(async_uri, **kwargs)
+    pragmas = _sqlite_pragmas(config, in_memory)
+
+    @event.listens_for(engine.sync_engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    return engine
+
+
+class AsyncMainLogic:
+    """
+    Manager for Tasks on an async engine.
+
+    Offers the methods of `MainLogic` as coroutines with the same arguments
+    and return values, except that rows come back as plain ``(id, text)``
+    tuples or detached ORM objects. Every call uses its own session.
+    Commits update `read_model`, the Flask app's copy of `Tasks`, and publish
+    their change events to `event_hub`, if given.
+    """
+
+    def __init__(self, engine: AsyncEngine, config, logger: Optional[logging.Logger] = None,
+                 read_model: Optional[TaskReadModel] = None, event_hub: Optional[EventHub] = None):
+        self.engine = engine
+        self.config = config
+        self.logger = logger or logging.getLogger(__name__)
+        self.read_model = read_model
+        info: Dict[str, Any] = {}
+        if read_model is not None:
+            info['read_model'] = read_model
+        if event_hub is not None:
+            info['event_hub'] = event_hub
+        self.session_factory = async_sessionmaker(engine, expire_on_commit=False, autoflush=False, info=info)
+        # Session of the `read_snapshot` being run, per task
+        self._snapshot: ContextVar[Optional[AsyncSession]] = ContextVar('snapshot', default=None)
+
+    async def add_todo(self, detail: str) -> Optional[Tasks]:
+        """Add a new task."""
+        async with self.session_factory() as session:
+            try:
+                task = Tasks(TODO=detail[:255])
+                session.add(task)
+                await session.flush()
+                note_task_rows(session.sync_session, [(task.id, task.TODO)])
+                await self._record_changes(session, [('Tasks', 'insert', task.id, None)])
+                await session.commit()
+            except SQLAlchemyError as e:
+                await session.rollback()
+                self.logger.error("Failed to insert new task %s", e)
+                return None
+        self.logger.info("Task %s added.", task.id)
+        return task
+
+    async def archive(self, target_id: int) -> Optional[int]:
+        """Archive a task. Returns the id of the new archive, or None."""
+        return await self._move_one(Tasks, Archived, target_id)
+
+    async def unArchive(self, target_id: int) -> Optional[int]:
+        """UnArchive a task. Returns the id of the restored task, or None."""
+        return await self._move_one(Archived, Tasks, target_id)
+
+    async def _move_one(self, source, target, target_id: int) -> Optional[int]:
+        async with self.session_factory() as session:
+            try:
+                found = (await session.execute(
+                    _take_rows_stmt(source, [target_id]),
+                    execution_options={'synchronize_session': False},
+                )).first()
+                if found is None:
+                    self.logger.warning("%s row %s not found for moving.", source.__tablename__, target_id)
+                    return None
+                new_id = (await session.execute(
+                    _put_rows_stmt(target), [_moved_row(target, found)]
+                )).scalar_one()
+                if target is Tasks:
+                    note_task_rows(session.sync_session, [(new_id, found[1])])
+                await self._record_changes(session, [(source.__tablename__, 'move', target_id, new_id)])
+                await session.commit()
+            except SQLAlchemyError as e:
+                await session.rollback()
+                self.logger.error("Failed to move %s row %s: %s", source.__tablename__, target_id, e)
+                return None
+        self.logger.info("%s row %s moved to %s as %s.", source.__tablename__, target_id, target.__tablename__, new_id)
+        return new_id
+
+    async def perm_delete(self, target_id: int) -> bool:
+        """Permanently remove an archived task. Returns True on success, False otherwise."""
+        async with self.session_factory() as session:
+            try:
+                deleted = (await self._delete_rows(session, Archived, [target_id]))[target_id]
+                if not deleted:
+                    self.logger.warning("Archived task with id %s not found for permanent deletion.", target_id)
+                    return False
+                await self._record_changes(session, [('Archived', 'delete', target_id, None)])
+                await session.commit()
+            except SQLAlchemyError as e:
+                await session.rollback()
+                self.logger.error("Failed to permanently delete archived task %s: %s", target_id, e)
+                return False
+        self.logger.info("Archived task %s permanently deleted.", target_id)
+        return True
+
+    async def apply_batch(self, add: Iterable[str] = (), archive: Iterable[int] = (),
+                          unarchive: Iterable[int] = (), perm_delete: Iterable[int] = ()) -> Optional[Dict[str, Any]]:
+        """Apply many mutations in a single transaction. See `MainLogic.apply_batch`."""
+        async with self.session_factory() as session:
+            try:
+                results = {'add': await self._insert_tasks(session, add)}
+                results['archive'] = await self._move_rows(session, Tasks, Archived, archive)
+                results['unArchive'] = await self._move_rows(session, Archived, Tasks, unarchive)
+                results['perm_delete'] = await self._delete_rows(session, Archived, perm_delete)
+                await self._record_changes(session, _batch_changes(results))
+                await session.commit()
+            except SQLAlchemyError as e:
+                await session.rollback()
+                self.logger.error("Failed to apply batch: %s", e)
+                return None
+        return results
+
+    async def _record_changes(self, session: AsyncSession, changes: List[Tuple[str, str, int, Optional[int]]],
+                              added: Optional[Dict[str, int]] = None) -> None:
+        """Log `changes` and update the table counters in the session's transaction."""
+        if not changes:
+            return
+        versions = dict((await session.execute(_bump_versions_stmt(changes, added))).all())
+        revs = (await session.execute(*_changelog_insert(changes))).scalars().all()
+        queue_events(session.sync_session, changes, revs)
+        queue_task_delta(session.sync_session, changes, versions)
+        compaction = _compaction_stmt(revs[-1], len(changes), self.config)
+        if compaction is not None:
+            await session.execute(compaction)
+
+    async def _insert_tasks(self, session: AsyncSession, details: Iterable[str]) -> List[int]:
+        rows = [{'TODO': detail[:255]} for detail in details]
+        if not rows:
+            return []
+        stmt = insert(Tasks).returning(Tasks.id, sort_by_parameter_order=True)
+        ids = list((await session.execute(stmt, rows)).scalars())
+        note_task_rows(session.sync_session, zip(ids, (row['TODO'] for row in rows)))
+        return ids
+
+    async def _move_rows(self, session: AsyncSession, source, target, ids: Iterable[int]) -> Dict[int, Optional[int]]:
+        ids = list(dict.fromkeys(ids))
+        moved: Dict[int, Optional[int]] = dict.fromkeys(ids)
+        for chunk in _chunks(ids):
+            found = sorted((await session.execute(
+                _take_rows_stmt(source, chunk),
+                execution_options={'synchronize_session': False},
+            )).all())
+            if not found:
+                continue
+            new_ids = (await session.execute(
+                _put_rows_stmt(target), [_moved_row(target, row) for row in found]
+            )).scalars().all()
+            moved.update(zip((row[0] for row in found), new_ids))
+            if target is Tasks:
+                note_task_rows(session.sync_session, zip(new_ids, (row[1] for row in found)))
+        return moved
+
+    async def _delete_rows(self, session: AsyncSession, model, ids: Iterable[int]) -> Dict[int, bool]:
+        ids = list(dict.fromkeys(ids))
+        deleted = dict.fromkeys(ids, False)
+        for chunk in _chunks(ids):
+            gone = (await session.execute(
+                delete(model).where(model.id.in_(chunk)).returning(model.id),
+                execution_options={'synchronize_session': False},
+            )).scalars().all()
+            deleted.update(dict.fromkeys(gone, True))
+        return deleted
+
+    async def get_versions(self, *tables: str) -> Optional[Dict[str, int]]:
+        """Get the change counters of `tables`, in the enclosing `read_snapshot` if any."""
+        return await self._get_counters('version', tables)
+
+    async def get_counts(self, *tables: str) -> Optional[Dict[str, int]]:
+        """Get the row counters of `tables`, in the enclosing `read_snapshot` if any."""
+        return await self._get_counters('count', tables)
+
+    async def _get_counters(self, kind: str, tables: Iterable[str]) -> Optional[Dict[str, int]]:
+        try:
+            async with self._session() as session:
+                rows = (await session.execute(_counters_stmt(kind, tables))).all()
+        except SQLAlchemyError as e:
+            self.logger.error("Failed to read %s counters: %s", kind, e)
+            return None
+        return _counter_values(tables, rows)
+
+    async def get_head_rev(self) -> int:
+        """Get the latest change revision, 0 if nothing was logged yet."""
+        async with self._session() as session:
+            return (await session.execute(select(func.max(ChangeLog.rev)))).scalar() or 0
+
+    async def get_events(self, after_rev: int, limit: int) -> Optional[List[Tuple[int, Dict[str, Any]]]]:
+        """Up to `limit` change events after `after_rev`. See `MainLogic.get_events`."""
+        try:
+            async with self.session_factory() as session:
+                oldest_rev, head_rev = _log_bounds((await session.execute(_LOG_BOUNDS_STMT)).one())
+                if after_rev < oldest_rev - 1 or after_rev > head_rev:
+                    return None
+                rows = (await session.execute(_events_stmt(after_rev, limit))).all()
+        except SQLAlchemyError as e:
+            self.logger.error("Failed to read events after revision %s: %s", after_rev, e)
+            return None
+        return [(rev, change_event(*change)) for rev, *change in rows]
+
+    async def get_changes(self, since_rev: int) -> Optional[Dict[str, Any]]:
+        """Net changes to both tables after revision `since_rev`. See `MainLogic.get_changes`."""
+        try:
+            async with self._session() as session:
+                oldest_rev, head_rev = _log_bounds((await session.execute(_LOG_BOUNDS_STMT)).one())
+                if not _delta_reachable(since_rev, oldest_rev, head_rev):
+                    return {'rev': head_rev, 'reset': True}
+                max_changes = self.config.get('CHANGELOG_MAX_DELTA', 5000)
+                entries = (await session.execute(_changes_stmt(since_rev, head_rev, max_changes + 1))).all()
+                if not _delta_usable(entries, max_changes):
+                    return {'rev': head_rev, 'reset': True}
+
+                row_ids, moved = _replay_changes(entries)
+                rows: Dict[Any, List[Tuple[int, str]]] = {Tasks: [], Archived: []}
+                for model in rows:
+                    for chunk in _chunks(row_ids[model.__tablename__][0]):
+                        rows[model] += (await session.execute(_rows_by_id_stmt(model, chunk))).all()
+                return _changes_body(head_rev, moved, row_ids, rows)
+        except SQLAlchemyError as e:
+            self.logger.error("Failed to read changes since revision %s: %s", since_rev, e)
+            return None
+
+    async def search(self, model, match: str, after: Optional[Tuple[float, int]] = None) -> Optional[List[Tuple[int, str, float]]]:
+        """Full-text search in `model`, best match first. See `MainLogic.search`."""
+        sql, params = _search_sql(model, match, after, self.config.get('TASKS_PER_PAGE', 10))
+        try:
+            async with self.session_factory() as session:
+                return [tuple(row) for row in await session.execute(text(sql), params)]
+        except SQLAlchemyError as e:
+            self.logger.error("Failed to search %s_fts: %s", model.__tablename__, e)
+            return None
+
+    async def get_tasks(self, page: int = 1, before_id: Optional[int] = None,
+                        after_id: Optional[int] = None) -> List[Tasks]:
+        """Get a page of tasks, newest first."""
+        return await self._paginate(Tasks, page, before_id, after_id)
+
+    async def get_archives(self, page: int = 1, before_id: Optional[int] = None,
+                           after_id: Optional[int] = None) -> List[Archived]:
+        """Get a page of archived tasks, newest first."""
+        return await self._paginate(Archived, page, before_id, after_id)
+
+    async def _paginate(self, model, page: int, before_id: Optional[int], after_id: Optional[int]) -> List[Any]:
+        per_page = self.config.get('TASKS_PER_PAGE', 10)
+        try:
+            async with self.session_factory() as session:
+                rows = list((await session.scalars(_page_stmt(model, per_page, page, before_id, after_id))).all())
+        except SQLAlchemyError as e:
+            self.logger.error("Failed to fetch %s: %s", model.__tablename__, e)
+            return []
+        if after_id is not None:
+            rows.reverse()
+        return rows
+
+    async def get_task_rows(self, page: int = 1, before_id: Optional[int] = None, after_id: Optional[int] = None,
+                            version: Optional[int] = None) -> List[Tuple[int, str]]:
+        """``(id, TODO)`` tuples of a page of tasks. See `MainLogic.get_task_rows`."""
+        if self.read_model is not None and version is not None:
+            rows = self.read_model.page(version, self.config.get('TASKS_PER_PAGE', 10), page, before_id, after_id)
+            if rows is not None:
+                return rows
+        return await self._page_rows(Tasks, page, before_id, after_id)
+
+    async def get_archive_rows(self, page: int = 1, before_id: Optional[int] = None,
+                               after_id: Optional[int] = None) -> List[Tuple[int, str]]:
+        """``(id, Finished)`` tuples of a page of archived tasks."""
+        return await self._page_rows(Archived, page, before_id, after_id)
+
+    async def _page_rows(self, model, page: int, before_id: Optional[int], after_id: Optional[int]) -> List[Tuple[int, str]]:
+        per_page = self.config.get('TASKS_PER_PAGE', 10)
+        stmt, params = _row_page_stmt(model, per_page, page, before_id, after_id)
+        try:
+            async with self._session() as session:
+                rows = (await session.execute(stmt, params)).all()
+        except SQLAlchemyError as e:
+            self.logger.error("Failed to fetch %s: %s", model.__tablename__, e)
+            return []
+        if after_id is not None:
+            rows.reverse()
+        return rows
+
+    @asynccontextmanager
+    async def read_snapshot(self):
+        """Run the reads of the block in one read transaction. See `MainLogic.read_snapshot`.
+
+        The methods that read through `_session` use the snapshot's session
+        while the block runs, in the task that entered it.
+        """
+        async with self.session_factory() as session:
+            conn = await session.connection()
+            if conn.dialect.name == 'sqlite':
+                await conn.exec_driver_sql('BEGIN')
+            token = self._snapshot.set(session)
+            try:
+                yield
+            finally:
+                self._snapshot.reset(token)
+                await session.rollback()
+
+    @asynccontextmanager
+    async def _session(self):
+        """The session of the enclosing `read_snapshot`, or a new one."""
+        session = self._snapshot.get()
+        if session is not None:
+            yield session
+            return
+        async with self.session_factory() as session:
+            yield session
+
+    async def read_model_version(self) -> Optional[int]:
+        """The `Tasks` version for the task reads of a `read_snapshot` block; None without a read model."""
+        if self.read_model is None:
+            return None
+        versions = await self.get_versions('Tasks')
+        return versions and versions['Tasks']
+
+    async def get_rows_by_id(self, model, ids: Iterable[int],
+                             version: Optional[int] = None) -> Optional[Tuple[List[Tuple[int, str]], List[int]]]:
+        """Rows of `model` with `ids` and the ids not found. See `MainLogic.get_rows_by_id`."""
+        ids = list(dict.fromkeys(ids))
+        if model is Tasks and self.read_model is not None and version is not None:
+            found = self.read_model.lookup(version, ids)
+            if found is not None:
+                return found
+        rows = []
+        try:
+            async with self._session() as session:
+                for chunk in _chunks(ids):
+                    rows += (await session.execute(_rows_by_id_stmt(model, chunk))).all()
+        except SQLAlchemyError as e:
+            self.logger.error("Failed to fetch %s by id: %s", model.__tablename__, e)
+            return None
+        return _found_and_missing(ids, rows)
+
+    async def get_task_by_id(self, task_id: int, version: Optional[int] = None) -> Optional[Tasks]:
+        """Get a specific task by ID. See `MainLogic.get_task_by_id`."""
+        if (self.read_model is not None and version is not None
+                and isinstance(task_id, int) and not isinstance(task_id, bool)):
+            found = self.read_model.lookup(version, [task_id])
+            if found is not None:
+                return Tasks(id=task_id, TODO=found[0][0][1]) if found[0] else None
+        return await self._get_by_id(Tasks, task_id)
+
+    async def get_archive_by_id(self, archive_id: int) -> Optional[Archived]:
+        """Get a specific archived task by ID."""
+        return await self._get_by_id(Archived, archive_id)
+
+    async def _get_by_id(self, model, row_id: int):
+        try:
+            async with self._session() as session:
+                return await session.get(model, row_id)
+        except SQLAlchemyError as e:
+            self.logger.error("Failed to fetch %s row %s: %s", model.__tablename__, row_id, e)
+            return None
+
+    async def export_rows(self) -> AsyncIterator[Tuple[str, int, str]]:
+        """Yield ``(kind, id, text)`` for every task, then every archive, streamed from the database."""
+        batch = self.config.get('EXPORT_YIELD_PER', 1000)
+        async with self.session_factory() as session:
+            for kind, model in (('task', Tasks), ('archive', Archived)):
+                text_column = getattr(model, _TEXT_COLUMN[model])
+                result = await session.stream(
+                    select(model.id, text_column).order_by(model.id).execution_options(yield_per=batch)
+                )
+                async for row_id, value in result:
+                    yield kind, row_id, value
+
+    async def import_rows(self, records: AsyncIterable[Dict[str, Any]], keep_ids: bool = False) -> Dict[str, Any]:
+        """Insert exported records in batches. See `MainLogic.import_rows`."""
+        counts = {'tasks': 0, 'archives': 0, 'error': None, 'failed': False}
+        batch = _ImportBatch(self.config.get('IMPORT_BATCH_SIZE', 5000), keep_ids)
+
+        async def flush():
+            async with self.session_factory() as session:
+                try:
+                    for model, rows in batch.rows.items():
+                        if rows:
+                            await (await session.connection()).execute(insert(model.__table__), rows)
+                    await self._record_changes(session, *batch.changes())
+                    await session.commit()
+                except IntegrityError as e:
+                    await session.rollback()
+                    self.logger.warning("Import batch rejected: %s", e)
+                    counts['error'] = batch.conflict()
+                    return False
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    self.logger.error("Failed to import batch: %s", e)
+                    counts['error'] = 'Failed to import batch'
+                    counts['failed'] = True
+                    return False
+            batch.committed(counts)
+            return True
+
+        try:
+            async for record in records:
+                if batch.add(record) and not await flush():
+                    break
+            else:
+                await flush()
+        except _MALFORMED_RECORD as e:
+            counts['error'] = str(e) or 'malformed record'
+            await flush()
+
+        self.logger.info("Imported %s tasks and %s archives.", counts['tasks'], counts['archives'])
+        return counts
@@ -1,12 +1,359 @@
 """
 Main Logic for TODO Lists
 """
-from typing import List, Any, Optional
-from sqlalchemy.exc import SQLAlchemyError
+import re
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Tuple
+from sqlalchemy import bindparam, case, delete, func, insert, or_, select, text, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from flask import current_app
-from .database import get_db_session, Tasks, Archived
+from .database import current_list, get_db_session, Tasks, Archived, Counters, ChangeLog
+from .read_model import TaskReadModel, note_task_rows, queue_task_delta
+from ..events import change_event, queue_events
 from ..config import Config 
 
+# Name of the text column of each table, used when moving rows between them.
+_TEXT_COLUMN = {Tasks: 'TODO', Archived: 'Finished'}
+
+# Where a row archived from / restored out of each table ends up.
+_OTHER_TABLE = {'Tasks': 'Archived', 'Archived': 'Tasks'}
+
+# Ids per `IN (...)` clause, well under SQLite's bound-parameter limit.
+_ID_CHUNK = 500
+
+
+def fts_query(query: str) -> Optional[str]:
+    """Turn user input into a safe FTS5 query: all terms must match, `term*` matches a prefix."""
+    terms = []
+    for term in query.split():
+        prefix = term.endswith('*')
+        term = re.sub(r'[^\w]+', ' ', term).strip()
+        if term:
+            terms.append(f'"{term}"' + ('*' if prefix else ''))
+    return ' '.join(terms) or None
+
+
+def _chunks(ids: List[int], size: int = _ID_CHUNK) -> Iterable[List[int]]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+# Statement builders shared by `MainLogic` and `AsyncMainLogic`, which only
+# differ in how they execute them.
+
+def _count_deltas(changes: List[Tuple[str, str, int, Optional[int]]],
+                  added: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """Net rows each table gains by `changes`, plus `added` rows per table that they log as a 'reset'."""
+    deltas = dict(added or {})
+    for table, op, _, _ in changes:
+        if op == 'insert':
+            deltas[table] = deltas.get(table, 0) + 1
+        elif op == 'delete':
+            deltas[table] = deltas.get(table, 0) - 1
+        elif op == 'move':
+            deltas[table] = deltas.get(table, 0) - 1
+            deltas[_OTHER_TABLE[table]] = deltas.get(_OTHER_TABLE[table], 0) + 1
+    return deltas
+
+
+def _bump_versions_stmt(changes: List[Tuple[str, str, int, Optional[int]]], added: Optional[Dict[str, int]] = None):
+    """UPDATE of the counters for `changes`, returning the new values.
+
+    Bumps the version counter of every table touched and moves its row
+    counter by the rows it gained or lost, all in one statement.
+    """
+    tables = set()
+    for table, op, _, _ in changes:
+        tables.add(table)
+        if op == 'move':
+            tables.add(_OTHER_TABLE[table])
+    counts = {f"{table}.count": delta for table, delta in _count_deltas(changes, added).items() if delta}
+    step = case(counts, value=Counters.name, else_=1) if counts else 1
+    return (
+        update(Counters)
+        .where(Counters.name.in_([f"{table}.version" for table in tables] + list(counts)))
+        .values(value=Counters.value + step)
+        .returning(Counters.name, Counters.value)
+    )
+
+
+def _counters_stmt(kind: str, tables: Iterable[str]):
+    """SELECT of the `kind` ('version' or 'count') counters of `tables`."""
+    return select(Counters.name, Counters.value).where(Counters.name.in_([f"{table}.{kind}" for table in tables]))
+
+
+def _counter_values(tables: Iterable[str], rows) -> Dict[str, int]:
+    """``{table: value}`` from the rows of `_counters_stmt`, 0 for a counter that does not exist."""
+    values = {name.split('.', 1)[0]: value for name, value in rows}
+    return {table: values.get(table, 0) for table in tables}
+
+
+def _changelog_insert(changes: List[Tuple[str, str, int, Optional[int]]]):
+    """INSERT ... RETURNING rev for `changes`, with its parameter rows."""
+    return (
+        insert(ChangeLog).returning(ChangeLog.rev, sort_by_parameter_order=True),
+        [
+            {'table_name': table, 'op': op, 'row_id': row_id, 'target_id': target_id}
+            for table, op, row_id, target_id in changes
+        ],
+    )
+
+
+def _compaction_stmt(head_rev: int, count: int, config):
+    """DELETE of old change log entries when the head crossed a compaction point, else None."""
+    interval = config.get('CHANGELOG_COMPACT_INTERVAL', 1000)
+    if head_rev % interval >= count:
+        return None
+    retention = config.get('CHANGELOG_RETENTION', 10000)
+    return delete(ChangeLog).where(ChangeLog.rev <= head_rev - retention)
+
+
+# Oldest and newest revision in the change log, NULL for an empty log
+_LOG_BOUNDS_STMT = select(func.min(ChangeLog.rev), func.max(ChangeLog.rev))
+
+
+def _log_bounds(row) -> Tuple[int, int]:
+    """``(oldest_rev, head_rev)`` from the row of `_LOG_BOUNDS_STMT`, 0 for an empty log."""
+    return row[0] or 0, row[1] or 0
+
+
+def _delta_reachable(since_rev: int, oldest_rev: int, head_rev: int) -> bool:
+    """Whether the change log still holds every entry after `since_rev`, so a delta can be built from it."""
+    return 0 < since_rev <= head_rev and since_rev >= oldest_rev - 1
+
+
+def _delta_usable(entries, max_changes: int) -> bool:
+    """Whether `entries`, read with a limit of `max_changes + 1`, can be sent as a delta rather than a refetch."""
+    return len(entries) <= max_changes and not any(op == 'reset' for _, op, _, _ in entries)
+
+
+def _changes_body(head_rev: int, moved: List[Dict[str, Any]], row_ids: Dict[str, Tuple[List[int], List[int]]],
+                  rows: Dict[Any, List[Tuple[int, str]]]) -> Dict[str, Any]:
+    """`get_changes` result for the replayed entries (see `_replay_changes`) and the `rows` read for their inserts."""
+    changes: Dict[str, Any] = {'rev': head_rev, 'reset': False, 'moved': moved}
+    for model in (Tasks, Archived):
+        table = model.__tablename__
+        changes[table] = {
+            'upserted': [{'id': row_id, _TEXT_COLUMN[model]: value} for row_id, value in rows[model]],
+            'deleted': row_ids[table][1],
+        }
+    return changes
+
+
+def _batch_changes(results: Dict[str, Any]) -> List[Tuple[str, str, int, Optional[int]]]:
+    """Change log entries for the `apply_batch` results of the rows that were actually written."""
+    return (
+        [('Tasks', 'insert', new_id, None) for new_id in results['add']]
+        + [('Tasks', 'move', old_id, new_id) for old_id, new_id in results['archive'].items() if new_id]
+        + [('Archived', 'move', old_id, new_id) for old_id, new_id in results['unArchive'].items() if new_id]
+        + [('Archived', 'delete', old_id, None) for old_id, deleted in results['perm_delete'].items() if deleted]
+    )
+
+
+def _changes_stmt(since_rev: int, head_rev: int, limit: int):
+    return (
+        select(ChangeLog.table_name, ChangeLog.op, ChangeLog.row_id, ChangeLog.target_id)
+        .where(ChangeLog.rev > since_rev, ChangeLog.rev <= head_rev)
+        .order_by(ChangeLog.rev)
+        .limit(limit)
+    )
+
+
+def _events_stmt(after_rev: int, limit: int):
+    return (
+        select(ChangeLog.rev, ChangeLog.table_name, ChangeLog.op, ChangeLog.row_id, ChangeLog.target_id)
+        .where(ChangeLog.rev > after_rev)
+        .order_by(ChangeLog.rev)
+        .limit(limit)
+    )
+
+
+def _running_write_queue():
+    """The current app's write queue if it is running and the default database is in use, else None."""
+    write_queue = current_app.extensions.get('write_queue')
+    if write_queue is None or not write_queue.running or current_list.get() is not None:
+        return None
+    return write_queue
+
+
+def _replay_changes(entries) -> Tuple[Dict[str, Tuple[List[int], List[int]]], List[Dict[str, Any]]]:
+    """Replay change log entries so only the last state of every row counts.
+
+    Returns ``({table: (inserted ids, deleted ids)}, moves)``.
+    """
+    present: Dict[Tuple[str, int], bool] = {}
+    moved = []
+    for table, op, row_id, target_id in entries:
+        present[(table, row_id)] = op == 'insert'
+        if op == 'move':
+            present[(_OTHER_TABLE[table], target_id)] = True
+            moved.append({'from': table, 'id': row_id, 'to': _OTHER_TABLE[table], 'new_id': target_id})
+    rows = {}
+    for model in (Tasks, Archived):
+        table = model.__tablename__
+        rows[table] = (
+            sorted((row_id for (t, row_id), alive in present.items() if t == table and alive), reverse=True),
+            sorted(row_id for (t, row_id), alive in present.items() if t == table and not alive),
+        )
+    return rows, moved
+
+
+def _take_rows_stmt(model, ids: List[int]):
+    """DELETE ... RETURNING id, text, created_at of the rows of `model` with `ids`.
+
+    The first half of a move: reading and removing the rows is one statement,
+    so it takes the write lock before it looks at them and two concurrent
+    moves of one row cannot both see it.
+    """
+    text_column = getattr(model, _TEXT_COLUMN[model])
+    return delete(model).where(model.id.in_(ids)).returning(model.id, text_column, model.created_at)
+
+
+def _put_rows_stmt(model):
+    """INSERT ... RETURNING id into `model`, in parameter order; the second half of a move."""
+    return insert(model).returning(model.id, sort_by_parameter_order=True)
+
+
+def _moved_row(target, row) -> Dict[str, Any]:
+    """Parameters for `_put_rows_stmt` from a row taken by `_take_rows_stmt`; the creation time moves along."""
+    return {_TEXT_COLUMN[target]: row[1], 'created_at': row[2]}
+
+
+def _rows_by_id_stmt(model, ids: List[int]):
+    """SELECT id, text of the rows of `model` with `ids`, newest first."""
+    text_column = getattr(model, _TEXT_COLUMN[model])
+    return select(model.id, text_column).where(model.id.in_(ids)).order_by(model.id.desc())
+
+
+def _found_and_missing(ids: Iterable[int], rows) -> Tuple[List[Tuple[int, str]], List[int]]:
+    """The ``(id, text)`` rows of `ids` in request order without repeats, and the ids no row matched."""
+    by_id = {row[0]: (row[0], row[1]) for row in rows}
+    found, missing = [], []
+    for row_id in dict.fromkeys(ids):
+        if row_id in by_id:
+            found.append(by_id[row_id])
+        else:
+            missing.append(row_id)
+    return found, missing
+
+
+def _page_stmt(model, per_page: int, page: int, before_id: Optional[int], after_id: Optional[int]):
+    """Keyset page query on `model` when a bound is given, else an offset one.
+
+    Pages selected by `after_id` come out oldest first and have to be reversed.
+    """
+    query = select(model)
+    if after_id is not None:
+        return query.where(model.id > after_id).order_by(model.id.asc()).limit(per_page)
+    query = query.order_by(model.id.desc())
+    if before_id is not None:
+        query = query.where(model.id < before_id)
+    else:
+        query = query.offset((max(page, 1) - 1) * per_page)
+    return query.limit(per_page)
+
+
+def _build_row_page_stmts():
+    """Column-only page queries per table and kind, built once so every request reuses them.
+
+    They select from the Core tables and take their bounds as bound
+    parameters, so SQLAlchemy compiles each of them once and then only looks
+    the compiled form up in its statement cache.
+    """
+    stmts = {}
+    for model in (Tasks, Archived):
+        table = model.__table__
+        query = select(table.c.id, table.c[_TEXT_COLUMN[model]])
+        newest_first = query.order_by(table.c.id.desc()).limit(bindparam('limit'))
+        stmts[model, 'after'] = (
+            query.where(table.c.id > bindparam('bound')).order_by(table.c.id.asc()).limit(bindparam('limit'))
+        )
+        stmts[model, 'before'] = newest_first.where(table.c.id < bindparam('bound'))
+        stmts[model, 'offset'] = newest_first.offset(bindparam('offset'))
+    return stmts
+
+
+_ROW_PAGE_STMTS = _build_row_page_stmts()
+
+
+def _row_page_stmt(model, per_page: int, page: int, before_id: Optional[int], after_id: Optional[int]):
+    """`_page_stmt` returning ``(id, text)`` tuples: ``(statement, parameters)``."""
+    if after_id is not None:
+        return _ROW_PAGE_STMTS[model, 'after'], {'bound': after_id, 'limit': per_page}
+    if before_id is not None:
+        return _ROW_PAGE_STMTS[model, 'before'], {'bound': before_id, 'limit': per_page}
+    return _ROW_PAGE_STMTS[model, 'offset'], {'limit': per_page, 'offset': (max(page, 1) - 1) * per_page}
+
+
+# What a malformed import record raises in `_ImportBatch.add`
+_MALFORMED_RECORD = (ValueError, KeyError, TypeError, AttributeError)
+
+
+class _ImportBatch:
+    """Validated rows of an import per table, until `size` of them are due to be inserted.
+
+    Shared by `MainLogic.import_rows` and its async counterpart, which only
+    do the I/O.
+    """
+
+    def __init__(self, size: int, keep_ids: bool):
+        self.size = size
+        self.keep_ids = keep_ids
+        self.number = 0
+        self.first = 1
+        self.rows: Dict[Any, List[Dict[str, Any]]] = {Tasks: [], Archived: []}
+        self._ids: Dict[Any, set] = {Tasks: set(), Archived: set()}
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        """Queue the row of the next record; True once the batch is full. Raises one of `_MALFORMED_RECORD`."""
+        self.number += 1
+        model = {'task': Tasks, 'archive': Archived}.get(record.get('type'))
+        column = _TEXT_COLUMN.get(model)
+        if model is None or not isinstance(record.get(column), str):
+            raise ValueError(f"record {self.number} is not a task or archive")
+        row = {column: record[column][:255]}
+        if self.keep_ids:
+            row['id'] = int(record['id'])
+            # Caught here, a repeat within the batch is reported with its record number
+            if row['id'] in self._ids[model]:
+                raise ValueError(f"record {self.number} repeats {record['type']} id {row['id']}")
+            self._ids[model].add(row['id'])
+        self.rows[model].append(row)
+        return len(self.rows[Tasks]) + len(self.rows[Archived]) >= self.size
+
+    def conflict(self) -> str:
+        """Error for a batch the database rejected with an integrity error: an id that is already taken."""
+        last = self.first + len(self.rows[Tasks]) + len(self.rows[Archived]) - 1
+        return f"records {self.first}-{last} reuse an id that already exists"
+
+    def changes(self) -> Tuple[List[Tuple[str, str, int, Optional[int]]], Dict[str, int]]:
+        """Arguments of `_record_changes` for the batch: a reset of every table written to, and the rows added."""
+        return (
+            [(model.__tablename__, 'reset', 0, None) for model, rows in self.rows.items() if rows],
+            {model.__tablename__: len(rows) for model, rows in self.rows.items()},
+        )
+
+    def committed(self, counts: Dict[str, Any]) -> None:
+        """Add the batch to the import's `counts` and start the next one."""
+        counts['tasks'] += len(self.rows[Tasks])
+        counts['archives'] += len(self.rows[Archived])
+        self.first = self.number + 1
+        self.rows = {Tasks: [], Archived: []}
+        self._ids = {Tasks: set(), Archived: set()}
+
+
+def _search_sql(model, match: str, after: Optional[Tuple[float, int]], per_page: int) -> Tuple[str, Dict[str, Any]]:
+    """Ranked FTS5 query over `model` and its parameters."""
+    fts = f"{model.__tablename__}_fts"
+    column = _TEXT_COLUMN[model]
+    sql = f"SELECT rowid, {column}, rank FROM {fts} WHERE {fts} MATCH :match"
+    params: Dict[str, Any] = {'match': match, 'limit': per_page}
+    if after is not None:
+        sql += " AND (rank, rowid) > (:rank, :row_id)"
+        params.update(rank=after[0], row_id=after[1])
+    sql += " ORDER BY rank, rowid LIMIT :limit"
+    return sql, params
+
 class MainLogic:
     """
     Manager for Tasks.
@@ -17,11 +364,27 @@ class MainLogic:
         * permenently delete from `Archived`
     """
     
-    def __init__(self):
-        self.db_session = get_db_session()
-        
+    @property
+    def db_session(self):
+        """Session of the current list (see `lists.py`), else of the default database."""
+        return get_db_session()
+
+    @property
+    def read_model(self) -> Optional[TaskReadModel]:
+        """The app's in-memory copy of `Tasks` (see `read_model.py`), None if disabled or in a named list."""
+        return current_app.extensions.get('read_model') if current_list.get() is None else None
+
     def add_todo(self, detail: str) -> Optional[Tasks]:
-        """Add a new task."""
+        """Add a new task.
+
+        With the write queue running the insert is group-committed by its
+        writer thread, and the returned task is a detached copy. The queue
+        only serves the default database; named lists commit directly.
+        """
+        write_queue = _running_write_queue()
+        if write_queue is not None:
+            new_id = write_queue.submit('add', detail)
+            return Tasks(id=new_id, TODO=detail[:255]) if new_id is not None else None
         try:
             if len(detail) > 255:
                 detail = detail[:255]   # truncate
@@ -29,121 +392,478 @@ class MainLogic:
                 TODO=detail
             )
             self.db_session.add(task)
+            self.db_session.flush()
+            note_task_rows(self.db_session, [(task.id, detail)])
+            self._record_changes([('Tasks', 'insert', task.id, None)])
             self.db_session.commit()
             # Refresh the task to get the assigned ID
             self.db_session.refresh(task)
+            current_app.logger.info("Task %s added.", task.id)
             return task
         except SQLAlchemyError as e:
             self.db_session.rollback()
-            current_app.logger.error(f"Failed to insert new task {e}") # Changed app.logger to current_app.logger
+            current_app.logger.error("Failed to insert new task %s", e) # Changed app.logger to current_app.logger
             return None
 
     def archive(self, target_id:int) -> Optional[Archived]:
-        """Archive a task."""
-        task = self.db_session.query(Tasks).filter_by(id=target_id).first()
+        """Archive a task. Returns the new archive entry, detached, or None if the task does not exist.
+
+        With the write queue running, integer ids are group-committed by its
+        writer thread and the returned entry only carries the new `id`.
+        """
+        write_queue = _running_write_queue()
+        if write_queue is not None and isinstance(target_id, int) and not isinstance(target_id, bool):
+            new_id = write_queue.submit('archive', target_id)
+            if new_id is None:
+                current_app.logger.warning("Task with id %s not found for archiving.", target_id)
+                return None
+            return Archived(id=new_id)
+        moved = self._move_one(Tasks, Archived, target_id)
+        return Archived(id=moved[0], Finished=moved[1]) if moved else None
 
-        if not task:
-            current_app.logger.warning(f"Task with id {target_id} not found for archiving.") # Changed app.logger to current_app.logger
+    def unArchive(self, target_id: int) ->Optional[Tasks]:
+        """UnArchive from the Archived Table. Returns the restored task, detached, or None."""
+        moved = self._move_one(Archived, Tasks, target_id)
+        return Tasks(id=moved[0], TODO=moved[1]) if moved else None
+
+    def _move_one(self, source, target, target_id: int) -> Optional[Tuple[int, str]]:
+        """Move one row with a DELETE ... RETURNING and an INSERT ... RETURNING; ``(new id, text)`` or None."""
+        try:
+            # The session keeps its default synchronization here, so a copy of the row
+            # loaded earlier in this session is marked deleted rather than left stale
+            found = self.db_session.execute(_take_rows_stmt(source, [target_id])).first()
+            if found is None:
+                self.db_session.rollback()
+                current_app.logger.warning("%s row %s not found for moving.", source.__tablename__, target_id)
+                return None
+            value = found[1]
+            new_id = self.db_session.execute(_put_rows_stmt(target), [_moved_row(target, found)]).scalar_one()
+            if target is Tasks:
+                note_task_rows(self.db_session, [(new_id, value)])
+            self._record_changes([(source.__tablename__, 'move', target_id, new_id)])
+            self.db_session.commit()
+        except SQLAlchemyError as e:
+            self.db_session.rollback()
+            current_app.logger.error("Failed to move %s row %s: %s", source.__tablename__, target_id, e)
             return None
-        
-        content = task.TODO
-        
+        current_app.logger.info("%s row %s moved to %s as %s.", source.__tablename__, target_id, target.__tablename__, new_id)
+        return new_id, value
+
+    def perm_delete(self, target_id: int) -> bool:
+        """Permanently remove a task. Returns True on success, False otherwise."""
         try:
-            self.db_session.delete(task)
-            new_archive_entry = Archived(Finished=content)
-            self.db_session.add(new_archive_entry)
+            # DELETE ... RETURNING, so of concurrent deletes of one archive only the one that removed it logs it;
+            # the default synchronization also drops a loaded copy of the row from the session
+            gone = self.db_session.execute(delete(Archived).where(Archived.id == target_id).returning(Archived.id))
+            if gone.scalar() is None:
+                self.db_session.rollback()
+                current_app.logger.warning("Archived task with id %s not found for permanent deletion.", target_id)
+                return False
+            self._record_changes([('Archived', 'delete', target_id, None)])
+            self.db_session.commit()
+        except SQLAlchemyError as e:
+            self.db_session.rollback()
+            current_app.logger.error("Failed to permanently delete archived task %s: %s", target_id, e)
+            return False
+        current_app.logger.info("Archived task %s permanently deleted.", target_id)
+        return True
+        
+    def purge_archives(self, archived_before: Optional[int] = None, keep_newest: Optional[int] = None,
+                       limit: int = 500) -> Optional[int]:
+        """Permanently delete up to `limit` archives in one short transaction.
 
+        Deletes archives with `archived_at` before `archived_before` (Unix
+        time) and those beyond the `keep_newest` most recent ones. Returns how
+        many were deleted, 0 once nothing is left to purge, or None on error.
+        Deletions are logged like `perm_delete`, so clients see them in delta
+        syncs and change events.
+        """
+        conditions = []
+        if archived_before is not None:
+            conditions.append(Archived.archived_at < archived_before)
+        if keep_newest is not None:
+            newest_kept = (select(Archived.id).order_by(Archived.id.desc())
+                           .offset(max(keep_newest, 0)).limit(1).scalar_subquery())
+            conditions.append(Archived.id <= newest_kept)
+        if not conditions:
+            return 0
+        oldest = select(Archived.id).where(or_(*conditions)).order_by(Archived.id).limit(limit)
+        try:
+            ids = self.db_session.execute(
+                delete(Archived).where(Archived.id.in_(oldest)).returning(Archived.id),
+                execution_options={'synchronize_session': False},
+            ).scalars().all()
+            self._record_changes([('Archived', 'delete', archive_id, None) for archive_id in ids])
             self.db_session.commit()
-            current_app.logger.info(f"Task {target_id} archived successfully.") # Changed app.logger to current_app.logger
-            return new_archive_entry
         except SQLAlchemyError as e:
             self.db_session.rollback()
-            current_app.logger.error(f"Failed to archive task {target_id}: {e}") # Changed app.logger to current_app.logger
+            current_app.logger.error("Failed to purge archives: %s", e)
             return None
-        
-    def unArchive(self, target_id: int) ->Optional[Tasks]:
-        """UnArchive from the Archived Table"""
-        task = self.db_session.query(Archived).filter_by(id=target_id).first()
+        return len(ids)
+
+    def _record_changes(self, changes: List[Tuple[str, str, int, Optional[int]]],
+                        added: Optional[Dict[str, int]] = None) -> None:
+        """Log `changes` and update the counters of the tables involved, in the current transaction.
+
+        Each change is ``(table, op, row_id, target_id)`` where op is 'insert',
+        'delete' or 'move'; for a move, `target_id` is the row's id in the other table.
+        A 'reset' op marks bulk changes that clients can only pick up by refetching;
+        the rows they inserted per table are passed in `added` for the row counters.
+        """
+        if not changes:
+            return
+        versions = dict(self.db_session.execute(_bump_versions_stmt(changes, added)).all())
+        revs = self.db_session.execute(*_changelog_insert(changes)).scalars().all()
+        queue_events(self.db_session, changes, revs)
+        queue_task_delta(self.db_session, changes, versions)
+        head_rev = revs[-1]
+        # Compact whenever the head crosses a multiple of the interval
+        compaction = _compaction_stmt(head_rev, len(changes), current_app.config)
+        if compaction is not None:
+            self.db_session.execute(compaction)
+
+    def get_head_rev(self) -> int:
+        """Get the latest change revision, 0 if nothing was logged yet."""
+        return self.db_session.execute(select(func.max(ChangeLog.rev))).scalar() or 0
+
+    def get_changes(self, since_rev: int) -> Optional[Dict[str, Any]]:
+        """Net changes to both tables after revision `since_rev`.
 
-        if not task:
-            current_app.logger.warning(f"Archived Task with id {target_id} not found for unArchiving.")
+        Returns the head revision with the rows inserted since (still present),
+        the ids deleted since and the moves between the tables. ``reset`` is
+        True instead when the client has to refetch everything: it has no
+        revision yet, the entries it needs were compacted away, or a bulk
+        import happened since.
+        """
+        try:
+            oldest_rev, head_rev = _log_bounds(self.db_session.execute(_LOG_BOUNDS_STMT).one())
+            if not _delta_reachable(since_rev, oldest_rev, head_rev):
+                return {'rev': head_rev, 'reset': True}
+            max_changes = current_app.config.get('CHANGELOG_MAX_DELTA', 5000)
+            entries = self.db_session.execute(_changes_stmt(since_rev, head_rev, max_changes + 1)).all()
+            if not _delta_usable(entries, max_changes):
+                return {'rev': head_rev, 'reset': True}
+
+            row_ids, moved = _replay_changes(entries)
+            rows: Dict[Any, List[Tuple[int, str]]] = {Tasks: [], Archived: []}
+            for model in rows:
+                for chunk in _chunks(row_ids[model.__tablename__][0]):
+                    rows[model] += self.db_session.execute(_rows_by_id_stmt(model, chunk)).all()
+            return _changes_body(head_rev, moved, row_ids, rows)
+        except SQLAlchemyError as e:
+            current_app.logger.error("Failed to read changes since revision %s: %s", since_rev, e)
             return None
-        
-        content = task.Finished
 
+    def get_events(self, after_rev: int, limit: int) -> Optional[List[Tuple[int, Dict[str, Any]]]]:
+        """Up to `limit` change events after revision `after_rev`, oldest first.
+
+        Returns None when the change log no longer reaches back to `after_rev`
+        (or it is ahead of the log), so the client has to refetch.
+        """
+        try:
+            oldest_rev, head_rev = _log_bounds(self.db_session.execute(_LOG_BOUNDS_STMT).one())
+            if after_rev < oldest_rev - 1 or after_rev > head_rev:
+                return None
+            rows = self.db_session.execute(_events_stmt(after_rev, limit)).all()
+        except SQLAlchemyError as e:
+            current_app.logger.error("Failed to read events after revision %s: %s", after_rev, e)
+            return None
+        return [(rev, change_event(*change)) for rev, *change in rows]
+
+    def get_versions(self, *tables: str) -> Optional[Dict[str, int]]:
+        """Get the change counters of `tables` with a single primary-key lookup."""
+        return self._get_counters('version', tables)
+
+    def get_counts(self, *tables: str) -> Optional[Dict[str, int]]:
+        """Get the number of rows in `tables` from their row counters, without scanning them."""
+        return self._get_counters('count', tables)
+
+    def _get_counters(self, kind: str, tables: Iterable[str]) -> Optional[Dict[str, int]]:
         try:
-            self.db_session.delete(task)
-            restore_entry = Tasks(TODO=content)
-            self.db_session.add(restore_entry)
+            rows = self.db_session.execute(_counters_stmt(kind, tables)).all()
+        except SQLAlchemyError as e:
+            current_app.logger.error("Failed to read %s counters: %s", kind, e)
+            return None
+        return _counter_values(tables, rows)
+
+    def apply_batch(self, add: Iterable[str] = (), archive: Iterable[int] = (),
+                    unarchive: Iterable[int] = (), perm_delete: Iterable[int] = ()) -> Optional[Dict[str, Any]]:
+        """Apply many mutations in a single transaction.
 
+        Sections run in the order add, archive, unarchive, perm_delete. Returns
+        a dict with the new task ids for `add`, a ``{id: new_id or None}`` map for
+        the moves and a ``{id: deleted}`` map for `perm_delete`, or None if the
+        whole batch was rolled back.
+        """
+        try:
+            results = {
+                'add': self._insert_tasks(add),
+                'archive': self._move_rows(Tasks, Archived, archive),
+                'unArchive': self._move_rows(Archived, Tasks, unarchive),
+                'perm_delete': self._delete_rows(Archived, perm_delete),
+            }
+            self._record_changes(_batch_changes(results))
             self.db_session.commit()
-            current_app.logger.info(f"Task {target_id} unArchived succesfully.")
-            return restore_entry
-        
         except SQLAlchemyError as e:
             self.db_session.rollback()
-            current_app.logger.error(f"Failed to unArchived task with id {target_id}: {e}")
+            current_app.logger.error("Failed to apply batch: %s", e)
             return None
+        current_app.logger.info(
+            "Batch applied: %d added, %d archived, %d unArchived, %d deleted.", len(results['add']),
+            len(results['archive']), len(results['unArchive']), len(results['perm_delete']),
+        )
+        return results
 
+    def _insert_tasks(self, details: Iterable[str]) -> List[int]:
+        """Insert tasks with one executemany and return their ids in order.
 
-    def perm_delete(self, target_id: int) -> bool:
-        """Permanently remove a task. Returns True on success, False otherwise."""
-        archive_entry = self.db_session.query(Archived).filter_by(id=target_id).first()
-        if archive_entry:
+        SQLAlchemy sends an executemany with RETURNING as multi-row INSERT
+        statements of up to the engine's `insertmanyvalues_page_size` rows.
+        """
+        rows = [{'TODO': detail[:255]} for detail in details]
+        if not rows:
+            return []
+        stmt = insert(Tasks).returning(Tasks.id, sort_by_parameter_order=True)
+        ids = list(self.db_session.execute(stmt, rows).scalars())
+        note_task_rows(self.db_session, zip(ids, (row['TODO'] for row in rows)))
+        return ids
+
+    def _move_rows(self, source, target, ids: Iterable[int]) -> Dict[int, Optional[int]]:
+        """Move rows from `source` to `target` set-wise; maps each id to its new id (None if missing)."""
+        ids = list(dict.fromkeys(ids))
+        moved: Dict[int, Optional[int]] = dict.fromkeys(ids)
+        for chunk in _chunks(ids):
+            found = sorted(self.db_session.execute(
+                _take_rows_stmt(source, chunk),
+                execution_options={'synchronize_session': False},
+            ).all())
+            if not found:
+                continue
+            new_ids = self.db_session.execute(
+                _put_rows_stmt(target), [_moved_row(target, row) for row in found]
+            ).scalars().all()
+            moved.update(zip((row[0] for row in found), new_ids))
+            if target is Tasks:
+                note_task_rows(self.db_session, zip(new_ids, (row[1] for row in found)))
+        return moved
+
+    def _delete_rows(self, model, ids: Iterable[int]) -> Dict[int, bool]:
+        """Delete rows by id set-wise; maps each id to whether it existed."""
+        ids = list(dict.fromkeys(ids))
+        deleted = dict.fromkeys(ids, False)
+        for chunk in _chunks(ids):
+            gone = self.db_session.execute(
+                delete(model).where(model.id.in_(chunk)).returning(model.id),
+                execution_options={'synchronize_session': False},
+            ).scalars()
+            deleted.update(dict.fromkeys(gone, True))
+        return deleted
+
+    def export_rows(self) -> Iterator[Tuple[str, int, str]]:
+        """Yield ``(kind, id, text)`` for every task, then every archive, in id order.
+
+        Rows are streamed from the database `yield_per` at a time, so memory
+        use does not grow with the table size.
+        """
+        batch = current_app.config.get('EXPORT_YIELD_PER', 1000)
+        for kind, model in (('task', Tasks), ('archive', Archived)):
+            text_column = getattr(model, _TEXT_COLUMN[model])
+            result = self.db_session.execute(
+                select(model.id, text_column).order_by(model.id).execution_options(yield_per=batch)
+            )
+            for row_id, value in result:
+                yield kind, row_id, value
+
+    def import_rows(self, records: Iterable[Dict[str, Any]], keep_ids: bool = False) -> Dict[str, Any]:
+        """Insert exported records, committing every `IMPORT_BATCH_SIZE` rows.
+
+        Records look like the output of `export_rows`: ``{"type": "task", "TODO": ...}``
+        or ``{"type": "archive", "Finished": ...}``, with an optional ``id`` that
+        is only used when `keep_ids` is set. Returns the number of rows imported
+        per table and an ``error`` message if the import stopped early, with
+        ``failed`` set when the database rather than the input was at fault.
+        Rows before the one that failed are kept; an id that is already taken
+        fails its whole batch, which the error names by record numbers.
+        """
+        counts = {'tasks': 0, 'archives': 0, 'error': None, 'failed': False}
+        batch = _ImportBatch(current_app.config.get('IMPORT_BATCH_SIZE', 5000), keep_ids)
+
+        def flush():
             try:
-                self.db_session.delete(archive_entry)
+                for model, rows in batch.rows.items():
+                    if rows:
+                        # Core executemany on the connection skips the ORM bulk-insert bookkeeping
+                        self.db_session.connection().execute(insert(model.__table__), rows)
+                self._record_changes(*batch.changes())
                 self.db_session.commit()
-                current_app.logger.info(f"Archived task {target_id} permanently deleted.") # Changed app.logger to current_app.logger
-                return True
+            except IntegrityError as e:
+                self.db_session.rollback()
+                current_app.logger.warning("Import batch rejected: %s", e)
+                counts['error'] = batch.conflict()
+                return False
             except SQLAlchemyError as e:
                 self.db_session.rollback()
-                current_app.logger.error(f"Failed to permanently delete archived task {target_id}: {e}") # Changed app.logger to current_app.logger
+                current_app.logger.error("Failed to import batch: %s", e)
+                counts['error'] = 'Failed to import batch'
+                counts['failed'] = True
                 return False
-        else:
-            current_app.logger.warning(f"Archived task with id {target_id} not found for permanent deletion.") # Changed app.logger to current_app.logger
-            return False
-        
-    def get_tasks(self, page: int = 1) -> List[Tasks]:
-        """Get a paginated list of tasks."""
-        per_page = current_app.config.get('TASKS_PER_PAGE', 10) # Use app config
-        offset = (page - 1) * per_page
-        try:
-            tasks = (
-                self.db_session.query(Tasks)
-                .order_by(Tasks.id.desc())
-                .offset(offset)
-                .limit(per_page)
-                .all()
-            )
-            return tasks
+            batch.committed(counts)
+            return True
+
+        try:
+            for record in records:
+                if batch.add(record) and not flush():
+                    break
+            else:
+                flush()
+        except _MALFORMED_RECORD as e:
+            counts['error'] = str(e) or 'malformed record'
+            flush()
+
+        current_app.logger.info("Imported %s tasks and %s archives.", counts['tasks'], counts['archives'])
+        return counts
+
+    def search(self, model, match: str, after: Optional[Tuple[float, int]] = None) -> Optional[List[Tuple[int, str, float]]]:
+        """Full-text search in `model`, best match first.
+
+        `match` is an FTS5 query (see `fts_query`); `after` is the ``(rank, id)``
+        of the last hit of the previous page. Returns ``(id, text, rank)``
+        tuples, or None if the search index is unavailable.
+        """
+        sql, params = _search_sql(model, match, after, current_app.config.get('TASKS_PER_PAGE', 10))
+        try:
+            return [tuple(row) for row in self.db_session.execute(text(sql), params)]
+        except SQLAlchemyError as e:
+            current_app.logger.error("Failed to search %s_fts: %s", model.__tablename__, e)
+            return None
+
+    def get_tasks(self, page: int = 1, before_id: Optional[int] = None,
+                  after_id: Optional[int] = None) -> List[Tasks]:
+        """Get a page of tasks, newest first.
+
+        ``before_id``/``after_id`` select a keyset page and take precedence over
+        ``page``, which is kept for older clients.
+        """
+        try:
+            return self._paginate(Tasks, page, before_id, after_id)
         except SQLAlchemyError as e:
-            current_app.logger.error(f"Failed to fetch tasks: {e}") # Changed app.logger to current_app.logger
+            current_app.logger.error("Failed to fetch tasks: %s", e) # Changed app.logger to current_app.logger
             return []
         
-    def get_archives(self, page: int = 1) -> List[Archived]:
-        """Get a paginated list of archived tasks."""
+    def get_archives(self, page: int = 1, before_id: Optional[int] = None,
+                     after_id: Optional[int] = None) -> List[Archived]:
+        """Get a page of archived tasks, newest first. See `get_tasks`."""
+        try:
+            return self._paginate(Archived, page, before_id, after_id)
+        except SQLAlchemyError as e:
+            current_app.logger.error("Failed to fetch archived tasks: %s", e) # Changed app.logger to current_app.logger
+            return []
+
+    def _paginate(self, model, page: int, before_id: Optional[int], after_id: Optional[int]) -> List[Any]:
+        """Run a keyset page query on `model` when a bound is given, else an offset one.
+
+        Keyset pages seek straight to the bound through the primary key, so
+        their cost does not depend on how deep into the table they are.
+        """
         per_page = current_app.config.get('TASKS_PER_PAGE', 10) # Use app config
-        offset = (page - 1) * per_page
-        try:
-            archivs = (
-                self.db_session.query(Archived)
-                .order_by(Archived.id.desc())
-                .offset(offset)
-                .limit(per_page)
-                .all()
-            )
-            return archivs
+        rows = self.db_session.scalars(_page_stmt(model, per_page, page, before_id, after_id)).all()
+        if after_id is not None:
+            rows.reverse()
+        return rows
+
+    def get_task_rows(self, page: int = 1, before_id: Optional[int] = None, after_id: Optional[int] = None,
+                      version: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Like `get_tasks`, but ``(id, TODO)`` tuples read through Core, for encoding straight to JSON.
+
+        Given the `Tasks` version the request read, the page comes from the
+        read model when that is at the same version.
+        """
+        read_model = self.read_model
+        if read_model is not None and version is not None:
+            rows = read_model.page(version, current_app.config.get('TASKS_PER_PAGE', 10), page, before_id, after_id)
+            if rows is not None:
+                return rows
+        return self._page_rows(Tasks, page, before_id, after_id)
+
+    def get_archive_rows(self, page: int = 1, before_id: Optional[int] = None,
+                         after_id: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Like `get_archives`, but ``(id, Finished)`` tuples."""
+        return self._page_rows(Archived, page, before_id, after_id)
+
+    def _page_rows(self, model, page: int, before_id: Optional[int], after_id: Optional[int]) -> List[Tuple[int, str]]:
+        per_page = current_app.config.get('TASKS_PER_PAGE', 10)
+        stmt, params = _row_page_stmt(model, per_page, page, before_id, after_id)
+        try:
+            rows = self.db_session.connection().execute(stmt, params).all()
         except SQLAlchemyError as e:
-            current_app.logger.error(f"Failed to fetch archived tasks: {e}") # Changed app.logger to current_app.logger
+            current_app.logger.error("Failed to fetch %s: %s", model.__tablename__, e)
             return []
+        if after_id is not None:
+            rows.reverse()
+        return rows
+
+    @contextmanager
+    def read_snapshot(self):
+        """Run the reads of the block in one read transaction, so they all see the same state.
+
+        SQLite starts a transaction only for writes, so without this every
+        SELECT sees the database as of its own start. The snapshot is taken
+        by the first read in the block and ended by a rollback; writers are
+        not blocked meanwhile (WAL). Other databases read at the isolation
+        level of the engine, within the session's transaction.
+        """
+        session = self.db_session
+        conn = session.connection()
+        if conn.dialect.name == 'sqlite' and not conn.connection.dbapi_connection.in_transaction:
+            conn.exec_driver_sql('BEGIN')
+        try:
+            yield
+        finally:
+            session.rollback()
+
+    def read_model_version(self) -> Optional[int]:
+        """The `Tasks` version for the task reads of a `read_snapshot` block; None without a read model."""
+        if self.read_model is None:
+            return None
+        versions = self.get_versions('Tasks')
+        return versions and versions['Tasks']
+
+    def get_rows_by_id(self, model, ids: Iterable[int],
+                       version: Optional[int] = None) -> Optional[Tuple[List[Tuple[int, str]], List[int]]]:
+        """``(id, text)`` rows of `model` with `ids`, in request order, and the ids that were not found.
+
+        The ids are looked up with one ``IN (...)`` query per `_ID_CHUNK`, or
+        in the read model for tasks at `version` (see `get_task_rows`).
+        Returns None on a database error.
+        """
+        ids = list(dict.fromkeys(ids))
+        read_model = self.read_model
+        if model is Tasks and read_model is not None and version is not None:
+            found = read_model.lookup(version, ids)
+            if found is not None:
+                return found
+        rows = []
+        try:
+            for chunk in _chunks(ids):
+                rows += self.db_session.execute(_rows_by_id_stmt(model, chunk)).all()
+        except SQLAlchemyError as e:
+            current_app.logger.error("Failed to fetch %s by id: %s", model.__tablename__, e)
+            return None
+        return _found_and_missing(ids, rows)
 
-    def get_task_by_id(self, task_id: int) -> Optional[Tasks]:
-        """Get a specific task by ID."""
+    def get_task_by_id(self, task_id: int, version: Optional[int] = None) -> Optional[Tasks]:
+        """Get a specific task by ID; a detached copy when it comes from the read model at `version`."""
+        read_model = self.read_model
+        if (read_model is not None and version is not None
+                and isinstance(task_id, int) and not isinstance(task_id, bool)):
+            found = read_model.lookup(version, [task_id])
+            if found is not None:
+                return Tasks(id=task_id, TODO=found[0][0][1]) if found[0] else None
         try:
             task = self.db_session.query(Tasks).filter_by(id=task_id).first()
             return task
         except SQLAlchemyError as e:
-            current_app.logger.error(f"Failed to fetch task {task_id}: {e}")
+            current_app.logger.error("Failed to fetch task %s: %s", task_id, e)
             return None
 
     def get_archive_by_id(self, archive_id: int) -> Optional[Archived]:
@@ -152,6 +872,6 @@ class MainLogic:
             archive = self.db_session.query(Archived).filter_by(id=archive_id).first()
             return archive
         except SQLAlchemyError as e:
-            current_app.logger.error(f"Failed to fetch archive {archive_id}: {e}")
+            current_app.logger.error("Failed to fetch archive %s: %s", archive_id, e)
             return None
 
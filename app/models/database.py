@@ -1,38 +1,338 @@
-from sqlalchemy import Column, Integer, String, create_engine
+import contextvars
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import Column, Integer, String, create_engine, event, func, insert, inspect, literal, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 import os
 from ..config import Config
+from .migrations import migrate, stamp
 
-engine = create_engine(Config.DATABASE_URI, connect_args={"check_same_thread" : False})
-db_session = scoped_session(sessionmaker(autoflush=False, bind=engine))
+
+def _is_memory_uri(uri: str) -> bool:
+    return uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def _sqlite_pragmas(config, in_memory: bool) -> List[Tuple[str, Any]]:
+    """PRAGMAs applied to every new SQLite connection, in order."""
+    pragmas = []
+    if not in_memory:
+        # WAL lets readers run alongside the single writer and only fsyncs at checkpoints.
+        pragmas.append(('journal_mode', config.SQLITE_JOURNAL_MODE))
+        pragmas.append(('mmap_size', config.SQLITE_MMAP_SIZE))
+    pragmas += [
+        ('synchronous', config.SQLITE_SYNCHRONOUS),
+        ('busy_timeout', config.SQLITE_BUSY_TIMEOUT_MS),
+        ('cache_size', config.SQLITE_CACHE_SIZE),
+        ('temp_store', config.SQLITE_TEMP_STORE),
+    ]
+    return pragmas
+
+
+def build_engine(config=Config) -> Engine:
+    """Create the engine for `config.DATABASE_URI`.
+
+    SQLite connections get the PRAGMAs from `config` on connect; file databases
+    use a QueuePool sized by `DB_POOL_SIZE`/`DB_MAX_OVERFLOW`/`DB_POOL_RECYCLE`.
+    In-memory databases keep SQLAlchemy's default single-connection pool.
+    """
+    uri = config.DATABASE_URI
+    if not uri.startswith('sqlite'):
+        return create_engine(
+            uri,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+
+    in_memory = _is_memory_uri(uri)
+    kwargs = {}
+    if not in_memory:
+        kwargs = dict(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+    engine = create_engine(uri, connect_args={"check_same_thread" : False}, **kwargs)
+    pragmas = _sqlite_pragmas(config, in_memory)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # auto_vacuum can only be chosen before the file is first written, and setting it on a
+            # database that exists takes the write lock, so only new files get it; older ones need
+            # a full VACUUM to switch (see `maintenance.full_vacuum`)
+            if not cursor.execute("PRAGMA page_count").fetchone()[0]:
+                cursor.execute(f"PRAGMA auto_vacuum={config.SQLITE_AUTO_VACUUM}")
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    return engine
+
+
+def describe_engine(engine: Engine) -> Dict[str, Any]:
+    """Report the pool and the PRAGMA values actually in effect on a connection."""
+    settings: Dict[str, Any] = {
+        'url': engine.url.render_as_string(hide_password=True),
+        'pool': type(engine.pool).__name__,
+    }
+    if isinstance(engine.pool, QueuePool):
+        settings['pool_size'] = engine.pool.size()
+        settings['pool_status'] = engine.pool.status()
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            for name in ('journal_mode', 'synchronous', 'busy_timeout',
+                         'cache_size', 'mmap_size', 'temp_store'):
+                settings[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+    return settings
+
+
+# The named list (see `lists.py`) the running request or command works on; None for the default database
+current_list = contextvars.ContextVar('todo_current_list', default=None)
 
 Base = declarative_base()
-Base.query = db_session.query_property()
+
+def epoch_seconds() -> int:
+    """Current time as stored in the timestamp columns."""
+    return int(time.time())
 
 class Tasks(Base):
     """TODO List Table"""
     __tablename__ = "Tasks"
     id = Column(Integer, primary_key=True)
     TODO = Column(String(255), unique=False, nullable=False)
+    created_at = Column(Integer, nullable=True, default=epoch_seconds)     # Unix time; kept across archiving
 
 class Archived(Base):
     """Archived Tasks"""
     __tablename__ = "Archived"
     id = Column(Integer, primary_key=True)
     Finished = Column(String(255), unique=False, nullable=False)
+    created_at = Column(Integer, nullable=True, default=epoch_seconds)
+    archived_at = Column(Integer, nullable=True, default=epoch_seconds, index=True)
+
+class Counters(Base):
+    """Named integer counters: `Tasks.version` bumped on every change to `Tasks`, `Tasks.count` its rows."""
+    __tablename__ = "Counters"
+    name = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class ChangeLog(Base):
+    """One row per change to `Tasks`/`Archived`, numbered by a never-reused revision."""
+    __tablename__ = "ChangeLog"
+    __table_args__ = {'sqlite_autoincrement': True}
+    rev = Column(Integer, primary_key=True)
+    table_name = Column(String(16), nullable=False)     # 'Tasks' or 'Archived'
+    op = Column(String(8), nullable=False)              # 'insert', 'delete' or 'move'
+    row_id = Column(Integer, nullable=False)
+    target_id = Column(Integer, nullable=True)          # id in the other table after a 'move'
+
+# Counters created by `init_db`.
+COUNTER_NAMES = ('Tasks.version', 'Archived.version')
+
+# Row counters kept by every write, so counting never scans: counter name -> table.
+ROW_COUNTERS = {'Tasks.count': Tasks, 'Archived.count': Archived}
+
+# Full-text index on the text column of each table: (table, column, FTS5 table).
+SEARCH_INDEXES = (('Tasks', 'TODO', 'Tasks_fts'), ('Archived', 'Finished', 'Archived_fts'))
+
+
+def _search_index_ddl(table: str, column: str, fts: str) -> List[str]:
+    """External-content FTS5 table over `table`.`column`, kept in sync by triggers."""
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{column}, content='{table}', content_rowid='id', prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+    ]
+
+
+def init_search_index(conn, rebuild: bool = False) -> bool:
+    """Create the FTS5 indexes and their triggers if missing, filling new ones from existing rows.
+
+    Returns False when the database is not SQLite or lacks FTS5; search is
+    then unavailable but everything else works.
+    """
+    if conn.dialect.name != 'sqlite':
+        return False
+    existing = set(conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%_fts'"
+    ).scalars())
+    try:
+        for table, column, fts in SEARCH_INDEXES:
+            for statement in _search_index_ddl(table, column, fts):
+                conn.exec_driver_sql(statement)
+            if rebuild or fts not in existing:
+                conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    except OperationalError as e:
+        if 'fts5' not in str(e):
+            raise
+        return False
+    return True
+
+
+@event.listens_for(Base.metadata, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    """Drop the FTS tables with the tables they index, so a recreated schema starts empty."""
+    if connection.dialect.name == 'sqlite':
+        for _, _, fts in SEARCH_INDEXES:
+            connection.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+
+
+def init_db(bind: Optional[Engine] = None, config=Config):
+    """Create missing tables and bring the schema up to date; `bind` defaults to the current database.
+
+    A new database is created with the current schema. An existing one gets
+    its pending migrations (see `migrations.py`) if `config.MIGRATE_ON_STARTUP`
+    is set, and is otherwise left to ``manage.py migrate``.
+    """
+    bind = bind if bind is not None else get_engine()
+    fresh = not inspect(bind).has_table(Tasks.__tablename__)
+    Base.metadata.create_all(bind=bind)
+    if fresh:
+        stamp(bind)
+    elif config.MIGRATE_ON_STARTUP:
+        migrate(bind, config.MIGRATION_BATCH_SIZE, config.MIGRATION_BATCH_PAUSE_MS / 1000)
+    with bind.begin() as conn:
+        existing = set(conn.execute(select(Counters.name)).scalars())
+        missing = [{'name': name, 'value': 0} for name in COUNTER_NAMES if name not in existing]
+        if missing:
+            conn.execute(insert(Counters), missing)
+        for name, model in ROW_COUNTERS.items():
+            # Counted once, when a database from before the row counters is first opened
+            if name not in existing:
+                conn.execute(insert(Counters).from_select(
+                    ['name', 'value'], select(literal(name), func.count()).select_from(model)))
+        init_search_index(conn)
+
+
+def recount_rows(bind: Engine) -> Dict[str, Tuple[int, int]]:
+    """Recompute the row counters with ``COUNT(*)``, returning ``{name: (old, new)}`` for each.
+
+    Runs under the write lock, so no write lands between the count and the
+    update. Tables whose counter was wrong also get their version bumped, so
+    cached responses and conditional requests pick up the corrected totals.
+    """
+    with bind.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+        old = dict(conn.execute(select(Counters.name, Counters.value)
+                                .where(Counters.name.in_(list(ROW_COUNTERS)))).all())
+        result = {}
+        for name, model in ROW_COUNTERS.items():
+            new = conn.execute(select(func.count()).select_from(model)).scalar()
+            result[name] = (old.get(name, 0), new)
+            if name not in old:
+                conn.execute(insert(Counters).values(name=name, value=new))
+            elif old[name] != new:
+                conn.execute(update(Counters).where(Counters.name == name).values(value=new))
+            if old.get(name) != new:
+                conn.execute(update(Counters)
+                             .where(Counters.name == f"{model.__tablename__}.version")
+                             .values(value=Counters.value + 1))
+        conn.commit()
+    return result
+
+
+class Database:
+    """Engine and thread-local sessions of an app's default database, created on first use.
+
+    `create_app` puts one in ``app.extensions['database']`` for the
+    `DATABASE_URI` of its config. Nothing connects until the first query,
+    which builds the engine and runs `init_db`, so creating an app that
+    never touches the database, e.g. in a test, costs next to nothing.
+    Every session gets a copy of `session_info` as its ``info``.
+    """
+
+    def __init__(self, config=Config):
+        self.config = config
+        self.session_info: Dict[str, Any] = {}
+        self._engine: Optional[Engine] = None
+        self._session: Optional[scoped_session] = None
+        self._on_create: List[Callable[[Engine], None]] = []
+        self._lock = threading.Lock()
+
+    def on_create(self, callback: Callable[[Engine], None]) -> None:
+        """Call `callback` with the engine once it is created, or right away if it already is."""
+        if self._engine is not None:
+            callback(self._engine)
+        else:
+            self._on_create.append(callback)
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            self._create()
+        return self._engine
+
+    @property
+    def session(self) -> scoped_session:
+        if self._engine is None:
+            self._create()
+        return self._session
+
+    def _create(self) -> None:
+        with self._lock:
+            if self._engine is not None:
+                return
+            engine = build_engine(self.config)
+            init_db(engine, self.config)
+            for callback in self._on_create:
+                callback(engine)
+            self._session = scoped_session(sessionmaker(autoflush=False, bind=engine, info=self.session_info))
+            self._engine = engine
+
+    def remove_session(self) -> None:
+        """Close this thread's session, if the database was ever used."""
+        if self._session is not None:
+            self._session.remove()
+
+    def dispose(self) -> None:
+        """Close all connections; the next query starts over with a new engine."""
+        with self._lock:
+            if self._session is not None:
+                self._session.remove()
+            if self._engine is not None:
+                self._engine.dispose()
+            self._engine = self._session = None
 
 
+def get_database() -> Database:
+    """The default database of the current app."""
+    return current_app.extensions['database']
 
-def init_db():
-    """Initialize the database by creating all tables."""
-    Base.metadata.create_all(bind=engine)
+def get_engine() -> Engine:
+    """Get the database engine of the current list, or of the app's default database."""
+    current = current_list.get()
+    return current.engine if current is not None else get_database().engine
 
 def get_db_session():
-    """Get a database session."""
-    return db_session
+    """Get the (thread-local) database session of the current list, or of the app's default database."""
+    current = current_list.get()
+    return current.session if current is not None else get_database().session
 
 def close_db_session():
-    """Close the database session."""
-    db_session.remove()
+    """Close the database session, without connecting a database that was never used."""
+    current = current_list.get()
+    if current is not None:
+        current.session.remove()
+    else:
+        get_database().remove_session()
 
+def current_list_key() -> Optional[str]:
+    """Key of the list being worked on, None for the default database."""
+    current = current_list.get()
+    return current.key if current is not None else None
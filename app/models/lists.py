@@ -0,0 +1,207 @@
+"""
+Named lists, each kept in its own SQLite file.
+
+Requests under ``/api/lists/<key>/`` run the regular API against the list
+`key`, stored in ``LISTS_DIR/<key>.db`` with the same schema as the default
+database. Every list has its own file and therefore its own write lock, so
+writes to different lists never wait for each other.
+
+The app's `ListRegistry` (``app.extensions['list_registry']``) opens the
+engine of a list the first time it is used. A list is leased for as long as
+a request (including a streamed response) or a command works on it. Lists
+nobody holds are closed once they have been idle for `LISTS_IDLE_SECONDS`,
+and least recently used first whenever more than `LISTS_MAX_OPEN` are open,
+so memory depends on `LISTS_MAX_OPEN` rather than on how many lists exist.
+
+While a list is leased through `use_list` (or by the blueprint), it is the
+`current_list` and `get_db_session`/`get_engine` return its session and
+engine.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from .database import build_engine, current_list, init_db
+
+# Keys are used as file names: letters, digits, '-' and '_' only
+LIST_KEY = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class ListDatabase:
+    """Engine and thread-local sessions of one list, opened on first use."""
+
+    def __init__(self, key: str, path: str, registry: 'ListRegistry'):
+        self.key = key
+        self.path = path
+        self.registry = registry
+        self.engine: Optional[Engine] = None
+        self.session: Optional[scoped_session] = None
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self._opening = threading.Lock()
+
+    def open(self, config, on_open: Optional[Callable[[Engine], None]], session_info: Dict[str, Any]) -> bool:
+        """Create the engine and schema unless already done; True if this call opened it."""
+        with self._opening:
+            if self.engine is not None:
+                return False
+            list_config = type('ListConfig', (config,), {'DATABASE_URI': 'sqlite:///' + self.path})
+            engine = build_engine(list_config)
+            init_db(engine, list_config)
+            if on_open is not None:
+                on_open(engine)
+            self.session = scoped_session(sessionmaker(autoflush=False, bind=engine,
+                                                       info=dict(session_info, list=self.key)))
+            self.engine = engine
+            return True
+
+    def close(self) -> None:
+        if self.engine is not None:
+            self.engine.dispose()
+
+
+class ListRegistry:
+    """Leases `ListDatabase`s by key and bounds how many stay open."""
+
+    def __init__(self):
+        self._open: "OrderedDict[str, ListDatabase]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._config = None
+        self._on_open: Optional[Callable[[Engine], None]] = None
+        self._session_info: Dict[str, Any] = {}
+        self.directory = ''
+        self.max_open = 64
+        self.idle_seconds = 300.0
+        self.opened = 0
+        self.closed = 0
+
+    def configure(self, app, on_open: Optional[Callable[[Engine], None]] = None,
+                  session_info: Optional[Dict[str, Any]] = None) -> None:
+        """Apply `LISTS_*` settings; closes lists opened under a previous configuration.
+
+        `on_open` is called with the engine of every list opened, e.g. to
+        instrument it for metrics. The sessions of every list get a copy of
+        `session_info`, with the list key added, as their ``info``.
+        """
+        self.close_all()
+        self.opened = self.closed = 0
+        self.directory = app.config.get('LISTS_DIR', 'lists')
+        self.max_open = app.config.get('LISTS_MAX_OPEN', 64)
+        self.idle_seconds = app.config.get('LISTS_IDLE_SECONDS', 300)
+        self._on_open = on_open
+        self._session_info = session_info or {}
+        # Engine settings of the app, with the smaller pool and cache meant for many open files
+        settings = {name: value for name, value in app.config.items() if name.isupper()}
+        settings.update(
+            DB_POOL_SIZE=app.config.get('LISTS_POOL_SIZE', 2),
+            DB_MAX_OVERFLOW=app.config.get('LISTS_MAX_OVERFLOW', 8),
+            SQLITE_CACHE_SIZE=app.config.get('LISTS_SQLITE_CACHE_SIZE', -2000),
+        )
+        self._config = type('ListEngineConfig', (), settings)
+
+    def acquire(self, key: str) -> ListDatabase:
+        """Lease list `key`, creating its database on first use. Raises ValueError for an invalid key."""
+        if not LIST_KEY.match(key):
+            raise ValueError(f'invalid list key {key!r}')
+        with self._lock:
+            db = self._open.get(key)
+            if db is None:
+                db = self._open[key] = ListDatabase(key, os.path.join(self.directory, f'{key}.db'), self)
+            self._open.move_to_end(key)
+            db.leases += 1
+            closing = self._take_evictable()
+        self._close(closing)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if db.open(self._config, self._on_open, self._session_info):
+                with self._lock:
+                    self.opened += 1
+        except Exception:
+            self.release(db)
+            raise
+        return db
+
+    def release(self, db: ListDatabase) -> None:
+        """End a lease taken with `acquire`, closing this thread's session of the list."""
+        if db.session is not None:
+            db.session.remove()
+        with self._lock:
+            db.leases -= 1
+            db.last_used = time.monotonic()
+            closing = self._take_evictable()
+        self._close(closing)
+
+    def _take_evictable(self) -> List[ListDatabase]:
+        """Remove and return the unleased lists to close: idle too long, or beyond `max_open`. Needs the lock."""
+        now = time.monotonic()
+        excess = len(self._open) - self.max_open
+        closing = []
+        for db in self._open.values():  # least recently used first
+            if db.leases:
+                continue
+            if excess > 0 or now - db.last_used >= self.idle_seconds:
+                closing.append(db)
+                excess -= 1
+        for db in closing:
+            del self._open[db.key]
+        self.closed += len(closing)
+        return closing
+
+    @staticmethod
+    def _close(dbs: List[ListDatabase]) -> None:
+        for db in dbs:
+            db.close()
+
+    def close_all(self) -> None:
+        """Close every open list. Only for shutdown and tests: leased lists are closed too."""
+        with self._lock:
+            closing = list(self._open.values())
+            self._open.clear()
+        self._close(closing)
+
+    def open_keys(self) -> List[str]:
+        with self._lock:
+            return list(self._open)
+
+    def metrics(self) -> Dict[str, Tuple[str, str, float]]:
+        """Registry counters in the `extra` format of `Metrics.render`."""
+        with self._lock:
+            return {
+                'todo_lists_open': ('gauge', 'Named lists with an open engine.', len(self._open)),
+                'todo_lists_opened_total': ('counter', 'Named list engines opened.', self.opened),
+                'todo_lists_closed_total': ('counter', 'Named list engines closed as idle or least recently used.', self.closed),
+            }
+
+
+def enter_list(key: str) -> ListDatabase:
+    """Lease list `key` from the current app's registry and make it the current list. Pair with `exit_list`."""
+    db = current_app.extensions['list_registry'].acquire(key)
+    current_list.set(db)
+    return db
+
+
+def exit_list(db: ListDatabase) -> None:
+    """Undo `enter_list`: back to the default database, lease released. Needs no app context."""
+    current_list.set(None)
+    db.registry.release(db)
+
+
+@contextmanager
+def use_list(key: Optional[str]) -> Iterator[Optional[ListDatabase]]:
+    """Work on list `key` inside the block; None keeps the default database."""
+    if key is None:
+        yield None
+        return
+    db = enter_list(key)
+    try:
+        yield db
+    finally:
+        exit_list(db)
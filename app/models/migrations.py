@@ -0,0 +1,182 @@
+"""
+Versioned schema migrations.
+
+`create_all` only creates missing tables, so columns and indexes added to
+existing tables reach older databases through the `MIGRATIONS` below. Each
+has a version; applied versions are recorded in the ``schema_version``
+table along with how long each of their steps took.
+
+Migrations run in steps that each hold the write lock briefly, so a large
+database stays usable while it is upgraded: adding a column is a schema-only
+change in SQLite, and backfills update `MIGRATION_BATCH_SIZE` rows per
+transaction, walking the rowid range, with a pause of
+`MIGRATION_BATCH_PAUSE_MS` in between. Building an index cannot be split
+and holds the lock for one pass over its table.
+
+Steps are written to be safe to repeat, so a run that was interrupted is
+simply started again. A database created from scratch already has the
+current schema and gets every version recorded without running anything.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, insert, inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+# Kept out of `Base.metadata`: dropping the application tables leaves the bookkeeping alone
+schema_version = Table(
+    'schema_version', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(64), nullable=False),
+    Column('applied_at', Integer, nullable=False),     # Unix time
+    Column('seconds', Float, nullable=False),
+    Column('steps', Text, nullable=True),              # JSON list of the step reports
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    steps: Sequence[Callable[['MigrationRunner'], None]]
+
+
+class MigrationRunner:
+    """Runs the steps of migrations against `engine` and reports on each."""
+
+    def __init__(self, engine: Engine, batch_size: int = 10000, pause: float = 0.005):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.pause = pause
+        self.steps: List[Dict[str, Any]] = []
+        self._current: Optional[Dict[str, Any]] = None
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[Dict[str, Any]]:
+        """Time one step; its report counts rows, transactions and the longest of them."""
+        report = {'step': name, 'rows': 0, 'batches': 0, 'lock_max_ms': 0.0, 'seconds': 0.0}
+        self._current = report
+        started = time.perf_counter()
+        try:
+            yield report
+        finally:
+            report['seconds'] = round(time.perf_counter() - started, 3)
+            self._current = None
+            self.steps.append(report)
+            logger.info("Migration step %s: %d rows in %d transactions, %.2f s (write lock held at most %.1f ms)",
+                        name, report['rows'], report['batches'], report['seconds'], report['lock_max_ms'])
+
+    def execute(self, sql: str) -> int:
+        """Run `sql` in a transaction of its own; returns the rows it changed."""
+        started = time.perf_counter()
+        with self.engine.begin() as conn:
+            rowcount = conn.exec_driver_sql(sql).rowcount
+        held_ms = (time.perf_counter() - started) * 1000
+        if self._current is not None:
+            self._current['batches'] += 1
+            self._current['rows'] += max(rowcount, 0)
+            self._current['lock_max_ms'] = round(max(self._current['lock_max_ms'], held_ms), 3)
+        return rowcount
+
+    def columns(self, table: str) -> List[str]:
+        with self.engine.connect() as conn:
+            return [info['name'] for info in inspect(conn).get_columns(table)]
+
+    def add_column(self, table: str, column: str, ddl_type: str) -> None:
+        """``ALTER TABLE ... ADD COLUMN`` unless `table` has `column` already."""
+        with self.step(f'add {table}.{column}'):
+            if column not in self.columns(table):
+                self.execute(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl_type}')
+
+    def backfill(self, table: str, column: str, value: str) -> None:
+        """Set `column` to the SQL expression `value` where it is NULL, one rowid range per transaction."""
+        with self.step(f'backfill {table}.{column}'):
+            with self.engine.connect() as conn:
+                low, high = conn.exec_driver_sql(f'SELECT min(rowid), max(rowid) FROM "{table}"').one()
+            if low is None:
+                return
+            for start in range(low, high + 1, self.batch_size):
+                self.execute(
+                    f'UPDATE "{table}" SET {column} = {value} '
+                    f'WHERE rowid >= {start} AND rowid < {start + self.batch_size} AND {column} IS NULL'
+                )
+                time.sleep(self.pause)
+
+    def create_index(self, name: str, table: str, columns: str) -> None:
+        with self.step(f'index {name}'):
+            self.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({columns})')
+
+
+def _timestamps(runner: MigrationRunner) -> None:
+    # Rows older than the columns get the time of the upgrade, so retention counts their age from then
+    for table, column in (('Tasks', 'created_at'), ('Archived', 'created_at'), ('Archived', 'archived_at')):
+        runner.add_column(table, column, 'INTEGER')
+        runner.backfill(table, column, str(int(time.time())))
+
+
+def _archived_at_index(runner: MigrationRunner) -> None:
+    runner.create_index('ix_Archived_archived_at', 'Archived', 'archived_at')
+
+
+# In order; never edit or renumber one that has been released, add a new one instead
+MIGRATIONS = (
+    Migration(1, 'timestamps', (_timestamps,)),
+    Migration(2, 'archived_at index', (_archived_at_index,)),
+)
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    schema_version.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return list(conn.execute(select(schema_version.c.version).order_by(schema_version.c.version)).scalars())
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    """The `MIGRATIONS` not yet applied to the database of `engine`."""
+    applied = set(applied_versions(engine))
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+def _record(engine: Engine, migration: Migration, seconds: float, steps: Optional[List[Dict[str, Any]]]) -> None:
+    row = {'version': migration.version, 'name': migration.name, 'applied_at': int(time.time()),
+           'seconds': round(seconds, 3), 'steps': json.dumps(steps) if steps is not None else None}
+    try:
+        with engine.begin() as conn:
+            conn.execute(insert(schema_version), [row])
+    except IntegrityError:
+        pass    # another process finished the same migration meanwhile
+
+
+def stamp(engine: Engine) -> None:
+    """Record every migration as applied, for a database just created with the current schema."""
+    for migration in pending_migrations(engine):
+        _record(engine, migration, 0.0, None)
+
+
+def migrate(engine: Engine, batch_size: int = 10000, pause: float = 0.005) -> List[Dict[str, Any]]:
+    """Apply the pending migrations in order; returns a report per migration, with its steps."""
+    reports = []
+    for migration in pending_migrations(engine):
+        logger.info("Applying schema migration %s (%s)", migration.version, migration.name)
+        runner = MigrationRunner(engine, batch_size, pause)
+        started = time.perf_counter()
+        for apply in migration.steps:
+            apply(runner)
+        seconds = time.perf_counter() - started
+        _record(engine, migration, seconds, runner.steps)
+        reports.append({'version': migration.version, 'name': migration.name,
+                        'seconds': round(seconds, 3), 'steps': runner.steps})
+    return reports
+
+
+def migration_history(engine: Engine) -> List[Dict[str, Any]]:
+    """Rows of ``schema_version``, oldest first, with their step reports decoded."""
+    schema_version.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        rows = conn.execute(select(schema_version).order_by(schema_version.c.version)).mappings().all()
+    return [dict(row, steps=json.loads(row['steps']) if row['steps'] else []) for row in rows]
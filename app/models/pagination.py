@@ -0,0 +1,66 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Lists are ordered newest first by ``id``, so a page is addressed by the id it
+starts before (older items) or after (newer items) instead of an offset.
+Cursors handed to clients are opaque strings wrapping one of those bounds.
+"""
+import base64
+from typing import Optional, Sequence, Tuple
+
+
+def encode_cursor(before_id: Optional[int] = None, after_id: Optional[int] = None) -> str:
+    """Encode a keyset bound as an opaque cursor string."""
+    if before_id is not None:
+        raw = f"b:{int(before_id)}"
+    elif after_id is not None:
+        raw = f"a:{int(after_id)}"
+    else:
+        raise ValueError("a cursor needs before_id or after_id")
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[int], Optional[int]]:
+    """Decode a cursor into ``(before_id, after_id)``. Raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        kind, _, value = base64.urlsafe_b64decode(padded.encode()).decode().partition(":")
+        bound = int(value)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"invalid cursor {cursor!r}") from e
+    if kind == "b":
+        return bound, None
+    if kind == "a":
+        return None, bound
+    raise ValueError(f"invalid cursor {cursor!r}")
+
+
+def next_cursor(ids: Sequence[int], per_page: int, after_id: Optional[int] = None) -> Optional[str]:
+    """Cursor for the page following ``ids`` (newest first), or None when exhausted.
+
+    Pages fetched with ``after_id`` walk towards newer items, every other page
+    walks towards older ones.
+    """
+    if len(ids) < per_page or not ids:
+        return None
+    if after_id is not None:
+        return encode_cursor(after_id=ids[0])
+    return encode_cursor(before_id=ids[-1])
+
+
+def encode_search_cursor(rank: float, row_id: int) -> str:
+    """Encode the position after a ranked search hit as an opaque cursor."""
+    raw = f"s:{rank!r}:{int(row_id)}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode a search cursor into ``(rank, id)``. Raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        kind, rank, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        if kind != "s":
+            raise ValueError(kind)
+        return float(rank), int(row_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"invalid cursor {cursor!r}") from e
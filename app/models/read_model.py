@@ -0,0 +1,341 @@
+"""
+In-memory read model of the active tasks.
+
+With `READ_MODEL_ENABLED`, the ``Tasks`` table of the default database is
+kept in memory as two parallel arrays sorted by id: the ids in an
+``array('q')`` and the texts in a list. Task pages (offset or keyset, newest
+first) and lookups by id are answered from them by binary search, without a
+query.
+
+The model is read in one read transaction when the app's engine is created,
+and is then kept current by the writes themselves: `_record_changes` notes
+what a transaction does to ``Tasks`` together with the ``Tasks.version`` it
+bumped the counter to, and the model applies that once the session commits,
+in version order. A request only uses the model when it is at exactly the
+``Tasks.version`` the request read (the one its ETag is built from, or the
+one its `/sync` snapshot sees) and reads from SQLite otherwise. Writes by
+another process or a bulk import therefore never make it answer with stale
+rows; they only send reads to SQL until the model is reloaded.
+
+A background thread reloads the model when requests find it behind the
+database, and every `READ_MODEL_CHECK_INTERVAL_SECONDS` compares it with the
+database, counting and logging any difference before taking the database's
+rows over. If the rows would take more than `READ_MODEL_MAX_BYTES` (an
+estimate of the arrays and the text objects) the model is dropped and SQL
+serves until a later check finds the table small enough again.
+
+Named lists (see `lists.py`) are not covered and always read from SQL.
+"""
+import bisect
+import logging
+import sys
+import threading
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .database import Counters, Tasks, _is_memory_uri
+
+logger = logging.getLogger(__name__)
+
+# Per row, besides its text object: a slot in the id array and a pointer in the text list
+_ROW_BYTES = 16
+# Deltas held for versions that cannot be applied yet; beyond this the missing one is given up on
+_MAX_PENDING = 1000
+# Once a request found the model behind, commits in flight get this long to arrive before a reload
+_RELOAD_DELAY = 0.5
+
+
+class TaskDelta(NamedTuple):
+    """What one transaction did to ``Tasks``, which it left at `version`.
+
+    `rows` are ``(id, text)`` for rows put into ``Tasks`` and ``(id, None)``
+    for rows taken out of it, in the order the transaction made the changes.
+    """
+    version: int
+    rows: List[Tuple[int, Optional[str]]]
+    reset: bool     # changes the model cannot follow, such as a bulk import
+
+
+class _Snapshot(NamedTuple):
+    version: int
+    ids: array
+    texts: List[str]
+    size: int
+
+
+def _read_tasks(engine: Engine, max_bytes: int) -> Optional[_Snapshot]:
+    """``Tasks`` and its version as of one read transaction; None if the rows exceed `max_bytes`."""
+    with engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            # SQLite starts no transaction for reads; without one the rows could be newer than the version
+            conn.exec_driver_sql('BEGIN')
+        version = conn.execute(select(Counters.value).where(Counters.name == 'Tasks.version')).scalar() or 0
+        ids, texts, size = array('q'), [], 0
+        for row_id, value in conn.execute(select(Tasks.id, Tasks.TODO).order_by(Tasks.id)):
+            size += _ROW_BYTES + sys.getsizeof(value)
+            if size > max_bytes:
+                return None
+            ids.append(row_id)
+            texts.append(value)
+    return _Snapshot(version, ids, texts, size)
+
+
+class TaskReadModel:
+    """Id-sorted copy of ``Tasks`` at a known ``Tasks.version``; see the module docstring."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, check_interval: float = 60.0):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.version: Optional[int] = None      # None while nothing usable is loaded
+        self.over_budget = False
+        self._ids = array('q')
+        self._texts: List[str] = []
+        self._bytes = 0
+        self._pending: Dict[int, TaskDelta] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.mismatches = 0
+
+    @property
+    def rows(self) -> int:
+        return len(self._ids)
+
+    def _usable(self, version: Optional[int]) -> bool:
+        """Whether the model can answer a read made at `version`; counts the outcome. Needs the lock."""
+        if version is not None and version == self.version:
+            self.hits += 1
+            return True
+        self.misses += 1
+        if not self.over_budget and (self.version is None or (version is not None and version > self.version)):
+            self._wake.set()
+        return False
+
+    def _index(self, row_id: int) -> Optional[int]:
+        i = bisect.bisect_left(self._ids, row_id)
+        return i if i < len(self._ids) and self._ids[i] == row_id else None
+
+    def page(self, version: Optional[int], per_page: int, page: int = 1, before_id: Optional[int] = None,
+             after_id: Optional[int] = None) -> Optional[List[Tuple[int, str]]]:
+        """The ``(id, TODO)`` rows `MainLogic.get_task_rows` returns, or None if not at `version`."""
+        with self._lock:
+            if not self._usable(version):
+                return None
+            ids = self._ids
+            if after_id is not None:
+                low = bisect.bisect_right(ids, after_id)
+                high = min(low + per_page, len(ids))
+            else:
+                if before_id is not None:
+                    high = bisect.bisect_left(ids, before_id)
+                else:
+                    high = max(len(ids) - (max(page, 1) - 1) * per_page, 0)
+                low = max(high - per_page, 0)
+            return [(ids[i], self._texts[i]) for i in range(high - 1, low - 1, -1)]
+
+    def lookup(self, version: Optional[int], ids: Iterable[int]) -> Optional[Tuple[List[Tuple[int, str]], List[int]]]:
+        """Rows with `ids` in request order and the ids not found, or None if not at `version`."""
+        with self._lock:
+            if not self._usable(version):
+                return None
+            found, missing = [], []
+            for row_id in dict.fromkeys(ids):
+                i = self._index(row_id)
+                if i is None:
+                    missing.append(row_id)
+                else:
+                    found.append((row_id, self._texts[i]))
+        return found, missing
+
+    def apply(self, deltas: Iterable[TaskDelta]) -> None:
+        """Take committed `deltas`; each is applied once every version before it has been."""
+        with self._lock:
+            for delta in deltas:
+                if self.version is None or delta.version > self.version:
+                    self._pending[delta.version] = delta
+            self._drain()
+
+    def _drain(self) -> None:
+        while self.version is not None and self.version + 1 in self._pending:
+            delta = self._pending.pop(self.version + 1)
+            if delta.reset:
+                self._drop()
+                self._wake.set()
+                break
+            self._apply(delta)
+        if len(self._pending) > _MAX_PENDING:
+            # A version that never arrives was written elsewhere; a reload gets past it
+            self._pending.clear()
+            self._wake.set()
+
+    def _apply(self, delta: TaskDelta) -> None:
+        for row_id, value in delta.rows:
+            i = self._index(row_id)
+            if i is not None:
+                self._bytes -= _ROW_BYTES + sys.getsizeof(self._texts[i])
+                del self._ids[i]
+                del self._texts[i]
+            if value is not None:
+                # New ids are usually the largest, which makes this an append
+                i = len(self._ids) if not self._ids or row_id > self._ids[-1] else bisect.bisect_left(self._ids, row_id)
+                self._ids.insert(i, row_id)
+                self._texts.insert(i, value)
+                self._bytes += _ROW_BYTES + sys.getsizeof(value)
+        self.version = delta.version
+        if self._bytes > self.max_bytes:
+            logger.warning("Read model over READ_MODEL_MAX_BYTES (%d bytes); serving tasks from SQL.", self._bytes)
+            self._drop(over_budget=True)
+
+    def _drop(self, over_budget: bool = False) -> None:
+        self.version = None
+        self.over_budget = over_budget
+        self._ids, self._texts, self._bytes = array('q'), [], 0
+
+    def load(self, engine: Engine) -> bool:
+        """Read ``Tasks`` from `engine` and take it over; True if the model serves afterwards.
+
+        A model at the version the database is at is compared with it first:
+        a difference is counted in `mismatches` and logged, then replaced.
+        """
+        snapshot = _read_tasks(engine, self.max_bytes)
+        with self._lock:
+            if snapshot is None:
+                if not self.over_budget:
+                    logger.warning("Tasks exceed READ_MODEL_MAX_BYTES (%d); serving tasks from SQL.", self.max_bytes)
+                self._drop(over_budget=True)
+                return False
+            if self.version is not None and self.version > snapshot.version:
+                return True     # commits applied meanwhile; compared at the next check
+            if self.version == snapshot.version:
+                if self._ids == snapshot.ids and self._texts == snapshot.texts:
+                    return True
+                self.mismatches += 1
+                logger.warning("Read model differs from the database at Tasks version %s; reloading.", self.version)
+            self._ids, self._texts, self._bytes = snapshot.ids, snapshot.texts, snapshot.size
+            self.version = snapshot.version
+            self.over_budget = False
+            self.loads += 1
+            for version in [version for version in self._pending if version <= self.version]:
+                del self._pending[version]
+            self._drain()
+        return True
+
+    def _behind(self, engine: Engine) -> bool:
+        with engine.connect() as conn:
+            version = conn.execute(select(Counters.value).where(Counters.name == 'Tasks.version')).scalar() or 0
+        current = self.version
+        return current is None or current < version
+
+    def start(self, engine: Engine) -> None:
+        """Load the model and start the thread that reloads and checks it; a `Database.on_create` callback.
+
+        In-memory databases have a connection per thread, so they get no thread.
+        """
+        try:
+            self.load(engine)
+        except SQLAlchemyError as e:
+            logger.error("Failed to load the read model: %s", e)
+        if _is_memory_uri(str(engine.url)):
+            return
+        self.stop()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, args=(engine,), name='read-model', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread.join()
+
+    def _run(self, engine: Engine) -> None:
+        while not self._stopping.is_set():
+            woken = self._wake.wait(self.check_interval)
+            if self._stopping.is_set():
+                return
+            try:
+                if not woken:
+                    self.load(engine)
+                    continue
+                self._wake.clear()
+                if self._stopping.wait(_RELOAD_DELAY):
+                    return
+                if self._behind(engine):
+                    self.load(engine)
+            except SQLAlchemyError as e:
+                logger.error("Failed to refresh the read model: %s", e)
+
+    def metrics(self) -> Dict[str, Tuple[str, str, float]]:
+        """Read model gauges and counters in the `extra` format of `Metrics.render`."""
+        with self._lock:
+            return {
+                'todo_read_model_rows': ('gauge', 'Tasks held by the read model.', len(self._ids)),
+                'todo_read_model_bytes': ('gauge', 'Estimated memory used by the read model.', self._bytes),
+                'todo_read_model_hits_total': ('counter', 'Task reads answered by the read model.', self.hits),
+                'todo_read_model_misses_total': ('counter', 'Task reads sent to SQL because the read model '
+                                                            'was not at the version read.', self.misses),
+                'todo_read_model_loads_total': ('counter', 'Times the read model was loaded from the database.',
+                                                self.loads),
+                'todo_read_model_mismatches_total': ('counter', 'Checks that found the read model different '
+                                                                'from the database.', self.mismatches),
+            }
+
+
+def read_model_metrics(model: Optional[TaskReadModel]) -> Dict[str, Tuple[str, str, float]]:
+    """`TaskReadModel.metrics`, or nothing when the read model is disabled."""
+    return model.metrics() if model is not None else {}
+
+
+def note_task_rows(session, rows: Iterable[Tuple[int, str]]) -> None:
+    """Remember the text of rows the session's transaction put into ``Tasks``, for `queue_task_delta`."""
+    if session.info.get('read_model') is not None:
+        session.info.setdefault('task_rows', {}).update(rows)
+
+
+def queue_task_delta(session, changes: List[Tuple[str, str, int, Optional[int]]], versions: Dict[str, int]) -> None:
+    """Hold what `changes` do to ``Tasks`` for the session's read model until the session commits.
+
+    `versions` are the counters `_record_changes` bumped, by name.
+    """
+    rows = session.info.pop('task_rows', {})
+    if session.info.get('read_model') is None or 'Tasks.version' not in versions:
+        return
+    delta: List[Tuple[int, Optional[str]]] = []
+    reset = False
+    for table, op, row_id, target_id in changes:
+        if table == 'Archived':
+            if op == 'move':
+                delta.append((target_id, rows.get(target_id)))
+                reset = reset or target_id not in rows
+        elif op == 'insert':
+            delta.append((row_id, rows.get(row_id)))
+            reset = reset or row_id not in rows
+        elif op in ('move', 'delete'):
+            delta.append((row_id, None))
+        else:
+            reset = True
+    session.info.setdefault('task_deltas', []).append(TaskDelta(versions['Tasks.version'], delta, reset))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_task_deltas(session):
+    deltas = session.info.pop('task_deltas', None)
+    if deltas:
+        session.info['read_model'].apply(deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_task_deltas(session):
+    session.info.pop('task_deltas', None)
+    session.info.pop('task_rows', None)
@@ -0,0 +1,153 @@
+"""
+Group commit for single-item writes.
+
+With `WRITE_QUEUE_ENABLED`, `MainLogic.add_todo` and `archive` hand their
+work to the app's `WriteQueue` (``app.extensions['write_queue']``) and its
+one writer thread instead of committing it themselves. The writer takes what
+is queued, up to `WRITE_QUEUE_MAX_BATCH` items, waiting at most
+`WRITE_QUEUE_MAX_DELAY_MS` for more to arrive, and applies it with
+`MainLogic.apply_batch`: one transaction, one commit and one fsync for the
+whole batch. Each caller blocks until its batch has committed and gets its
+own result back.
+
+A batch is one transaction, so when it fails its items are retried one by
+one and only the item that fails again gets None. The queue holds at most
+`WRITE_QUEUE_SIZE` items; callers beyond that wait for room.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _Pending:
+    """One queued write and, once its batch committed, its result."""
+
+    __slots__ = ('op', 'value', 'result', 'done')
+
+    def __init__(self, op: str, value: Any):
+        self.op = op
+        self.value = value
+        self.result: Optional[int] = None
+        self.done = threading.Event()
+
+
+class WriteQueue:
+    """Feeds `add`/`archive` requests to a writer thread that commits them in batches."""
+
+    def __init__(self):
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self.max_batch = 256
+        self.max_delay = 0.002
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def configure(self, app) -> None:
+        """Apply `WRITE_QUEUE_*` settings; starts the writer if enabled, stops a previous one."""
+        self.stop()
+        self.batches = self.items = 0
+        if not app.config.get('WRITE_QUEUE_ENABLED', False):
+            return
+        self.max_batch = app.config.get('WRITE_QUEUE_MAX_BATCH', 256)
+        self.max_delay = app.config.get('WRITE_QUEUE_MAX_DELAY_MS', 2) / 1000
+        self._queue = queue.Queue(app.config.get('WRITE_QUEUE_SIZE', 10000))
+        self._thread = threading.Thread(target=self._run, args=(app,), name='write-queue', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Commit what is queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = self._queue = None
+
+    def submit(self, op: str, value: Any) -> Optional[int]:
+        """Queue one write and wait for its batch.
+
+        `op` is ``'add'`` (value: description; returns the new task id) or
+        ``'archive'`` (value: task id; returns the new archive id, or None if
+        the task does not exist). Returns None as well if the batch failed.
+        """
+        pending = _Pending(op, value)
+        self._queue.put(pending)
+        pending.done.wait()
+        return pending.result
+
+    def _run(self, app) -> None:
+        with app.app_context():
+            stopping = False
+            while not stopping:
+                batch: List[_Pending] = []
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                batch.append(item)
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._flush(batch)
+
+    def _flush(self, batch: List[_Pending]) -> None:
+        if not self._apply(batch) and len(batch) > 1:
+            # Isolate the item that broke the transaction; the others still commit
+            logger.warning("Write queue batch of %d items failed; retrying them one by one", len(batch))
+            for pending in batch:
+                self._apply([pending])
+        for pending in batch:
+            pending.done.set()
+
+    def _apply(self, batch: List[_Pending]) -> bool:
+        """Commit `batch` in one transaction and fill in the results; False if it failed."""
+        from .models import MainLogic, close_db_session
+        adds = [pending for pending in batch if pending.op == 'add']
+        archives = [pending for pending in batch if pending.op == 'archive']
+        try:
+            results = MainLogic().apply_batch(
+                add=[pending.value for pending in adds],
+                archive=[pending.value for pending in archives],
+            )
+        except Exception:
+            logger.exception("Write queue batch of %d items failed", len(batch))
+            results = None
+        finally:
+            close_db_session()
+
+        if results is not None:
+            for pending, new_id in zip(adds, results['add']):
+                pending.result = new_id
+            # A task archived twice in one batch moved once: only the first request gets it
+            claimed = set()
+            for pending in archives:
+                if pending.value not in claimed:
+                    pending.result = results['archive'].get(pending.value)
+                    claimed.add(pending.value)
+            self.batches += 1
+            self.items += len(batch)
+        return results is not None
+
+    def metrics(self) -> Dict[str, Tuple[str, str, float]]:
+        """Writer counters in the `extra` format of `Metrics.render`."""
+        return {
+            'todo_write_queue_batches_total': ('counter', 'Batches committed by the write queue.', self.batches),
+            'todo_write_queue_items_total': ('counter', 'Writes committed by the write queue.', self.items),
+            'todo_write_queue_depth': ('gauge', 'Writes waiting for the write queue.',
+                                       self._queue.qsize() if self._queue is not None else 0),
+        }
@@ -0,0 +1,10 @@
+from app.asgi import create_asgi_app
+import os
+
+app = create_asgi_app()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.environ.get("PORT", app.config.get("PORT", 5000)))
+    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
@@ -0,0 +1,133 @@
+"""
+Read latency while the write path is saturated, with and without admission control.
+
+    python benchmarks/bench_admission.py [--rows 10000] [--seconds 10] [--readers 4] [--writers 64]
+                                         [--synchronous FULL] [--seed 1] [--output results.json]
+                                         [--baseline old.json]
+
+Serves the app from a local threaded WSGI server, like `run.py`, with a
+commit per write and `SQLITE_SYNCHRONOUS=--synchronous`. For `--seconds`,
+`--readers` client threads request task and archive pages and `/api/sync`
+back to back, while `--writers` threads post `/api/add` back to back. A
+writer that gets `503` waits for its `Retry-After`, as a well-behaved client
+would. This runs once with reads only, for reference, then with the writers
+and `ADMISSION_ENABLED` off and on. Reports read p50/p99 and errors, writes
+completed per second and writes shed.
+"""
+import argparse
+import random
+import threading
+import time
+
+import common  # first: points the app at a temporary database
+
+from werkzeug.serving import make_server
+from bench_api import Client, QuietHandler
+
+READS = (
+    lambda rng: ('GET', '/api/tasks?page=%d' % rng.randint(1, 4), None),
+    lambda rng: ('GET', '/api/archives?page=%d' % rng.randint(1, 4), None),
+    lambda rng: ('POST', '/api/sync', {'fetch_tasks': True, 'fetch_archives': True}),
+)
+
+
+def run(app, port, args, writers):
+    """Readers and `writers` against the server on `port` for `--seconds`; returns the summary."""
+    stop = threading.Event()
+    lock = threading.Lock()
+    reads, read_errors, writes, shed = [], [0], [0], [0]
+
+    def reader(index):
+        client = Client(app, port)
+        rng = random.Random(args.seed + index)
+        local, errors = [], 0
+        while not stop.is_set():
+            method, path, body = READS[len(local) % len(READS)](rng)
+            seconds, status, _ = client.request(method, path, body)
+            local.append(seconds)
+            errors += status != 200
+        with lock:
+            reads.extend(local)
+            read_errors[0] += errors
+
+    def writer(index):
+        client = Client(app, port)
+        done = rejected = 0
+        while not stop.is_set():
+            _, status, _ = client.request('POST', '/api/add', {'task_description': f'Load {index}-{done}'})
+            if status == 503:
+                rejected += 1
+                stop.wait(args.retry_after)
+            else:
+                done += status == 201
+        with lock:
+            writes[0] += done
+            shed[0] += rejected
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    summary = common.summarize(reads, elapsed)
+    summary.update(read_errors=read_errors[0], writes_per_second=round(writes[0] / elapsed, 1), writes_shed=shed[0])
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='tasks and archives seeded')
+    parser.add_argument('--seconds', type=float, default=10, help='length of each run')
+    parser.add_argument('--readers', type=int, default=4, help='client threads reading')
+    parser.add_argument('--writers', type=int, default=64, help='client threads adding tasks')
+    parser.add_argument('--synchronous', default='FULL', help='SQLITE_SYNCHRONOUS for the runs')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the pages requested')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.config import Config
+
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    server = None
+    try:
+        for name, enabled, writers in (('reads only', False, 0), ('admission off', False, args.writers),
+                                       ('admission on', True, args.writers)):
+            class BenchConfig(Config):
+                METRICS_ENABLED = False
+                RESPONSE_CACHE_ENABLED = False
+                SQLITE_SYNCHRONOUS = args.synchronous
+                ADMISSION_ENABLED = enabled
+
+            args.retry_after = BenchConfig.ADMISSION_RETRY_AFTER_SECONDS
+            common.reset_database()
+            common.seed(args.rows, args.rows)
+            app = create_app(BenchConfig)
+            app.logger.setLevel('WARNING')
+            server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            summary = run(app, server.server_port, args, writers)
+            results['runs'][name] = {'reads': summary}
+            server.shutdown()
+            server = None
+            app.extensions['database'].dispose()
+            print(f"{name:<14} reads {summary['rps']:>8.1f}/s  p50 {summary['p50_ms']:>8.2f} ms  "
+                  f"p99 {summary['p99_ms']:>8.2f} ms  errors {summary['read_errors']:>4}   "
+                  f"writes {summary['writes_per_second']:>7.1f}/s  shed {summary['writes_shed']}")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        if server is not None:
+            server.shutdown()
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
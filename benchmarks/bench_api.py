@@ -0,0 +1,178 @@
+"""
+Load benchmark for the Flask API.
+
+    python benchmarks/bench_api.py [--rows 10000] [--requests 2000] [--concurrency 8]
+                                   [--mixes 100:0,90:10,50:50] [--transport both]
+                                   [--output results.json] [--baseline old.json]
+
+For every read:write mix the database is reseeded with `--rows` tasks (and a
+fifth as many archives). Then `--concurrency` client threads send `--requests`
+requests in total, either in process through the Flask test client or over
+HTTP to a local threaded WSGI server. Reports p50/p95/p99 latency and
+throughput per endpoint. Results can be saved as JSON and compared to an
+earlier run. Runs are seeded, so the same arguments send the same requests.
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+
+import common  # first: points the app at a temporary database
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+from app import create_app
+
+READS = (
+    ('GET /api/tasks', 'GET', lambda rng, ids: ('/api/tasks?page=%d' % rng.randint(1, 4), None)),
+    ('GET /api/tasks (cursor)', 'GET', lambda rng, ids: ('/api/tasks?before_id=%d' % rng.randint(1, ids['max']), None)),
+    ('GET /api/archives', 'GET', lambda rng, ids: ('/api/archives?page=%d' % rng.randint(1, 4), None)),
+    ('POST /api/sync', 'POST', lambda rng, ids: ('/api/sync', {'fetch_tasks': True, 'fetch_archives': True})),
+)
+
+
+class QuietHandler(WSGIRequestHandler):
+    """Keep-alive connections and no access log on stderr."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Client:
+    """Sends requests through the Flask test client or over HTTP and times them."""
+
+    def __init__(self, app, port=None):
+        self.port = port
+        self.test_client = app.test_client() if port is None else None
+        self.connection = None
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body) if body is not None else None
+        started = time.perf_counter()
+        if self.test_client is not None:
+            response = self.test_client.open(path, method=method, data=data, content_type='application/json')
+            status, payload = response.status_code, response.data
+        else:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            headers = {'Content-Type': 'application/json'} if data else {}
+            self.connection.request(method, path, body=data, headers=headers)
+            response = self.connection.getresponse()
+            status, payload = response.status, response.read()
+            if response.will_close:
+                self.connection.close()
+                self.connection = None
+        return time.perf_counter() - started, status, payload
+
+
+def pick_write(rng, state):
+    """Choose a write: mostly adds, plus archive/unArchive/delete of rows this client created."""
+    roll = rng.random()
+    if roll < 0.3 and state['tasks']:
+        return 'POST /api/archive', '/api/archive', {'task_id': state['tasks'].pop()}
+    if roll < 0.4 and state['archives']:
+        return 'POST /api/unArchive', '/api/unArchive', {'archive_id': state['archives'].pop()}
+    if roll < 0.5 and state['archives']:
+        return 'POST /api/perm_delete', '/api/perm_delete', {'archive_id': state['archives'].pop()}
+    return 'POST /api/add', '/api/add', {'task_description': 'Benchmark write %d' % rng.randint(0, 10 ** 9)}
+
+
+def run_mix(app, read_pct, args, port=None):
+    """Run one read:write mix and return the latency summary per endpoint."""
+    common.reset_database(app)
+    common.seed(args.rows, args.rows // 5, app=app)
+    ids = {'max': args.rows}
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    per_thread = args.requests // args.concurrency
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        client = Client(app, port)
+        state = {'tasks': [], 'archives': []}
+        local = defaultdict(list)
+        for _ in range(per_thread):
+            if rng.random() * 100 < read_pct:
+                name, method, build = rng.choice(READS)
+                path, body = build(rng, ids)
+            else:
+                name, path, body = pick_write(rng, state)
+                method = 'POST'
+            elapsed, status, payload = client.request(method, path, body)
+            local[name].append(elapsed)
+            if status >= 400:
+                with lock:
+                    errors[name] += 1
+            elif name == 'POST /api/add':
+                state['tasks'].append(json.loads(payload)['id'])
+            elif name == 'POST /api/archive':
+                state['archives'].append(json.loads(payload)['archived_task_id'])
+        with lock:
+            for name, samples in local.items():
+                latencies[name].extend(samples)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    summaries = {name: dict(common.summarize(samples, elapsed), errors=errors[name])
+                 for name, samples in sorted(latencies.items())}
+    summaries['all'] = common.summarize([s for samples in latencies.values() for s in samples], elapsed)
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='tasks seeded before each mix')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per mix, over all clients')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--mixes', default='100:0,90:10,50:50', help='comma separated read:write ratios')
+    parser.add_argument('--transport', choices=('testclient', 'wsgi', 'both'), default='both')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    app = create_app()
+    transports = ('testclient', 'wsgi') if args.transport == 'both' else (args.transport,)
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    server = None
+    try:
+        for transport in transports:
+            port = None
+            if transport == 'wsgi':
+                server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+                port = server.server_port
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+            for mix in args.mixes.split(','):
+                read_pct = int(mix.split(':')[0])
+                run = f"{transport} {mix}"
+                summaries = run_mix(app, read_pct, args, port)
+                results['runs'][run] = summaries
+                print(f"\n{run} ({args.concurrency} clients, {args.rows} rows)")
+                print(f"  {'endpoint':<26}{'count':>7}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+                for name, s in summaries.items():
+                    print(f"  {name:<26}{s['count']:>7}{s['rps']:>10.1f}{s['p50_ms']:>10.2f}"
+                          f"{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+            if server is not None:
+                server.shutdown()
+                server = None
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        if server is not None:
+            server.shutdown()
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+Compare the threaded WSGI server with the ASGI (asyncio) serving mode.
+
+    python benchmarks/bench_asgi.py [--rows 10000] [--idle 1000] [--concurrency 32]
+                                    [--requests 4000] [--servers wsgi,asgi]
+                                    [--output results.json] [--baseline old.json]
+
+For each server the database is reseeded and the server is started in this
+process. Then `--idle` connections each start a request and leave it pending,
+like long-polling or slow clients, while `--concurrency` active connections
+send `--requests` reads and writes in total. Afterwards the pending requests
+are completed. Reports how many of them were held and answered, the server's
+peak thread count and resident memory, and p50/p95/p99 latency and throughput
+of the active requests.
+
+Clients are asyncio streams in the main thread, so every thread counted
+belongs to the server or the database driver. The WSGI server closes every
+connection after one response; clients reconnect as needed. Raise `ulimit -n`
+for more than about 500 pending requests.
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+
+import common  # first: points the app at a temporary database
+
+from bench_api import QuietHandler
+from werkzeug.serving import make_server
+
+REQUESTS = (
+    ('GET /api/tasks', 'GET', lambda rng, rows: ('/api/tasks?page=%d' % rng.randint(1, 4), None)),
+    ('GET /api/tasks (cursor)', 'GET', lambda rng, rows: ('/api/tasks?before_id=%d' % rng.randint(1, rows), None)),
+    ('POST /api/sync', 'POST', lambda rng, rows: ('/api/sync', {'fetch_tasks': True, 'fetch_archives': True})),
+    ('POST /api/add', 'POST', lambda rng, rows: ('/api/add', {'task_description': 'Benchmark write %d' % rng.randint(0, 10 ** 9)})),
+)
+WEIGHTS = (40, 30, 20, 10)
+
+
+def resident_memory_mb():
+    """Resident set size of this process, or None where /proc is not available."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class Sampler(threading.Thread):
+    """Records the peak thread count and memory of this process while it runs."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.stop = threading.Event()
+        self.peak_threads = 0
+        self.peak_rss_mb = None
+
+    def run(self):
+        while not self.stop.is_set():
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            rss = resident_memory_mb()
+            if rss is not None:
+                self.peak_rss_mb = max(self.peak_rss_mb or 0, rss)
+            self.stop.wait(0.05)
+
+
+class Connection:
+    """A keep-alive HTTP/1.1 client connection that reopens when the server closes it."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def send_head(self, method, path, headers=''):
+        """Send the request line and `headers`, without ending the header block."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.writer.write(f'{method} {path} HTTP/1.1\r\nHost: bench\r\n{headers}'.encode())
+        await self.writer.drain()
+
+    async def finish(self, data=b''):
+        """End the request started by `send_head` and read the response; returns ``(status, body)``."""
+        self.writer.write(b'\r\n' + data)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        close = False
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+            elif name.lower() == 'connection' and value.strip().lower() == 'close':
+                close = True
+        payload = await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status, payload
+
+    async def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        headers = f'Content-Type: application/json\r\nContent-Length: {len(data)}\r\n' if data else ''
+        await self.send_head(method, path, headers)
+        return await self.finish(data)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def drive(port, args):
+    """Start the pending requests, run the active clients, then complete the pending ones."""
+    pending = []
+    failed_idle = 0
+    for _ in range(args.idle):
+        connection = Connection(port)
+        try:
+            await connection.send_head('GET', '/api/tasks')
+            pending.append(connection)
+        except OSError:
+            failed_idle += 1
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    per_client = args.requests // args.concurrency
+
+    async def client(index):
+        rng = random.Random(args.seed * 1000 + index)
+        connection = Connection(port)
+        try:
+            for _ in range(per_client):
+                name, method, build = rng.choices(REQUESTS, WEIGHTS)[0]
+                path, body = build(rng, args.rows)
+                started = time.perf_counter()
+                status, _ = await connection.request(method, path, body)
+                latencies[name].append(time.perf_counter() - started)
+                if status >= 400:
+                    errors[name] += 1
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    async def complete(connection):
+        try:
+            status, _ = await asyncio.wait_for(connection.finish(), 30)
+            return status == 200
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return False
+        finally:
+            connection.close()
+
+    held = sum(await asyncio.gather(*(complete(connection) for connection in pending)))
+
+    summaries = {name: dict(common.summarize(samples, elapsed), errors=errors[name])
+                 for name, samples in sorted(latencies.items())}
+    summaries['all'] = common.summarize([s for samples in latencies.values() for s in samples], elapsed)
+    summaries['all'].update(idle_held=held, idle_failed=failed_idle)
+    return summaries
+
+
+def start_wsgi():
+    from app import create_app
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def start_asgi():
+    import uvicorn
+    from app.asgi import create_asgi_app
+    config = uvicorn.Config(create_asgi_app(), host='127.0.0.1', port=0, log_level='warning',
+                            backlog=4096, timeout_keep_alive=300)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return port, stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='tasks seeded before each server run')
+    parser.add_argument('--idle', type=int, default=1000, help='pending requests to hold open')
+    parser.add_argument('--concurrency', type=int, default=32, help='active connections')
+    parser.add_argument('--requests', type=int, default=4000, help='requests over all active connections')
+    parser.add_argument('--servers', default='wsgi,asgi', help='comma separated: wsgi, asgi')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    starters = {'wsgi': start_wsgi, 'asgi': start_asgi}
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    try:
+        for name in args.servers.split(','):
+            common.reset_database()
+            common.seed(args.rows, args.rows // 5)
+            port, stop = starters[name]()
+            sampler = Sampler()
+            sampler.start()
+            try:
+                summaries = asyncio.run(drive(port, args))
+            finally:
+                sampler.stop.set()
+                sampler.join()
+                stop()
+            summaries['all'].update(peak_threads=sampler.peak_threads, peak_rss_mb=sampler.peak_rss_mb)
+            run = f"{name} idle={args.idle} active={args.concurrency}"
+            results['runs'][run] = summaries
+            total = summaries['all']
+            print(f"\n{run}: held {total['idle_held']}/{args.idle} pending requests, "
+                  f"peak {total['peak_threads']} threads, {total['peak_rss_mb']} MB resident")
+            print(f"  {'endpoint':<26}{'count':>7}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+            for endpoint, s in summaries.items():
+                print(f"  {endpoint:<26}{s['count']:>7}{s['rps']:>10.1f}{s['p50_ms']:>10.2f}"
+                      f"{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
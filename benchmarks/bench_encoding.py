@@ -0,0 +1,72 @@
+"""
+Bytes on the wire and server CPU of `/api/sync` for every list format and content coding.
+
+    python benchmarks/bench_encoding.py [--rows 20000] [--per-page 1000] [--iterations 100]
+                                        [--output results.json] [--baseline old.json]
+
+Seeds `--rows` tasks and archives, then requests one `/sync` of `--per-page`
+tasks and archives `--iterations` times through the Flask test client for
+each combination of `Accept` (JSON, columnar JSON, MessagePack when
+installed) and `Accept-Encoding` (identity, gzip, brotli when installed).
+Reports response bytes, CPU milliseconds per request and the export stream
+size with each coding.
+"""
+import argparse
+import time
+
+import common  # first: points the app at a temporary database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000, help='tasks and archives seeded')
+    parser.add_argument('--per-page', type=int, default=1000, help='TASKS_PER_PAGE for the run')
+    parser.add_argument('--iterations', type=int, default=100, help='requests per combination')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.compression import available_codings
+    from app.config import Config
+    from app.encoding import formats
+
+    class BenchConfig(Config):
+        TASKS_PER_PAGE = args.per_page
+        RESPONSE_CACHE_ENABLED = False
+
+    app = create_app(BenchConfig)
+    app.logger.setLevel('WARNING')
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    try:
+        common.reset_database(app)
+        common.seed(args.rows, args.rows, app=app)
+        client = app.test_client()
+        body = {'fetch_tasks': True, 'fetch_archives': True}
+        for fmt in formats():
+            for coding in ['identity'] + available_codings():
+                headers = {'Accept': fmt, 'Accept-Encoding': coding}
+                size = len(client.post('/api/sync', json=body, headers=headers).data)
+                started = time.process_time()
+                for _ in range(args.iterations):
+                    client.post('/api/sync', json=body, headers=headers)
+                cpu = (time.process_time() - started) / args.iterations
+                name = f'sync {fmt.split("/")[-1]} {coding}'
+                results['runs'][name] = {'POST /api/sync': {'bytes': size, 'cpu_ms': round(cpu * 1000, 3),
+                                                            'rps': round(1 / cpu, 1) if cpu else 0.0}}
+                print(f'{name:<44} {size:>10} bytes  {cpu * 1000:>8.2f} ms CPU')
+        for coding in ['identity'] + available_codings():
+            started = time.perf_counter()
+            size = len(client.get('/api/export', headers={'Accept-Encoding': coding}).data)
+            elapsed = time.perf_counter() - started
+            results['runs'][f'export {coding}'] = {'GET /api/export': {'bytes': size, 'seconds': round(elapsed, 3)}}
+            print(f'{"export " + coding:<44} {size:>10} bytes  {elapsed:>8.2f} s')
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Throughput of the NDJSON export and import endpoints.
+
+    python benchmarks/bench_export_import.py [--rows 1000000] [--output results.json]
+
+Seeds a temporary SQLite database, streams `/api/export` to a file through the
+Flask test client and imports that file into an empty database through
+`/api/import`. Reports rows/s and the peak RSS of the process for both ways.
+"""
+import argparse
+import os
+import resource
+import time
+
+import common  # first: points the app at a temporary database
+
+from app import create_app
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    export_file = os.path.join(common.TMP_DIR, 'export.ndjson')
+    try:
+        archived = args.rows // 5
+        common.seed(args.rows - archived, archived, app=app)
+        rss_before = peak_rss_mb()
+
+        started = time.perf_counter()
+        response = client.get('/api/export', buffered=False)
+        with open(export_file, 'wb') as out:
+            for chunk in response.response:
+                out.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+        response.close()
+        export_seconds = time.perf_counter() - started
+        rss_after_export = peak_rss_mb()
+
+        common.reset_database(app)
+        started = time.perf_counter()
+        with open(export_file, 'rb') as f:
+            response = client.post('/api/import', input_stream=f, content_type='application/x-ndjson',
+                                   content_length=os.path.getsize(export_file))
+        import_seconds = time.perf_counter() - started
+        assert response.status_code == 200, response.get_json()
+
+        print(f"rows:   {args.rows}")
+        print(f"export: {args.rows / export_seconds:,.0f} rows/s ({export_seconds:.1f} s, "
+              f"{os.path.getsize(export_file) / 1e6:.0f} MB, peak RSS {rss_before:.0f} -> {rss_after_export:.0f} MB)")
+        print(f"import: {args.rows / import_seconds:,.0f} rows/s ({import_seconds:.1f} s, "
+              f"peak RSS {peak_rss_mb():.0f} MB)")
+        if args.output:
+            common.save_results(args.output, {
+                'environment': common.environment(),
+                'arguments': vars(args),
+                'runs': {'export_import': {
+                    'export': {'rps': round(args.rows / export_seconds, 1), 'seconds': round(export_seconds, 3)},
+                    'import': {'rps': round(args.rows / import_seconds, 1), 'seconds': round(import_seconds, 3)},
+                }},
+            })
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
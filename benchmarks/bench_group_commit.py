@@ -0,0 +1,97 @@
+"""
+Insert throughput of `/api/add` with and without the group-commit write queue.
+
+    python benchmarks/bench_group_commit.py [--requests 5000] [--concurrency 32]
+                                            [--synchronous FULL] [--max-batch 256] [--max-delay-ms 2]
+                                            [--output results.json] [--baseline old.json]
+
+`--concurrency` client threads send `--requests` adds in total through the
+Flask test client, once committing every request on its own and once with
+`WRITE_QUEUE_ENABLED`. Reports inserts/s, p50/p95/p99 latency and how many
+commits were needed. `--synchronous FULL` makes every commit fsync, which is
+where grouping helps most.
+"""
+import argparse
+import os
+import threading
+import time
+
+import common  # first: points the app at a temporary database
+
+
+def run(app, args):
+    """Send the adds from `--concurrency` threads; returns the latency summary."""
+    per_thread = args.requests // args.concurrency
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(index):
+        client = app.test_client()
+        local = []
+        failed = 0
+        for i in range(per_thread):
+            started = time.perf_counter()
+            response = client.post('/api/add', json={'task_description': f'Ingested {index}-{i}'})
+            local.append(time.perf_counter() - started)
+            failed += response.status_code != 201
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return dict(common.summarize(latencies, elapsed), errors=errors[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000, help='adds per run, over all clients')
+    parser.add_argument('--concurrency', type=int, default=32, help='client threads')
+    parser.add_argument('--synchronous', default='FULL', help='SQLITE_SYNCHRONOUS for the run')
+    parser.add_argument('--max-batch', type=int, default=256, help='WRITE_QUEUE_MAX_BATCH')
+    parser.add_argument('--max-delay-ms', type=float, default=2, help='WRITE_QUEUE_MAX_DELAY_MS')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    os.environ['SQLITE_SYNCHRONOUS'] = args.synchronous
+    from app import create_app
+    from app.config import Config
+
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    write_queue = None
+    try:
+        for queued in (False, True):
+            class BenchConfig(Config):
+                WRITE_QUEUE_ENABLED = queued
+                WRITE_QUEUE_MAX_BATCH = args.max_batch
+                WRITE_QUEUE_MAX_DELAY_MS = args.max_delay_ms
+
+            app = create_app(BenchConfig)
+            write_queue = app.extensions['write_queue']
+            common.reset_database(app)
+            summary = run(app, args)
+            write_queue.stop()
+            summary['commits'] = write_queue.batches if queued else summary['count']
+            name = f"add {'group commit' if queued else 'commit per request'}"
+            results['runs'][name] = {'POST /api/add': summary}
+            print(f"{name:<28} {summary['rps']:>9.1f} inserts/s  p50 {summary['p50_ms']:.2f} ms  "
+                  f"p95 {summary['p95_ms']:.2f} ms  p99 {summary['p99_ms']:.2f} ms  "
+                  f"{summary['commits']} commits, {summary['errors']} errors")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        if write_queue is not None:
+            write_queue.stop()
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
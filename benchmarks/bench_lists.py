@@ -0,0 +1,106 @@
+"""
+Write throughput across named lists, and registry memory with many lists.
+
+    python benchmarks/bench_lists.py [--requests 2000] [--concurrency 8] [--synchronous FULL]
+                                     [--lists 2000] [--max-open 64] [--output results.json] [--baseline old.json]
+
+First `--concurrency` threads send `--requests` adds in total, once all to
+the same list and once each thread to a list of its own; with separate
+files they do not queue on one write lock. Reports inserts/s and latency.
+
+Then touches `--lists` different lists one after the other with
+`LISTS_MAX_OPEN=--max-open` and reports how many engines stayed open and
+the memory traced after every few hundred lists, which should level off.
+"""
+import argparse
+import os
+import threading
+import time
+import tracemalloc
+
+import common  # first: points the app at a temporary database
+
+
+def run_adds(app, args, shared):
+    """Adds from `--concurrency` threads, to one list or to one list per thread."""
+    per_thread = args.requests // args.concurrency
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        client = app.test_client()
+        url = '/api/lists/shared/add' if shared else f'/api/lists/own-{index}/add'
+        client.post(url, json={'task_description': 'warm up'}).close()
+        local = []
+        for i in range(per_thread):
+            started = time.perf_counter()
+            client.post(url, json={'task_description': f'Task {index}-{i}'}).close()
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return common.summarize(latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='adds per run, over all clients')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--synchronous', default='FULL', help='SQLITE_SYNCHRONOUS for the run')
+    parser.add_argument('--lists', type=int, default=2000, help='lists touched by the memory run')
+    parser.add_argument('--max-open', type=int, default=64, help='LISTS_MAX_OPEN for the memory run')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    os.environ['SQLITE_SYNCHRONOUS'] = args.synchronous
+    from app import create_app
+    from app.config import Config
+
+    class BenchConfig(Config):
+        LISTS_DIR = os.path.join(common.TMP_DIR, 'lists')
+        LISTS_MAX_OPEN = args.max_open
+        METRICS_ENABLED = False
+
+    app = create_app(BenchConfig)
+    app.logger.setLevel('WARNING')
+    list_registry = app.extensions['list_registry']
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    try:
+        for shared in (True, False):
+            name = f"add {'one shared list' if shared else 'one list per client'}"
+            summary = run_adds(app, args, shared)
+            results['runs'][name] = {'POST /api/lists/<key>/add': summary}
+            print(f"{name:<24} {summary['rps']:>9.1f} inserts/s  p50 {summary['p50_ms']:.2f} ms  "
+                  f"p99 {summary['p99_ms']:.2f} ms")
+
+        list_registry.close_all()
+        client = app.test_client()
+        tracemalloc.start()
+        samples = []
+        for i in range(args.lists):
+            client.get(f'/api/lists/many-{i}/tasks').close()
+            if (i + 1) % max(args.lists // 5, 1) == 0:
+                samples.append((i + 1, len(list_registry.open_keys()), tracemalloc.get_traced_memory()[0]))
+        tracemalloc.stop()
+        for touched, open_count, traced in samples:
+            print(f"{touched:>6} lists touched  {open_count:>4} open  {traced / 2 ** 20:>7.1f} MiB traced")
+        results['runs']['many lists'] = {'registry': {
+            'open': samples[-1][1], 'traced_mib': [round(traced / 2 ** 20, 2) for _, _, traced in samples],
+        }}
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        list_registry.close_all()
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Latency of `/api/add` with the log file written in the request or by the listener thread.
+
+    python benchmarks/bench_logging.py [--requests 4000] [--concurrency 1] [--sample-every 10]
+                                       [--log-latency-ms 0] [--log-dir DIR]
+                                       [--output results.json] [--baseline old.json]
+
+`--concurrency` client threads send `--requests` adds in total through the
+Flask test client, every add logging one INFO record to a rotating log file
+(`LOG_MAX_BYTES` 100000, so it rotates every ~1500 adds). Runs once with the
+file handler on the logger itself (`LOG_QUEUE_ENABLED` off), once through
+the queue and listener thread, and once more keeping one in
+`--sample-every` INFO records. Reports inserts/s, p50/p99 latency and the
+records dropped. `--log-dir` puts the log on another disk; `--log-latency-ms`
+adds that much to every write of the file handler instead, standing in for
+slow or network storage. With several clients, waiting for the SQLite write
+lock soon dominates the latency of an add and hides the cost of logging.
+"""
+import argparse
+import os
+import threading
+import time
+
+import common  # first: points the app at a temporary database
+
+
+def slow_down(handler, delay):
+    """Make every `emit` of `handler` take `delay` seconds longer."""
+    emit = handler.emit
+
+    def slow_emit(record):
+        time.sleep(delay)
+        emit(record)
+
+    handler.emit = slow_emit
+
+
+def run(app, args):
+    """Send the adds from `--concurrency` threads; returns the latency summary."""
+    per_thread = args.requests // args.concurrency
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        client = app.test_client()
+        local = []
+        for i in range(per_thread):
+            started = time.perf_counter()
+            client.post('/api/add', json={'task_description': f'Logged {index}-{i}'})
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return common.summarize(latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=4000, help='adds per run, over all clients')
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads')
+    parser.add_argument('--sample-every', type=int, default=10, help='LOG_INFO_SAMPLE_EVERY of the sampled run')
+    parser.add_argument('--log-latency-ms', type=float, default=0, help='delay added to every log file write')
+    parser.add_argument('--log-dir', default=common.TMP_DIR, help='directory of the log file')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.config import Config
+
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    log_pipeline = None
+    try:
+        for name, queued, every in (('log in request', False, 1), ('log queue', True, 1),
+                                    (f'log queue, 1 in {args.sample_every} INFO', True, args.sample_every)):
+            class BenchConfig(Config):
+                METRICS_ENABLED = False
+                LOG_FILE = os.path.join(args.log_dir, 'bench.log')
+                LOG_QUEUE_ENABLED = queued
+                LOG_INFO_SAMPLE_EVERY = every
+
+            app = create_app(BenchConfig)
+            log_pipeline = app.extensions['log_pipeline']
+            if args.log_latency_ms:
+                slow_down(log_pipeline._file_handler, args.log_latency_ms / 1000)
+            common.reset_database(app)
+            summary = run(app, args)
+            started = time.perf_counter()
+            log_pipeline.stop()
+            summary['flush_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            summary['dropped'] = log_pipeline.dropped
+            results['runs'][name] = {'POST /api/add': summary}
+            print(f"{name:<30} {summary['rps']:>9.1f} inserts/s  p50 {summary['p50_ms']:.2f} ms  "
+                  f"p99 {summary['p99_ms']:.2f} ms  max {summary['max_ms']:.2f} ms  "
+                  f"{summary['dropped']} dropped, flushed in {summary['flush_ms']:.1f} ms")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        if log_pipeline is not None:
+            log_pipeline.stop()
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Write lock hold time of archive retention and the latency of requests running meanwhile.
+
+    python benchmarks/bench_maintenance.py [--archives 200000] [--batch-sizes 100,500,5000,0]
+                                           [--pause-ms 20] [--output results.json] [--baseline old.json]
+
+For every batch size (0 purges everything in one transaction) seeds
+`--archives` archives, then runs `run_maintenance` with
+`RETENTION_MAX_ARCHIVES=0` while a client thread keeps adding tasks. Reports
+the longest and total write lock hold of the purge, the bytes returned by
+incremental vacuum, and the p50/p99 latency of the adds made meanwhile.
+"""
+import argparse
+import threading
+import time
+
+import common  # first: points the app at a temporary database
+
+
+def run_purge(app, args, batch_size):
+    from app.maintenance import run_maintenance
+
+    common.reset_database(app)
+    common.seed(0, args.archives, app=app)
+    # Pooled connections still hold the schema from before reset_database; the first write on
+    # one of them would race the purge while re-reading it
+    app.extensions['database'].dispose()
+    config = dict(app.config, RETENTION_MAX_ARCHIVES=0, RETENTION_BATCH_SIZE=batch_size or args.archives,
+                  RETENTION_BATCH_PAUSE_MS=args.pause_ms)
+    latencies = []
+    done = threading.Event()
+
+    def writer():
+        client = app.test_client()
+        while not done.is_set():
+            started = time.perf_counter()
+            client.post('/api/add', json={'task_description': 'Added during maintenance'})
+            latencies.append(time.perf_counter() - started)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        with app.app_context():
+            report = run_maintenance(config)
+    finally:
+        done.set()
+        thread.join()
+    summary = common.summarize(latencies, report['seconds'])
+    return report, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--archives', type=int, default=200000, help='archives seeded and purged per run')
+    parser.add_argument('--batch-sizes', default='100,500,5000,0', help='RETENTION_BATCH_SIZE values, 0 = one transaction')
+    parser.add_argument('--pause-ms', type=float, default=20, help='RETENTION_BATCH_PAUSE_MS for the runs')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.config import Config
+
+    class BenchConfig(Config):
+        METRICS_ENABLED = False
+
+    app = create_app(BenchConfig)
+    app.logger.setLevel('WARNING')
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    try:
+        for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+            report, summary = run_purge(app, args, batch_size)
+            name = f"purge batch {batch_size or 'all'}"
+            results['runs'][name] = {'POST /api/add': summary, 'maintenance': report}
+            print(f"{name:<18} lock max {report['lock_max_ms']:>9.1f} ms  total {report['lock_total_ms']:>9.1f} ms  "
+                  f"reclaimed {report['bytes_reclaimed'] / 2 ** 20:>6.1f} MiB  "
+                  f"adds meanwhile p50 {summary['p50_ms']:.2f} ms  p99 {summary['p99_ms']:.2f} ms")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
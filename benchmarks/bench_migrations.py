@@ -0,0 +1,105 @@
+"""
+Schema migrations on a large database created by the first release.
+
+    python benchmarks/bench_migrations.py [--rows 2000000] [--batch-sizes 10000,0] [--pause-ms 5]
+                                          [--output results.json] [--baseline old.json]
+
+For every batch size (0 backfills each column in one transaction) builds a
+database with the original schema holding `--rows` tasks and `--rows`
+archives, then applies all migrations while another connection keeps
+inserting tasks. Reports the time and longest write lock hold of every
+step, and the p50/p99/max latency of the inserts made meanwhile.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import common  # first: points the app at a temporary database
+
+
+def build_old_database(path, rows, chunk=100000):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    with conn:
+        conn.execute('CREATE TABLE "Tasks" (id INTEGER PRIMARY KEY, "TODO" VARCHAR(255) NOT NULL)')
+        conn.execute('CREATE TABLE "Archived" (id INTEGER PRIMARY KEY, "Finished" VARCHAR(255) NOT NULL)')
+    for table, column in (('Tasks', 'TODO'), ('Archived', 'Finished')):
+        for start in range(0, rows, chunk):
+            with conn:
+                conn.executemany(f'INSERT INTO "{table}" ("{column}") VALUES (?)',
+                                 ((f'Benchmark item {i}',) for i in range(start, min(start + chunk, rows))))
+    conn.close()
+
+
+def run_migrations(args, batch_size):
+    from app.config import Config
+    from app.models.database import build_engine
+    from app.models.migrations import migrate
+
+    path = os.path.join(common.TMP_DIR, 'old.db')
+    build_old_database(path, args.rows)
+
+    class OldConfig(Config):
+        DATABASE_URI = 'sqlite:///' + path
+
+    engine = build_engine(OldConfig)
+    latencies = []
+    done = threading.Event()
+
+    def writer():
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        while not done.is_set():
+            started = time.perf_counter()
+            conn.execute('INSERT INTO "Tasks" ("TODO") VALUES (\'Added during migration\')')
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.001)
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    started = time.perf_counter()
+    try:
+        reports = migrate(engine, batch_size or args.rows * 2, args.pause_ms / 1000)
+    finally:
+        done.set()
+        thread.join()
+        engine.dispose()
+    return reports, common.summarize(latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000, help='tasks and archives in the old database')
+    parser.add_argument('--batch-sizes', default='10000,0', help='MIGRATION_BATCH_SIZE values, 0 = one transaction')
+    parser.add_argument('--pause-ms', type=float, default=5, help='MIGRATION_BATCH_PAUSE_MS for the runs')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    try:
+        for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+            name = f"migrate batch {batch_size or 'all'}"
+            reports, summary = run_migrations(args, batch_size)
+            steps = [step for report in reports for step in report['steps']]
+            results['runs'][name] = {step['step']: step for step in steps}
+            results['runs'][name]['concurrent insert'] = summary
+            print(name)
+            for step in steps:
+                print(f"  {step['step']:<32} {step['seconds']:>8.2f} s  {step['batches']:>5} transactions  "
+                      f"lock max {step['lock_max_ms']:>9.1f} ms")
+            print(f"  inserts meanwhile: {summary['count']}  p50 {summary['p50_ms']:.2f} ms  "
+                  f"p99 {summary['p99_ms']:.2f} ms  max {summary['max_ms']:.2f} ms")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
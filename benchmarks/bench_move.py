@@ -0,0 +1,105 @@
+"""
+Archive/unArchive moves: single-statement Core path against the former ORM path.
+
+    python benchmarks/bench_move.py [--rows 5000] [--moves 2000] [--output results.json] [--baseline old.json]
+
+Seeds `--rows` tasks, then archives `--moves` of them and restores them
+again, once through `MainLogic.archive`/`unArchive` (DELETE ... RETURNING plus
+INSERT ... RETURNING) and once through the ORM load, delete and insert they
+used to do. Reports moves/s, p50/p95/p99 latency and SQL statements per move.
+"""
+import argparse
+import time
+
+import common  # first: points the app at a temporary database
+
+from sqlalchemy import event
+
+
+def orm_move(logic, source, target, target_id):
+    """The previous implementation: SELECT the row, ORM delete, ORM insert, commit."""
+    session = logic.db_session
+    row = session.query(source).filter_by(id=target_id).first()
+    if row is None:
+        return None
+    text = row.TODO if source.__tablename__ == 'Tasks' else row.Finished
+    session.delete(row)
+    entry = target(**{'Finished' if target.__tablename__ == 'Archived' else 'TODO': text})
+    session.add(entry)
+    session.flush()
+    logic._record_changes([(source.__tablename__, 'move', target_id, entry.id)])
+    session.commit()
+    return entry.id
+
+
+def run(logic, engine, ids, archive, unarchive):
+    """Archive then restore `ids`; returns the latency summary and statements per move."""
+    statements = [0]
+
+    def count(*_):
+        statements[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    latencies = []
+    started = time.perf_counter()
+    try:
+        archive_ids = []
+        for task_id in ids:
+            t = time.perf_counter()
+            archive_ids.append(archive(task_id))
+            latencies.append(time.perf_counter() - t)
+        for archive_id in archive_ids:
+            t = time.perf_counter()
+            unarchive(archive_id)
+            latencies.append(time.perf_counter() - t)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    summary = common.summarize(latencies, time.perf_counter() - started)
+    summary['statements_per_move'] = round(statements[0] / len(latencies), 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000, help='tasks seeded before each run')
+    parser.add_argument('--moves', type=int, default=2000, help='tasks archived and restored per run')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.models import MainLogic, Tasks, Archived, get_engine, close_db_session
+
+    app = create_app()
+    app.logger.setLevel('WARNING')  # time the statements, not the per-move log line
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    paths = {
+        'core': lambda logic: (lambda i: logic.archive(i).id, lambda i: logic.unArchive(i).id),
+        'orm': lambda logic: (lambda i: orm_move(logic, Tasks, Archived, i),
+                              lambda i: orm_move(logic, Archived, Tasks, i)),
+    }
+    try:
+        with app.app_context():
+            for name, build in paths.items():
+                common.reset_database(app)
+                common.seed(args.rows, app=app)
+                close_db_session()
+                logic = MainLogic()
+                archive, unarchive = build(logic)
+                # Tasks were seeded with ids 1..rows; move every n-th so rows are spread out
+                step = max(args.rows // args.moves, 1)
+                ids = list(range(1, args.rows + 1, step))[:args.moves]
+                summary = run(logic, get_engine(), ids, archive, unarchive)
+                results['runs'][f'move {name}'] = {'archive+unArchive': summary}
+                print(f"{name:<5} {summary['rps']:>9.1f} moves/s  p50 {summary['p50_ms']:.3f} ms  "
+                      f"p95 {summary['p95_ms']:.3f} ms  p99 {summary['p99_ms']:.3f} ms  "
+                      f"{summary['statements_per_move']} statements/move")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Task reads served by SQLite against reads served by the in-memory read model.
+
+    python benchmarks/bench_read_model.py [--rows 10000] [--requests 4000] [--concurrency 4] [--ids 50]
+                                          [--writes-per-second 20] [--seed 1] [--output results.json]
+                                          [--baseline old.json]
+
+Seeds `--rows` tasks, then runs the same read load with `READ_MODEL_ENABLED`
+off and on, the response cache disabled in both so every request reads the
+data: `--concurrency` client threads send `--requests` requests in total,
+alternating ``GET /api/tasks`` for one of the first ten pages, ``GET
+/api/tasks`` with a random `before_id`, and ``POST /api/sync`` fetching
+`--ids` random task ids. Meanwhile a writer thread adds
+`--writes-per-second` tasks, so the model is also measured while it follows
+writes; requests that arrive while it is behind count as misses and go to
+SQL. Reports requests/s and p50/p99 per kind, the time the model took to
+load and its estimated size.
+"""
+import argparse
+import random
+import threading
+import time
+
+import common  # first: points the app at a temporary database
+
+KINDS = ('GET /api/tasks?page', 'GET /api/tasks?before_id', 'POST /api/sync ids')
+
+
+def run(app, args):
+    """Send the reads from `--concurrency` threads while a writer adds tasks; summaries per kind."""
+    per_thread = args.requests // args.concurrency
+    latencies = {kind: [] for kind in KINDS}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def reader(index):
+        client = app.test_client()
+        rng = random.Random(args.seed + index)
+        local = {kind: [] for kind in KINDS}
+        for i in range(per_thread):
+            kind = KINDS[i % len(KINDS)]
+            started = time.perf_counter()
+            if kind == KINDS[0]:
+                response = client.get(f'/api/tasks?page={rng.randint(1, 10)}')
+            elif kind == KINDS[1]:
+                response = client.get(f'/api/tasks?before_id={rng.randint(2, args.rows)}')
+            else:
+                ids = [rng.randint(1, args.rows) for _ in range(args.ids)]
+                response = client.post('/api/sync', json={'fetch_task_ids': ids})
+            local[kind].append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+        with lock:
+            for kind in KINDS:
+                latencies[kind] += local[kind]
+
+    def writer():
+        client = app.test_client()
+        number = 0
+        while not stop.wait(1 / args.writes_per_second):
+            client.post('/api/add', json={'task_description': f'Written during the run {number}'})
+            number += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.concurrency)]
+    background = threading.Thread(target=writer) if args.writes_per_second > 0 else None
+    if background is not None:
+        background.start()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if background is not None:
+        background.join()
+    summaries = {kind: common.summarize(samples, elapsed) for kind, samples in latencies.items()}
+    summaries['all reads'] = common.summarize(sum(latencies.values(), []), elapsed)
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='tasks seeded')
+    parser.add_argument('--requests', type=int, default=4000, help='reads per run, over all clients')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads')
+    parser.add_argument('--ids', type=int, default=50, help='task ids fetched per /api/sync')
+    parser.add_argument('--writes-per-second', type=float, default=20, help='tasks added during the run; 0 for none')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the pages and ids requested')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.config import Config
+
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    try:
+        for name, enabled in (('sql', False), ('read model', True)):
+            class BenchConfig(Config):
+                METRICS_ENABLED = False
+                RESPONSE_CACHE_ENABLED = False
+                READ_MODEL_ENABLED = enabled
+
+            common.reset_database()
+            common.seed(args.rows)
+            app = create_app(BenchConfig)
+            app.logger.setLevel('WARNING')
+            started = time.perf_counter()
+            app.extensions['database'].engine     # loads the read model, if enabled
+            startup_ms = (time.perf_counter() - started) * 1000
+            summaries = run(app, args)
+            model = app.extensions.get('read_model')
+            if model is not None:
+                summaries['all reads'].update(hits=model.hits, misses=model.misses,
+                                              model_bytes=model.metrics()['todo_read_model_bytes'][2])
+                model.stop()
+            summaries['all reads']['engine_startup_ms'] = round(startup_ms, 1)
+            app.extensions['database'].dispose()
+            results['runs'][name] = summaries
+            for kind, summary in summaries.items():
+                print(f"{name:<11} {kind:<26} {summary['rps']:>9.1f} req/s  p50 {summary['p50_ms']:>7.2f} ms  "
+                      f"p99 {summary['p99_ms']:>7.2f} ms")
+            if model is not None:
+                print(f"{name:<11} engine start with load {startup_ms:.1f} ms, "
+                      f"~{summaries['all reads']['model_bytes'] / 1e6:.1f} MB, {model.hits} hits, {model.misses} misses")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
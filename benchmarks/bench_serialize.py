@@ -0,0 +1,85 @@
+"""
+CPU time and allocations of building one `/tasks` page body, ORM path against row path.
+
+    python benchmarks/bench_serialize.py [--rows 20000] [--sizes 25,100,1000] [--iterations 200]
+                                         [--output results.json] [--baseline old.json]
+
+For every page size, builds the JSON body of a keyset page `--iterations`
+times, once the way the list endpoints used to (ORM `Tasks` objects turned
+into dicts and encoded with Flask's JSON provider) and once through
+`get_task_rows` and `list_body` (Core column tuples and the fast encoder).
+The response cache is not involved. Reports CPU microseconds per request
+and the peak memory allocated while building one page, from tracemalloc.
+"""
+import argparse
+import time
+import tracemalloc
+
+import common  # first: points the app at a temporary database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000, help='tasks seeded')
+    parser.add_argument('--sizes', default='25,100,1000', help='comma separated page sizes')
+    parser.add_argument('--iterations', type=int, default=200, help='pages built per size and path')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    from flask import current_app
+    from app import create_app
+    from app.control_endpoints import list_body
+    from app.models import MainLogic, close_db_session
+    from app.models.pagination import next_cursor
+
+    def orm_body(logic, per_page, before_id):
+        tasks = logic.get_tasks(before_id=before_id)
+        result = [{'id': t.id, 'TODO': t.TODO} for t in tasks]
+        return current_app.json.dumps({'tasks': result, 'next_cursor': next_cursor([t.id for t in tasks], per_page, None)})
+
+    def row_body(logic, per_page, before_id):
+        rows = logic.get_task_rows(before_id=before_id)
+        return list_body('tasks', 'TODO', rows, per_page, before_id, None)
+
+    app = create_app()
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    try:
+        common.reset_database(app)
+        common.seed(args.rows, app=app)
+        with app.app_context():
+            for size in (int(size) for size in args.sizes.split(',')):
+                app.config['TASKS_PER_PAGE'] = size
+                run = {}
+                for name, build in (('orm', orm_body), ('rows', row_body)):
+                    logic = MainLogic()
+                    before_id = args.rows + 1
+                    build(logic, size, before_id)  # warm up statement caches
+                    close_db_session()
+
+                    started = time.process_time()
+                    for _ in range(args.iterations):
+                        build(logic, size, before_id)
+                        close_db_session()
+                    cpu = (time.process_time() - started) / args.iterations
+
+                    tracemalloc.start()
+                    build(logic, size, before_id)
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    close_db_session()
+
+                    run[name] = {'cpu_us': round(cpu * 1e6, 1), 'rps': round(1 / cpu, 1) if cpu else 0.0,
+                                 'peak_alloc_kib': round(peak / 1024, 1)}
+                    print(f"{size:>5} rows  {name:<5} {run[name]['cpu_us']:>10.1f} us CPU  "
+                          f"{run[name]['peak_alloc_kib']:>9.1f} KiB allocated at peak")
+                results['runs'][f'page {size}'] = run
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Cold start of the app and the cost of a fresh app per test.
+
+    python benchmarks/bench_startup.py [--runs 10] [--fixtures 50] [--output results.json] [--baseline old.json]
+
+Starts `--runs` new interpreters that each import the app, call
+`create_app()` and serve one `GET /api/tasks`, and reports the time spent
+in each phase (p50 over the runs). Then creates `--fixtures` apps in this
+process the way the test suite does, each followed by one request: on a
+new in-memory database per app, and on one shared file that is dropped and
+recreated for every app.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import common  # first: points the app at a temporary database
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+app.logger.setLevel('WARNING')
+app.test_client().get('/api/tasks')
+served = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported, 'first_request': served - created}))
+"""
+
+
+def cold_starts(runs):
+    """Phase timings of `runs` fresh interpreters, in seconds."""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', CHILD], cwd=common.REPO_ROOT, env=os.environ,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+
+def fixtures(count, shared_file):
+    """Seconds per app created and used once, the way a test's setUp and first request do."""
+    from app import create_app
+    from app.config import Config
+    from app.models import init_db
+    from app.models.database import Base
+
+    class FixtureConfig(Config):
+        TESTING = True
+        DATABASE_URI = Config.DATABASE_URI if shared_file else 'sqlite:///:memory:'
+
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        app = create_app(FixtureConfig)
+        app.logger.setLevel('WARNING')
+        with app.app_context():
+            if shared_file:
+                engine = app.extensions['database'].engine
+                Base.metadata.drop_all(bind=engine)
+                init_db(engine)
+            app.test_client().get('/api/tasks')
+        app.extensions['database'].dispose()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters started')
+    parser.add_argument('--fixtures', type=int, default=50, help='apps created per fixture style')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    try:
+        common.reset_database()
+        samples = cold_starts(args.runs)
+        cold = {}
+        for phase in ('import', 'create_app', 'first_request'):
+            cold[phase] = common.summarize([sample[phase] for sample in samples], 0)
+            print(f"cold start {phase:<14} p50 {cold[phase]['p50_ms']:>8.1f} ms  max {cold[phase]['max_ms']:>8.1f} ms")
+        results['runs']['cold start'] = cold
+
+        for name, shared_file in (('fixture in-memory per app', False), ('fixture reset shared file', True)):
+            latencies = fixtures(args.fixtures, shared_file)
+            summary = common.summarize(latencies, sum(latencies))
+            results['runs'][name] = {'create_app + GET /api/tasks': summary}
+            print(f"{name:<28} p50 {summary['p50_ms']:>8.2f} ms  p99 {summary['p99_ms']:>8.2f} ms")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Counting tasks and archives: COUNT(*) scans against the maintained row counters.
+
+    python benchmarks/bench_stats.py [--rows 10000,100000,1000000] [--requests 200]
+                                     [--output results.json] [--baseline old.json]
+
+For every row count in `--rows`, seeds that many tasks and archives and
+measures, through the Flask test client with the response cache off and no
+`If-None-Match`, `--requests` of each of: ``GET /api/stats``, ``GET
+/api/tasks`` for the first page with and without ``total=1``, and, on a
+connection of the app's engine, the two ``SELECT COUNT(*)`` a stats request
+would need without the counters against the counter lookup it runs instead.
+Reports p50/p99 and requests/s per kind.
+"""
+import argparse
+import time
+
+import common  # first: points the app at a temporary database
+
+KINDS = ('SQL COUNT(*) scans', 'SQL counter lookup', 'GET /api/stats', 'GET /api/tasks', 'GET /api/tasks?total=1')
+
+
+def measure(call, requests):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        begin = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - begin)
+    return common.summarize(latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='10000,100000,1000000', help='tasks and archives seeded per run')
+    parser.add_argument('--requests', type=int, default=200, help='requests per kind and run')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    from sqlalchemy import func, select
+    from app import create_app
+    from app.config import Config
+    from app.models import Archived, Counters, Tasks
+
+    class BenchConfig(Config):
+        METRICS_ENABLED = False
+        RESPONSE_CACHE_ENABLED = False
+
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    try:
+        for rows in (int(n) for n in args.rows.split(',')):
+            common.reset_database()
+            common.seed(rows, rows)
+            app = create_app(BenchConfig)
+            app.logger.setLevel('WARNING')
+            client = app.test_client()
+            engine = app.extensions['database'].engine
+
+            def count_scan():
+                with engine.connect() as conn:
+                    return (conn.execute(select(func.count()).select_from(Tasks)).scalar(),
+                            conn.execute(select(func.count()).select_from(Archived)).scalar())
+
+            def counter_lookup():
+                with engine.connect() as conn:
+                    return dict(conn.execute(select(Counters.name, Counters.value)
+                                             .where(Counters.name.in_(['Tasks.count', 'Archived.count']))).all())
+
+            expected = count_scan()
+            assert counter_lookup() == {'Tasks.count': expected[0], 'Archived.count': expected[1]}
+            assert client.get('/api/stats').get_json() == {'tasks': expected[0], 'archives': expected[1]}
+            calls = {
+                KINDS[0]: count_scan,
+                KINDS[1]: counter_lookup,
+                KINDS[2]: lambda: client.get('/api/stats'),
+                KINDS[3]: lambda: client.get('/api/tasks?page=1'),
+                KINDS[4]: lambda: client.get('/api/tasks?page=1&total=1'),
+            }
+            name = f'{rows} rows'
+            results['runs'][name] = {kind: measure(call, args.requests) for kind, call in calls.items()}
+            app.extensions['database'].dispose()
+            for kind, summary in results['runs'][name].items():
+                print(f"{name:<14} {kind:<27} {summary['rps']:>9.1f} req/s  p50 {summary['p50_ms']:>8.2f} ms  "
+                      f"p99 {summary['p99_ms']:>8.2f} ms")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
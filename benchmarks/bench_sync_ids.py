@@ -0,0 +1,94 @@
+"""
+Fetching many specific items: one `/api/sync` per id against one batched `/api/sync`.
+
+    python benchmarks/bench_sync_ids.py [--rows 100000] [--ids 10,200,2000] [--missing 0.1] [--repeat 5]
+                                        [--output results.json] [--baseline old.json]
+
+Seeds `--rows` tasks and archives. For every count in `--ids` picks that many
+random task and archive ids, a `--missing` share of them deleted meanwhile,
+and fetches them through the Flask test client: once as one request per id
+(`fetch_task_id`/`fetch_archive_id`) and once as a single request with
+`fetch_task_ids`/`fetch_archive_ids`. Reports the wall time of each way
+(p50 over `--repeat` rounds) and the SQL statements executed.
+"""
+import argparse
+import random
+import time
+
+import common  # first: points the app at a temporary database
+
+
+def count_statements(engine):
+    """A list whose length is the number of statements run on `engine` from now on."""
+    from sqlalchemy import event
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(1))
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='tasks and archives seeded')
+    parser.add_argument('--ids', default='10,200,2000', help='ids of each kind fetched per round')
+    parser.add_argument('--missing', type=float, default=0.1, help='share of the requested ids that do not exist')
+    parser.add_argument('--repeat', type=int, default=5, help='rounds per id count')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the id choice')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.config import Config
+
+    class BenchConfig(Config):
+        METRICS_ENABLED = False
+        RESPONSE_CACHE_ENABLED = False
+
+    app = create_app(BenchConfig)
+    app.logger.setLevel('WARNING')
+    rng = random.Random(args.seed)
+    results = {'environment': common.environment(), 'arguments': vars(args), 'runs': {}}
+    try:
+        common.reset_database(app)
+        common.seed(args.rows, args.rows, app=app)
+        client = app.test_client()
+        statements = count_statements(app.extensions['database'].engine)
+        for count in (int(n) for n in args.ids.split(',')):
+            # Ids past the seeded range stand in for items deleted since the client saw them
+            def pick():
+                return [rng.randint(1, args.rows) if rng.random() >= args.missing else args.rows + rng.randint(1, args.rows)
+                        for _ in range(count)]
+
+            single, batched = [], []
+            single_statements = batched_statements = 0
+            for _ in range(args.repeat):
+                task_ids, archive_ids = pick(), pick()
+                del statements[:]
+                started = time.perf_counter()
+                for task_id, archive_id in zip(task_ids, archive_ids):
+                    client.post('/api/sync', json={'fetch_task_id': task_id, 'fetch_archive_id': archive_id})
+                single.append(time.perf_counter() - started)
+                single_statements = len(statements)
+
+                del statements[:]
+                started = time.perf_counter()
+                data = client.post('/api/sync', json={'fetch_task_ids': task_ids, 'fetch_archive_ids': archive_ids}).get_json()
+                batched.append(time.perf_counter() - started)
+                batched_statements = len(statements)
+                found = len(data['tasks_by_id']) + len(data['missing_task_ids'])
+                assert found == len(set(task_ids)), 'every requested id is either returned or reported missing'
+
+            for name, latencies, executed in ((f'{count} ids one request each', single, single_statements),
+                                              (f'{count} ids one batched request', batched, batched_statements)):
+                summary = dict(common.summarize(latencies, sum(latencies)), statements=executed)
+                results['runs'][name] = {'POST /api/sync': summary}
+                print(f"{name:<34} p50 {summary['p50_ms']:>10.2f} ms  {executed:>6} statements")
+        if args.output:
+            common.save_results(args.output, results)
+        common.compare_to_baseline(results, args.baseline)
+    finally:
+        common.cleanup()
+
+
+if __name__ == '__main__':
+    main()
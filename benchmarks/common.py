@@ -0,0 +1,152 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Import this module before anything from `app`: it points `DATABASE_URL` at a
+throw-away SQLite file, which `Config` reads when it is imported. Apps
+created with the default config use that file, and so do the helpers here,
+through an engine of their own.
+"""
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TMP_DIR = tempfile.mkdtemp(prefix='todo-bench-')
+DATABASE_PATH = os.path.join(TMP_DIR, 'bench.db')
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE_PATH
+sys.path.insert(0, REPO_ROOT)
+
+
+_engine = None
+
+
+def engine():
+    """Engine on the benchmark database, for seeding and resetting it outside any app."""
+    global _engine
+    if _engine is None:
+        from app.config import Config
+        from app.models.database import build_engine
+        _engine = build_engine(Config)
+    return _engine
+
+
+def cleanup() -> None:
+    """Remove the temporary database directory."""
+    if _engine is not None:
+        _engine.dispose()
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+def clear_response_cache(app=None) -> None:
+    """Drop the list pages cached by `app`, if given.
+
+    `reset_database` starts the change counters over and `seed` writes
+    without bumping them, so pages cached before either would otherwise be
+    served again under the same table version. An app created afterwards
+    starts with an empty cache of its own.
+    """
+    if app is not None:
+        app.extensions['response_cache'].backend.clear()
+
+
+def reset_database(app=None) -> None:
+    """Drop and recreate all tables, and clear the response cache of `app`."""
+    from app.models import init_db
+    from app.models.database import Base
+    Base.metadata.drop_all(bind=engine())
+    init_db(engine())
+    clear_response_cache(app)
+
+
+def seed(tasks: int, archives: int = 0, chunk: int = 50000, app=None) -> None:
+    """Insert `tasks` active and `archives` archived rows with Core executemany, then recount the rows.
+
+    The response cache of `app` is cleared.
+    """
+    from sqlalchemy import insert
+    from app.models import Tasks, Archived
+    from app.models.database import recount_rows
+    with engine().begin() as conn:
+        for table, column, count in ((Tasks.__table__, 'TODO', tasks), (Archived.__table__, 'Finished', archives)):
+            for start in range(0, count, chunk):
+                conn.execute(insert(table), [
+                    {column: f'Benchmark item {i}'} for i in range(start, min(start + chunk, count))
+                ])
+    recount_rows(engine())
+    clear_response_cache(app)
+
+
+def percentile(sorted_samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted samples."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, int(round(pct / 100 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[rank]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Count, throughput and p50/p95/p99/max latency in milliseconds for `latencies` in seconds."""
+    samples = sorted(latencies)
+    return {
+        'count': len(samples),
+        'rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3) if samples else 0.0,
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Describe the machine and code version a result was measured on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def save_results(path: str, results: Dict[str, Any]) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Results written to {path}")
+
+
+def compare_to_baseline(results: Dict[str, Any], baseline_path: Optional[str]) -> None:
+    """Print the relative change of every metric that also exists in the baseline file.
+
+    Both files map run names to ``{endpoint: summary}``; for latencies a negative
+    change is an improvement, for rps a positive one.
+    """
+    if not baseline_path:
+        return
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nCompared to {baseline_path} ({baseline.get('environment', {}).get('commit')}):")
+    for run, endpoints in results['runs'].items():
+        for endpoint, summary in endpoints.items():
+            before = baseline.get('runs', {}).get(run, {}).get(endpoint)
+            if not before:
+                continue
+            deltas = []
+            for metric in ('rps', 'p50_ms', 'p99_ms'):
+                if before.get(metric):
+                    change = (summary[metric] - before[metric]) / before[metric] * 100
+                    deltas.append(f"{metric} {change:+.1f}%")
+            print(f"  {run:<28} {endpoint:<26} " + ', '.join(deltas))
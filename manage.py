@@ -0,0 +1,141 @@
+"""
+Command line tools for the TODO List backend.
+
+    python manage.py export [FILE]          Write all tasks and archives as NDJSON (stdout by default)
+    python manage.py import FILE [--keep-ids]
+    python manage.py rebuild-search         Rebuild the full-text search index from the tables
+    python manage.py maintenance [--max-age-days N] [--max-archives N] [--analyze] [--full-vacuum]
+                                            Purge old archives, reclaim free pages and refresh statistics
+    python manage.py migrate [--status]     Apply pending schema migrations, or list applied and pending ones
+    python manage.py recount                Recompute the task and archive counters behind /api/stats
+
+Every command accepts `--list KEY` to work on a named list instead of the default database.
+"""
+import argparse
+import sys
+
+from flask import current_app
+
+from app import create_app
+from app.control_endpoints import controller, ndjson_line, parse_ndjson
+from app.maintenance import full_vacuum, run_maintenance
+from app.models import get_engine
+from app.models.database import init_search_index, recount_rows
+from app.models.lists import use_list
+from app.models.migrations import migrate, migration_history, pending_migrations
+
+
+def export_command(args):
+    out = open(args.file, 'w', encoding='utf-8') if args.file else sys.stdout
+    try:
+        count = 0
+        for row in controller.export_rows():
+            out.write(ndjson_line(*row) + '\n')
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Exported {count} rows.", file=sys.stderr)
+    return 0
+
+
+def import_command(args):
+    with open(args.file, encoding='utf-8') as f:
+        counts = controller.import_rows(parse_ndjson(f), keep_ids=args.keep_ids)
+    print(f"Imported {counts['tasks']} tasks and {counts['archives']} archives.", file=sys.stderr)
+    if counts['error']:
+        print(f"Error: {counts['error']}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def rebuild_search_command(args):
+    with get_engine().begin() as conn:
+        if not init_search_index(conn, rebuild=True):
+            print("Full-text search needs SQLite with FTS5.", file=sys.stderr)
+            return 1
+    print("Search index rebuilt.", file=sys.stderr)
+    return 0
+
+
+def maintenance_command(args):
+    config = dict(current_app.config)
+    if args.max_age_days is not None:
+        config['RETENTION_MAX_AGE_DAYS'] = args.max_age_days
+    if args.max_archives is not None:
+        config['RETENTION_MAX_ARCHIVES'] = args.max_archives
+    if args.full_vacuum:
+        full_vacuum(get_engine())
+    report = run_maintenance(config, analyze=args.analyze)
+    print(f"Purged {report['purged']} archives in {report['batches']} batches "
+          f"(write lock held at most {report['lock_max_ms']:.1f} ms), "
+          f"reclaimed {report['bytes_reclaimed']} bytes in {report['seconds']:.2f} s.", file=sys.stderr)
+    return 1 if report['errors'] else 0
+
+
+def migrate_command(args):
+    engine = get_engine()
+    if args.status:
+        for row in migration_history(engine):
+            print(f"{row['version']:>4}  applied  {row['name']} ({row['seconds']:.2f} s)")
+        for migration in pending_migrations(engine):
+            print(f"{migration.version:>4}  pending  {migration.name}")
+        return 0
+    reports = migrate(engine, current_app.config['MIGRATION_BATCH_SIZE'],
+                      current_app.config['MIGRATION_BATCH_PAUSE_MS'] / 1000)
+    for report in reports:
+        print(f"Migration {report['version']} ({report['name']}): {report['seconds']:.2f} s", file=sys.stderr)
+        for step in report['steps']:
+            print(f"  {step['step']}: {step['rows']} rows in {step['batches']} transactions, {step['seconds']:.2f} s, "
+                  f"write lock held at most {step['lock_max_ms']:.1f} ms", file=sys.stderr)
+    print(f"Applied {len(reports)} migrations; the schema is up to date.", file=sys.stderr)
+    return 0
+
+
+def recount_command(args):
+    for name, (old, new) in recount_rows(get_engine()).items():
+        state = 'ok' if old == new else f'was {old}'
+        print(f"{name}: {new} ({state})", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--list', dest='list_key', metavar='KEY', help='named list to work on (default: the main database)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help='export all data as NDJSON')
+    export_parser.add_argument('file', nargs='?', help='output file (default: stdout)')
+    export_parser.set_defaults(func=export_command)
+
+    import_parser = commands.add_parser('import', help='import NDJSON produced by export')
+    import_parser.add_argument('file', help='NDJSON file to import')
+    import_parser.add_argument('--keep-ids', action='store_true', help='keep the exported ids')
+    import_parser.set_defaults(func=import_command)
+
+    rebuild_parser = commands.add_parser('rebuild-search', help='rebuild the full-text search index')
+    rebuild_parser.set_defaults(func=rebuild_search_command)
+
+    maintenance_parser = commands.add_parser('maintenance', help='purge old archives and compact the database')
+    maintenance_parser.add_argument('--max-age-days', type=float, help='purge archives older than this (default: RETENTION_MAX_AGE_DAYS)')
+    maintenance_parser.add_argument('--max-archives', type=int, help='keep only this many newest archives (default: RETENTION_MAX_ARCHIVES)')
+    maintenance_parser.add_argument('--analyze', action='store_true', help='run a full ANALYZE instead of PRAGMA optimize')
+    maintenance_parser.add_argument('--full-vacuum', action='store_true',
+                                    help='rewrite the file first; needed once for databases created without incremental auto_vacuum')
+    maintenance_parser.set_defaults(func=maintenance_command)
+
+    migrate_parser = commands.add_parser('migrate', help='apply pending schema migrations')
+    migrate_parser.add_argument('--status', action='store_true', help='only list applied and pending migrations')
+    migrate_parser.set_defaults(func=migrate_command)
+
+    recount_parser = commands.add_parser('recount', help='recompute the row counters from the tables')
+    recount_parser.set_defaults(func=recount_command)
+
+    args = parser.parse_args(argv)
+    app = create_app()
+    with app.app_context(), use_list(args.list_key):
+        return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,22 @@
 import unittest
 # import pytest # Pytest can run unittest test cases directly # Commenting out as pytest is run from terminal
 from app import create_app
-from app.models import init_db, close_db_session, get_db_session, Tasks, Archived
-from app.models.database import Base, engine # Added Base and engine import
+from app.models import init_db, close_db_session, get_db_session, get_engine, Tasks, Archived, ChangeLog
+from app.models.database import Base
 from app.config import Config
+import asyncio
 import os
 import json
+import tempfile
+from sqlalchemy import text
+
+
+def file_database(test_case):
+    """URI of a new SQLite file removed after `test_case`, for tests that share the database between threads."""
+    tmp_dir = tempfile.TemporaryDirectory()
+    test_case.addCleanup(tmp_dir.cleanup)
+    return 'sqlite:///' + os.path.join(tmp_dir.name, 'test.db')
+
 
 class AppTestCase(unittest.TestCase):
     def setUp(self):
@@ -20,15 +31,13 @@ class AppTestCase(unittest.TestCase):
 
         self.app_context = self.app.app_context()
         self.app_context.push()
-
-        # Ensure a clean database for each test
-        Base.metadata.drop_all(bind=engine) # Drop all tables
-        init_db() # Recreate tables
+        # Every app gets a new, empty in-memory database on first use
 
     def tearDown(self):
         """Tear down all initialized variables."""
         close_db_session()
         self.app_context.pop()
+        self.app.extensions['database'].dispose()
 
     def test_app_exists(self):
         """Test if the application instance exists."""
@@ -225,5 +234,1497 @@ class AppTestCase(unittest.TestCase):
         json_response_page3 = json.loads(response_page3.data.decode('utf-8'))
         self.assertEqual(len(json_response_page3), 0)
 
+    def test_get_tasks_cursor_pagination(self):
+        for i in range(12):
+            self.client.post('/api/add',
+                             data=json.dumps({'task_description': f'Task {i+1}'}),
+                             content_type='application/json')
+
+        response_page1 = self.client.get('/api/tasks?before_id=1000')
+        self.assertEqual(response_page1.status_code, 200)
+        json_response_page1 = json.loads(response_page1.data.decode('utf-8'))
+        self.assertEqual(len(json_response_page1['tasks']), 10)
+        self.assertEqual(json_response_page1['tasks'][0]['TODO'], 'Task 12')
+        self.assertIsNotNone(json_response_page1['next_cursor'])
+
+        response_page2 = self.client.get(f"/api/tasks?cursor={json_response_page1['next_cursor']}")
+        json_response_page2 = json.loads(response_page2.data.decode('utf-8'))
+        self.assertEqual([t['TODO'] for t in json_response_page2['tasks']], ['Task 2', 'Task 1'])
+        self.assertIsNone(json_response_page2['next_cursor'])
+
+        # after_id walks towards newer items but still returns newest first
+        last_id = json_response_page2['tasks'][0]['id']
+        response_newer = self.client.get(f'/api/tasks?after_id={last_id}')
+        json_response_newer = json.loads(response_newer.data.decode('utf-8'))
+        self.assertEqual(json_response_newer['tasks'][0]['TODO'], 'Task 12')
+        self.assertEqual(json_response_newer['tasks'][-1]['TODO'], 'Task 3')
+
+        response_bad = self.client.get('/api/tasks?cursor=not-a-cursor')
+        self.assertEqual(response_bad.status_code, 400)
+
+        # Two bounds at once are rejected rather than one of them silently ignored
+        response_both = self.client.get(f'/api/tasks?before_id=1000&after_id={last_id}')
+        self.assertEqual((response_both.status_code, response_both.get_json()),
+                         (400, {'error': 'before_id and after_id cannot be combined'}))
+        response_both = self.client.post('/api/sync', json={'fetch_tasks': True, 'tasks_before_id': 5, 'tasks_after_id': 1})
+        self.assertEqual((response_both.status_code, response_both.get_json()),
+                         (400, {'error': 'tasks_before_id and tasks_after_id cannot be combined'}))
+
+    def test_sync_archives_cursor(self):
+        db_session = get_db_session()
+        for i in range(12):
+            self.client.post('/api/add', data=json.dumps({'task_description': f'Archive Task {i+1}'}), content_type='application/json')
+            task_to_archive = db_session.query(Tasks).filter_by(TODO=f'Archive Task {i+1}').first()
+            self.client.post('/api/archive', data=json.dumps({'task_id': task_to_archive.id}), content_type='application/json')
+
+        response = self.client.post('/api/sync', data=json.dumps({'fetch_archives': True}), content_type='application/json')
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_response['archives']), 10)
+
+        response = self.client.post('/api/sync',
+                                    data=json.dumps({'fetch_archives': True,
+                                                     'archives_cursor': json_response['archives_next_cursor']}),
+                                    content_type='application/json')
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([a['Finished'] for a in json_response['archives']], ['Archive Task 2', 'Archive Task 1'])
+        self.assertIsNone(json_response['archives_next_cursor'])
+
+    def test_sync_rejects_malformed_ids_and_pages(self):
+        for body in ({'fetch_tasks': True, 'tasks_before_id': [1]},
+                     {'fetch_archives': True, 'archives_after_id': {'id': 1}},
+                     {'fetch_tasks': True, 'tasks_page': 'x'},
+                     {'fetch_archives': True, 'archives_page': [2]},
+                     {'fetch_tasks': True, 'tasks_page': True},
+                     ['fetch_tasks']):
+            response = self.client.post('/api/sync', data=json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        response = self.client.post('/api/sync', data=json.dumps({'fetch_tasks': True, 'tasks_page': '2'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_sync_fetches_many_ids(self):
+        ids = self.client.post('/api/batch', data=json.dumps({'add': ['One', 'Two', 'Three']}),
+                               content_type='application/json').get_json()['add']
+        task_ids = [item['id'] for item in ids]
+        archive_id = self.client.post('/api/archive', data=json.dumps({'task_id': task_ids[1]}),
+                                      content_type='application/json').get_json()['archived_task_id']
+
+        body = {'fetch_task_ids': [task_ids[2], task_ids[0], task_ids[1], task_ids[0]],
+                'fetch_archive_ids': [archive_id, 999]}
+        response = self.client.post('/api/sync', data=json.dumps(body), content_type='application/json')
+        data = response.get_json()
+        self.assertEqual(data['tasks_by_id'], [{'id': task_ids[2], 'TODO': 'Three'}, {'id': task_ids[0], 'TODO': 'One'}])
+        self.assertEqual(data['missing_task_ids'], [task_ids[1]])
+        self.assertEqual(data['archives_by_id'], [{'id': archive_id, 'Finished': 'Two'}])
+        self.assertEqual(data['missing_archive_ids'], [999])
+        self.assertNotIn('tasks', data)
+
+        # More ids than one IN (...) takes
+        many = list(range(1, 1201))
+        data = self.client.post('/api/sync', data=json.dumps({'fetch_task_ids': many}),
+                                content_type='application/json').get_json()
+        self.assertEqual([row['id'] for row in data['tasks_by_id']], [task_ids[0], task_ids[2]])
+        self.assertEqual(len(data['missing_task_ids']), 1198)
+
+        for bad in ({'fetch_task_ids': 5}, {'fetch_archive_ids': ['1']}, {'fetch_task_ids': [True]}):
+            response = self.client.post('/api/sync', data=json.dumps(bad), content_type='application/json')
+            self.assertEqual(response.status_code, 400, bad)
+        self.app.config['BATCH_MAX_ITEMS'] = 10
+        response = self.client.post('/api/sync', data=json.dumps({'fetch_task_ids': many[:11]}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+
+    def test_keyset_deep_page_cost_is_flat(self):
+        """The last page costs the same SQLite work however large the table is."""
+        from sqlalchemy import insert
+        from app.control_endpoints import controller
+        db_session = get_db_session()
+
+        def vm_steps(**kwargs):
+            steps = [0]
+            raw = db_session.connection().connection.driver_connection
+            raw.set_progress_handler(lambda: steps.__setitem__(0, steps[0] + 1) or 0, 10)
+            try:
+                controller.get_tasks(**kwargs)
+            finally:
+                raw.set_progress_handler(None, 10)
+            return steps[0]
+
+        costs = {}
+        for size in (2000, 20000):
+            db_session.query(Tasks).delete()
+            db_session.execute(insert(Tasks), [{'id': i + 1, 'TODO': f'Task {i+1}'} for i in range(size)])
+            db_session.commit()
+            last_page = size // self.app.config['TASKS_PER_PAGE']
+            costs[size] = (vm_steps(before_id=11), vm_steps(page=last_page))
+
+        keyset_small, offset_small = costs[2000]
+        keyset_large, offset_large = costs[20000]
+        self.assertLessEqual(keyset_large, keyset_small + 1)
+        self.assertGreater(offset_large, offset_small * 5)
+
+    def test_batch_mutations(self):
+        response = self.client.post('/api/batch',
+                                    data=json.dumps({'add': ['Batch 1', 'Batch 2', 'Batch 3']}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        added = json.loads(response.data.decode('utf-8'))['add']
+        self.assertEqual([a['task'] for a in added], ['Batch 1', 'Batch 2', 'Batch 3'])
+        ids = [a['id'] for a in added]
+
+        response = self.client.post('/api/batch',
+                                    data=json.dumps({'archive': [ids[2], ids[0], 999]}),
+                                    content_type='application/json')
+        archived = json.loads(response.data.decode('utf-8'))['archive']
+        self.assertEqual([a['task_id'] for a in archived], [ids[2], ids[0], 999])
+        self.assertEqual(archived[2]['error'], 'not found')
+        db_session = get_db_session()
+        self.assertEqual(db_session.get(Archived, archived[0]['archived_task_id']).Finished, 'Batch 3')
+        self.assertEqual(db_session.get(Archived, archived[1]['archived_task_id']).Finished, 'Batch 1')
+        self.assertEqual([t.TODO for t in db_session.query(Tasks).all()], ['Batch 2'])
+
+        response = self.client.post('/api/batch',
+                                    data=json.dumps({'unArchive': [archived[0]['archived_task_id']],
+                                                     'perm_delete': [archived[1]['archived_task_id'], 999]}),
+                                    content_type='application/json')
+        json_response = json.loads(response.data.decode('utf-8'))
+        restored_id = json_response['unArchive'][0]['task_id']
+        self.assertEqual(db_session.get(Tasks, restored_id).TODO, 'Batch 3')
+        self.assertEqual([d['deleted'] for d in json_response['perm_delete']], [True, False])
+        self.assertEqual(db_session.query(Archived).count(), 0)
+
+    def test_stats_and_totals(self):
+        self.assertEqual(self.client.get('/api/stats').get_json(), {'tasks': 0, 'archives': 0})
+        ids = [item['id'] for item in self._post('/api/batch', {'add': [f'Task {i}' for i in range(12)]})['add']]
+        archive_id = self._post('/api/archive', {'task_id': ids[0]})['archived_task_id']
+        self._post('/api/archive', {'task_id': ids[1]})
+        self._post('/api/perm_delete', {'archive_id': archive_id})
+        self._post('/api/batch', {'add': ['More'], 'archive': [ids[2], 999]})
+
+        response = self.client.get('/api/stats')
+        self.assertEqual(response.get_json(), {'tasks': 10, 'archives': 2})
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get('/api/stats', headers={'If-None-Match': etag}).status_code, 304)
+
+        # Plain pages become an object when the total is asked for; keyset pages just gain it
+        body = self.client.get('/api/tasks?page=1&total=1').get_json()
+        self.assertEqual((body['total'], body['pages'], len(body['tasks'])), (10, 1, 10))
+        self.assertIsInstance(self.client.get('/api/tasks?page=1').get_json(), list)
+        body = self.client.get(f'/api/archives?before_id={10 ** 6}&total=1').get_json()
+        self.assertEqual((body['total'], body['pages'], len(body['archives'])), (2, 1, 2))
+        self.assertIn('next_cursor', body)
+
+        self._post('/api/add', {'task_description': 'Eleventh'})
+        body = self.client.get('/api/tasks?page=2&total=1').get_json()
+        self.assertEqual((body['total'], body['pages'], len(body['tasks'])), (11, 2, 1))
+        body = self._post('/api/sync', {'fetch_totals': True})
+        self.assertEqual((body['tasks_total'], body['archives_total']), (11, 2))
+        self.assertNotIn('tasks_total', self._post('/api/sync', {'fetch_tasks': True}))
+
+    def test_recount_repairs_counters(self):
+        from app.models.database import Counters, recount_rows
+        self._post('/api/batch', {'add': ['One', 'Two']})
+        db_session = get_db_session()
+        db_session.query(Counters).filter_by(name='Tasks.count').update({'value': 7})
+        db_session.commit()
+        etag = self.client.get('/api/stats').headers['ETag']
+        self.assertEqual(self.client.get('/api/stats').get_json()['tasks'], 7)
+
+        self.assertEqual(recount_rows(get_engine()), {'Tasks.count': (7, 2), 'Archived.count': (0, 0)})
+        # The corrected count comes with a new version, so clients holding the old ETag refetch
+        response = self.client.get('/api/stats', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'tasks': 2, 'archives': 0})
+        self.assertEqual(recount_rows(get_engine()), {'Tasks.count': (2, 2), 'Archived.count': (0, 0)})
+
+    def test_batch_validation(self):
+        response = self.client.post('/api/batch', data=json.dumps({}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/batch', data=json.dumps({'archive': ['x']}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/batch', data=json.dumps({'perm_delete': [True]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_repeated_ids_get_one_result_each(self):
+        task_id = self._post('/api/add', {'task_description': 'Twice'})['id']
+        archived = self._post('/api/batch', {'archive': [task_id, 999, task_id]})['archive']
+        self.assertEqual([item['task_id'] for item in archived], [task_id, 999, task_id])
+        self.assertEqual(archived[0], archived[2])
+        archive_id = archived[0]['archived_task_id']
+        deleted = self._post('/api/batch', {'perm_delete': [archive_id, archive_id]})['perm_delete']
+        self.assertEqual(deleted, [{'archive_id': archive_id, 'deleted': True}] * 2)
+        self.assertEqual(get_db_session().query(Archived).count(), 0)
+
+    def test_list_cache_hits_and_invalidation(self):
+        self.client.post('/api/add', data=json.dumps({'task_description': 'Cached Task'}), content_type='application/json')
+        first = json.loads(self.client.get('/api/tasks').data.decode('utf-8'))
+        second = json.loads(self.client.get('/api/tasks').data.decode('utf-8'))
+        self.assertEqual(first, second)
+        stats = json.loads(self.client.get('/api/cache_stats').data.decode('utf-8'))
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+        # A mutation bumps the version, so the next read is rebuilt
+        self.client.post('/api/add', data=json.dumps({'task_description': 'Newer Task'}), content_type='application/json')
+        third = json.loads(self.client.get('/api/tasks').data.decode('utf-8'))
+        self.assertEqual([t['TODO'] for t in third], ['Newer Task', 'Cached Task'])
+        stats = json.loads(self.client.get('/api/cache_stats').data.decode('utf-8'))
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_list_cache_follows_changes_from_other_writers(self):
+        """Another worker or `manage.py import` only bumps the Counters row; the cached page must not outlive it."""
+        self._post('/api/add', {'task_description': 'Cached Task'})
+        first = self.client.get('/api/tasks')
+        self.assertEqual([t['TODO'] for t in json.loads(first.data)], ['Cached Task'])
+
+        db_session = get_db_session()
+        db_session.execute(text("INSERT INTO Tasks (TODO) VALUES ('Written elsewhere')"))
+        db_session.execute(text("UPDATE Counters SET value = value + 1 WHERE name = 'Tasks.version'"))
+        db_session.commit()
+
+        second = self.client.get('/api/tasks')
+        self.assertNotEqual(second.headers['ETag'], first.headers['ETag'])
+        self.assertEqual([t['TODO'] for t in json.loads(second.data)], ['Written elsewhere', 'Cached Task'])
+
+    def test_list_encoder_without_orjson(self):
+        from unittest import mock
+        import app.encoding as encoding
+        payload = {'tasks': encoding.row_dicts([(2, 'Café ☕'), (1, 'Plain "quoted"')], 'TODO'), 'next_cursor': None}
+        fast = encoding.dumps(payload)
+        with mock.patch.object(encoding, 'orjson', None):
+            fallback = encoding.dumps(payload)
+        self.assertEqual(json.loads(fallback), payload)
+        if encoding.orjson is not None:
+            self.assertEqual(fallback, fast)
+
+    def test_local_lru_backend_evicts(self):
+        from app.cache import LocalLRUBackend
+        backend = LocalLRUBackend(max_entries=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)  # evicts 'b', the least recently used
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('a'), 1)
+        self.assertEqual(backend.stats()['evictions'], 1)
+
+    def test_conditional_get_tasks(self):
+        self.client.post('/api/add', data=json.dumps({'task_description': 'Polled Task'}), content_type='application/json')
+        response = self.client.get('/api/tasks')
+        etag = response.headers['ETag']
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+
+        not_modified = self.client.get('/api/tasks', headers={'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b'')
+        self.assertEqual(not_modified.headers['ETag'], etag)
+
+        # A failed mutation leaves the ETag valid, a successful one does not
+        self.client.post('/api/perm_delete', data=json.dumps({'archive_id': 999}), content_type='application/json')
+        self.assertEqual(self.client.get('/api/tasks', headers={'If-None-Match': etag}).status_code, 304)
+        self.client.post('/api/add', data=json.dumps({'task_description': 'Another Task'}), content_type='application/json')
+        modified = self.client.get('/api/tasks', headers={'If-None-Match': etag})
+        self.assertEqual(modified.status_code, 200)
+        self.assertNotEqual(modified.headers['ETag'], etag)
+
+    def test_conditional_sync_varies_on_body(self):
+        body = json.dumps({'fetch_tasks': True})
+        response = self.client.post('/api/sync', data=body, content_type='application/json')
+        etag = response.headers['ETag']
+        same = self.client.post('/api/sync', data=body, content_type='application/json',
+                                headers={'If-None-Match': etag})
+        self.assertEqual(same.status_code, 304)
+        other = self.client.post('/api/sync', data=json.dumps({'fetch_archives': True}),
+                                 content_type='application/json', headers={'If-None-Match': etag})
+        self.assertEqual(other.status_code, 200)
+
+    def test_gzip_compression_negotiated(self):
+        import gzip
+        self._post('/api/batch', {'add': [f'Compressible task number {i} ' * 5 for i in range(40)]})
+        plain = self.client.get('/api/tasks')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        packed = self.client.get('/api/tasks', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(packed.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(packed.data), plain.data)
+        self.assertEqual(packed.headers['ETag'], plain.headers['ETag'][:-1] + '-gzip"')
+        not_modified = self.client.get('/api/tasks', headers={'Accept-Encoding': 'gzip',
+                                                              'If-None-Match': packed.headers['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers['ETag'], packed.headers['ETag'])
+
+        # Below COMPRESS_MIN_SIZE, or refused by the client, the body goes out as it is
+        small = self.client.get('/api/archives', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', small.headers)
+        refused = self.client.get('/api/tasks', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', refused.headers)
+
+        # Streams are compressed chunk by chunk
+        exported = self.client.get('/api/export', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(exported.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(exported.data), self.client.get('/api/export').data)
+
+    def test_list_formats_negotiated(self):
+        import app.encoding as encoding
+        self._post('/api/batch', {'add': ['First', 'Second']})
+        rows = self.client.get('/api/tasks')
+        columnar = self.client.get('/api/tasks', headers={'Accept': encoding.COLUMNAR_JSON})
+        self.assertEqual(columnar.mimetype, encoding.COLUMNAR_JSON)
+        self.assertEqual(json.loads(columnar.data), {'ids': [2, 1], 'texts': ['Second', 'First']})
+        self.assertNotEqual(columnar.headers['ETag'], rows.headers['ETag'])
+        self.assertIn('Accept', columnar.headers['Vary'])
+        keyset = self.client.get('/api/tasks?before_id=2', headers={'Accept': encoding.COLUMNAR_JSON})
+        self.assertEqual(json.loads(keyset.data), {'tasks': {'ids': [1], 'texts': ['First']}, 'next_cursor': None})
+        synced = self.client.post('/api/sync', data=json.dumps({'fetch_tasks': True}), content_type='application/json',
+                                  headers={'Accept': encoding.COLUMNAR_JSON})
+        self.assertEqual(json.loads(synced.data)['tasks'], {'ids': [2, 1], 'texts': ['Second', 'First']})
+
+        # Unknown types, and msgpack without the library, fall back to JSON
+        self.assertEqual(self.client.get('/api/tasks', headers={'Accept': 'text/html'}).data, rows.data)
+        packed = self.client.get('/api/tasks', headers={'Accept': encoding.MSGPACK})
+        if encoding.msgpack is None:
+            self.assertEqual((packed.mimetype, packed.data), ('application/json', rows.data))
+        else:
+            self.assertEqual(packed.mimetype, encoding.MSGPACK)
+            self.assertEqual(encoding.msgpack.unpackb(packed.data), json.loads(rows.data))
+
+    def _post(self, url, body):
+        response = self.client.post(url, data=json.dumps(body), content_type='application/json')
+        return json.loads(response.data.decode('utf-8'))
+
+    def test_delta_sync_since_rev(self):
+        kept_id = self._post('/api/add', {'task_description': 'Kept Task'})['id']
+        rev = self._post('/api/sync', {'fetch_tasks': True})['rev']
+        self.assertGreater(rev, 0)
+
+        new_id = self._post('/api/add', {'task_description': 'New Task'})['id']
+        archived_id = self._post('/api/archive', {'task_id': kept_id})['archived_task_id']
+        gone_id = self._post('/api/add', {'task_description': 'Short-lived Task'})['id']
+        self._post('/api/archive', {'task_id': gone_id})
+
+        delta = self._post('/api/sync', {'since_rev': rev})
+        self.assertFalse(delta['reset'])
+        self.assertGreater(delta['rev'], rev)
+        changes = delta['changes']
+        self.assertEqual(changes['tasks']['upserted'], [{'id': new_id, 'TODO': 'New Task'}])
+        self.assertEqual(changes['tasks']['deleted'], sorted([kept_id, gone_id]))
+        self.assertIn({'id': archived_id, 'Finished': 'Kept Task'}, changes['archives']['upserted'])
+        self.assertIn({'from': 'tasks', 'id': kept_id, 'to': 'archives', 'new_id': archived_id}, changes['moved'])
+
+        # Nothing changed since the new head
+        delta = self._post('/api/sync', {'since_rev': delta['rev']})
+        self.assertEqual(delta['changes']['tasks'], {'upserted': [], 'deleted': []})
+
+    def test_delta_sync_reset_after_compaction(self):
+        self.assertTrue(self._post('/api/sync', {'since_rev': 0})['reset'])
+        self.app.config['CHANGELOG_RETENTION'] = 3
+        self.app.config['CHANGELOG_COMPACT_INTERVAL'] = 2
+        self._post('/api/add', {'task_description': 'First'})
+        rev = self._post('/api/sync', {})['rev']
+        for i in range(6):
+            self._post('/api/add', {'task_description': f'Task {i}'})
+        self.assertTrue(self._post('/api/sync', {'since_rev': rev})['reset'])
+        self.assertLessEqual(get_db_session().query(ChangeLog).count(), 4)
+
+    def test_export_import_roundtrip(self):
+        self._post('/api/batch', {'add': ['Export 1', 'Export 2', 'Export 3']})
+        task_id = self._post('/api/sync', {'fetch_tasks': True})['tasks'][-1]['id']
+        self._post('/api/archive', {'task_id': task_id})
+
+        response = self.client.get('/api/export')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.data.decode('utf-8').splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([r['type'] for r in records], ['task', 'task', 'archive'])
+        self.assertEqual(records[2]['Finished'], 'Export 1')
+
+        # Re-import into an empty database, keeping the exported ids
+        Base.metadata.drop_all(bind=get_engine())
+        init_db()
+        response = self.client.post('/api/import?keep_ids=1', data='\n'.join(lines) + '\n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual((json_response['tasks'], json_response['archives']), (2, 1))
+        exported_again = self.client.get('/api/export').data.decode('utf-8').splitlines()
+        self.assertEqual(exported_again, lines)
+        self.assertEqual(self.client.get('/api/stats').get_json(), {'tasks': 2, 'archives': 1})
+        # Clients syncing across an import have to refetch
+        self.assertTrue(self._post('/api/sync', {'since_rev': 1})['reset'])
+
+    def test_import_stops_at_malformed_line(self):
+        body = json.dumps({'type': 'task', 'TODO': 'Good'}) + '\nnot json\n'
+        response = self.client.post('/api/import', data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['error'], 'line 2 is not valid JSON')
+        self.assertEqual(json_response['tasks'], 1)
+
+    def test_import_rejects_taken_ids(self):
+        self._post('/api/batch', {'add': ['Existing 1', 'Existing 2']})
+        self.app.config['IMPORT_BATCH_SIZE'] = 2
+        records = [{'type': 'task', 'id': 10, 'TODO': 'New 10'}, {'type': 'archive', 'id': 10, 'Finished': 'Done 10'},
+                   {'type': 'task', 'id': 11, 'TODO': 'New 11'}, {'type': 'task', 'id': 2, 'TODO': 'Taken'}]
+        body = ''.join(json.dumps(record) + '\n' for record in records)
+        response = self.client.post('/api/import?keep_ids=1', data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        # The first batch is kept, the one with the taken id is rolled back as a whole
+        self.assertEqual(response.get_json(), {'error': 'records 3-4 reuse an id that already exists',
+                                               'tasks': 1, 'archives': 1})
+        self.assertEqual(self.client.get('/api/stats').get_json(), {'tasks': 3, 'archives': 1})
+
+        body = ''.join(json.dumps({'type': 'task', 'id': 20, 'TODO': 'Twice'}) + '\n' for _ in range(2))
+        response = self.client.post('/api/import?keep_ids=1', data=body, content_type='application/x-ndjson')
+        self.assertEqual((response.status_code, response.get_json()['error']), (400, 'record 2 repeats task id 20'))
+
+    def test_metrics_endpoint(self):
+        self._post('/api/add', {'task_description': 'Measured Task'})
+        self.client.get('/api/tasks')
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.mimetype.startswith('text/plain'))
+        body = response.data.decode('utf-8')
+        self.assertIn('todo_request_duration_seconds_count{endpoint="/api/add",method="POST"} 1', body)
+        self.assertIn('todo_requests_total{endpoint="/api/tasks",method="GET",status="200"} 1', body)
+        self.assertIn('todo_db_commit_duration_seconds_count 1', body)
+        self.assertIn('todo_response_cache_misses_total 1', body)
+        queries = [line for line in body.splitlines()
+                   if line.startswith('todo_db_queries_total{endpoint="/api/add"')]
+        self.assertGreater(int(queries[0].rsplit(' ', 1)[1]), 0)
+
+    def test_metrics_skip_work_outside_requests(self):
+        from app.control_endpoints import controller
+        from app.metrics import _current_stats, finish_request, start_request
+        from sqlalchemy.exc import OperationalError
+        # Like the write queue or maintenance threads: no request, so nothing is recorded
+        controller.add_todo('Background write')
+        self.assertIsNone(_current_stats.get())
+
+        start_request()
+        with self.assertRaises(OperationalError):
+            get_db_session().execute(text('SELECT * FROM missing_table'))
+        get_db_session().rollback()
+        get_db_session().execute(text('SELECT 1'))
+        stats = finish_request()
+        # The failed statement left no start time behind for the next one to pick up
+        self.assertEqual(stats['queries'], 1)
+        self.assertLess(stats['db_seconds'], 1)
+        self.assertIsNone(_current_stats.get())
+
+    def test_slow_request_log(self):
+        app = create_app(type('SlowConfig', (Config,), {'SLOW_REQUEST_MS': 0, 'DATABASE_URI': 'sqlite:///:memory:'}))
+        with self.assertLogs(app.logger, level='WARNING') as logs:
+            app.test_client().get('/api/tasks')
+        app.extensions['database'].dispose()
+        self.assertIn('Slow request GET /api/tasks', logs.output[0])
+
+    def test_search_ranked_and_paginated(self):
+        self._post('/api/batch', {'add': [f'Buy groceries {i}' for i in range(12)] + ['Call the plumber', 'Plan a trip']})
+        plumber_id = self._post('/api/sync', {'fetch_tasks': True})['tasks'][1]['id']
+        self._post('/api/archive', {'task_id': plumber_id})
+
+        response = self.client.get('/api/search?q=groc*&scope=tasks')
+        self.assertEqual(response.status_code, 200)
+        page1 = json.loads(response.data.decode('utf-8'))['tasks']
+        self.assertEqual(len(page1['results']), 10)
+        response = self.client.get(f"/api/search?q=groc*&scope=tasks&cursor={page1['next_cursor']}")
+        page2 = json.loads(response.data.decode('utf-8'))['tasks']
+        self.assertEqual(len(page2['results']), 2)
+        self.assertIsNone(page2['next_cursor'])
+        ids = [r['id'] for r in page1['results'] + page2['results']]
+        self.assertEqual(len(set(ids)), 12)
+
+        # The index follows archive moves through the triggers
+        response = self.client.get('/api/search?q=plumber')
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['tasks']['results'], [])
+        self.assertEqual([r['Finished'] for r in json_response['archives']['results']], ['Call the plumber'])
+
+        self.assertEqual(self.client.get('/api/search?q=%22%22').status_code, 400)
+        self.assertEqual(self.client.get('/api/search?q=trip&scope=nope').status_code, 400)
+
+    def test_search_index_rebuilt_for_existing_rows(self):
+        from app.models.database import init_search_index
+        db_session = get_db_session()
+        # A database created before search existed has neither the index nor its triggers
+        for statement in ("DROP TRIGGER Tasks_fts_ai", "DROP TRIGGER Tasks_fts_ad",
+                          "DROP TRIGGER Tasks_fts_au", "DROP TABLE Tasks_fts"):
+            db_session.execute(text(statement))
+        db_session.add(Tasks(TODO='Written before the index existed'))
+        db_session.commit()
+        with get_engine().begin() as conn:
+            self.assertTrue(init_search_index(conn))
+        response = self.client.get('/api/search?q=index&scope=tasks')
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_response['tasks']['results']), 1)
+
+
+    def _open_events(self, headers=None):
+        """Open /api/events unbuffered; returns the response and an iterator of decoded chunks."""
+        self.app.config['SSE_HEARTBEAT_SECONDS'] = 0.01
+        response = self.client.get('/api/events', headers=headers or {}, buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        chunks = (chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in response.response)
+        return response, chunks
+
+    def test_event_hub_fans_out(self):
+        from app.events import EventHub
+        hub = EventHub()
+        hub.max_subscribers = 3
+        subscriptions = [hub.subscribe() for _ in range(3)]
+        self.assertIsNone(hub.subscribe())
+        hub.publish([(1, {'op': 'add', 'list': 'tasks', 'id': 7})])
+        for subscription in subscriptions:
+            self.assertTrue(subscription.wait(0))
+            self.assertEqual(subscription.drain(), ([(1, {'op': 'add', 'list': 'tasks', 'id': 7})], False))
+        hub.unsubscribe(subscriptions[0])
+        hub.publish([(2, {'op': 'delete', 'list': 'archives', 'id': 3})])
+        self.assertEqual(subscriptions[0].drain(), ([], False))
+        self.assertEqual(len(subscriptions[1].drain()[0]), 1)
+
+    def test_events_ready_heartbeat_and_live_change(self):
+        self._post('/api/add', {'task_description': 'Before'})
+        response, chunks = self._open_events()
+        try:
+            self.assertTrue(next(chunks).startswith('retry: '))
+            self.assertEqual(next(chunks), 'id: 1\nevent: ready\ndata: {"rev":1}\n\n')
+            self.assertEqual(next(chunks), ': keepalive\n\n')
+            task_id = self._post('/api/add', {'task_description': 'Live'})['id']
+            self.assertEqual(next(chunks), f'id: 2\nevent: change\ndata: {{"op":"add","list":"tasks","id":{task_id}}}\n\n')
+        finally:
+            response.close()
+        self.assertEqual(self.app.extensions['event_hub'].metrics()['todo_events_subscribers'][2], 0)
+
+    def test_events_resume_from_last_event_id(self):
+        task_id = self._post('/api/add', {'task_description': 'One'})['id']
+        archive_id = self._post('/api/archive', {'task_id': task_id})['archived_task_id']
+        response, chunks = self._open_events({'Last-Event-ID': '1'})
+        try:
+            next(chunks)
+            self.assertEqual(
+                next(chunks),
+                f'id: 2\nevent: change\ndata: {{"op":"archive","list":"tasks","id":{task_id},"archive_id":{archive_id}}}\n\n',
+            )
+        finally:
+            response.close()
+        self.assertEqual(self.client.get('/api/events', headers={'Last-Event-ID': 'x'}).status_code, 400)
+
+    def test_events_overflow_replays_then_resets(self):
+        self._post('/api/add', {'task_description': 'Before'})
+        self.app.extensions['event_hub'].queue_size = 2
+        response, chunks = self._open_events()
+        try:
+            next(chunks), next(chunks)
+            # Five events overflow the queue of two; the stream reads them from the change log
+            self._post('/api/batch', {'add': [f'Task {i}' for i in range(5)]})
+            replayed = next(chunks)
+            self.assertEqual([line for line in replayed.splitlines() if line.startswith('id: ')],
+                             [f'id: {rev}' for rev in range(2, 7)])
+
+            # Once the entries it needs are compacted away, the stream can only reset
+            self._post('/api/batch', {'add': [f'Task {i}' for i in range(5)]})
+            db_session = get_db_session()
+            db_session.execute(text("DELETE FROM ChangeLog WHERE rev <= 9"))
+            db_session.commit()
+            self.assertEqual(next(chunks), 'id: 11\nevent: change\ndata: {"op":"reset"}\n\n')
+        finally:
+            response.close()
+
+    def test_pending_events_dropped_on_rollback(self):
+        from app.events import queue_events
+        event_hub = self.app.extensions['event_hub']
+        subscription = event_hub.subscribe()
+        try:
+            db_session = get_db_session()
+            db_session.execute(text("INSERT INTO Tasks (TODO) VALUES ('Rolled back')"))
+            queue_events(db_session, [('Tasks', 'insert', 5, None)], [1])
+            db_session.rollback()
+            self.assertEqual(db_session.info.get('pending_events'), None)
+            db_session.commit()
+            self.assertEqual(subscription.drain(), ([], False))
+
+            queue_events(db_session, [('Tasks', 'insert', 5, None)], [1])
+            db_session.commit()
+            self.assertEqual(subscription.drain(), ([(1, {'op': 'add', 'list': 'tasks', 'id': 5})], False))
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    def test_retention_purges_in_batches(self):
+        from app.maintenance import run_maintenance
+        from app.models.database import epoch_seconds
+        ids = [item['id'] for item in self._post('/api/batch', {'add': [f'Done {i}' for i in range(7)]})['add']]
+        archived = [item['archived_task_id'] for item in self._post('/api/batch', {'archive': ids})['archive']]
+        old = archived[:5]
+        get_db_session().execute(text(f"UPDATE Archived SET archived_at = {epoch_seconds() - 40 * 86400} "
+                                      f"WHERE id IN ({','.join(map(str, old))})"))
+        get_db_session().commit()
+        rev = self._post('/api/sync', {})['rev']
+
+        config = dict(self.app.config, RETENTION_MAX_AGE_DAYS=30, RETENTION_BATCH_SIZE=2, RETENTION_BATCH_PAUSE_MS=0)
+        report = run_maintenance(config)
+        self.assertEqual((report['purged'], report['batches'], report['errors']), (5, 3, 0))
+        self.assertGreaterEqual(report['lock_max_ms'], 0)
+        self.assertEqual(sorted(a['id'] for a in json.loads(self.client.get('/api/archives').data)), archived[5:])
+        self.assertEqual(self._post('/api/sync', {'since_rev': rev})['changes']['archives']['deleted'], sorted(old))
+
+        config.update(RETENTION_MAX_AGE_DAYS=None, RETENTION_MAX_ARCHIVES=1)
+        self.assertEqual(run_maintenance(config)['purged'], 1)
+        self.assertEqual([a['id'] for a in json.loads(self.client.get('/api/archives').data)], [archived[6]])
+
+    def test_archiving_keeps_creation_time(self):
+        task_id = self._post('/api/add', {'task_description': 'Timed'})['id']
+        get_db_session().execute(text(f"UPDATE Tasks SET created_at = 1000 WHERE id = {task_id}"))
+        get_db_session().commit()
+        archived_id = self._post('/api/archive', {'task_id': task_id})['archived_task_id']
+        archive = get_db_session().get(Archived, archived_id)
+        self.assertEqual(archive.created_at, 1000)
+        self.assertGreater(archive.archived_at, 1000)
+
+
+class AsyncAPITestCase(unittest.IsolatedAsyncioTestCase):
+    """The ASGI app answers like the Flask blueprint, on the same database."""
+
+    async def asyncSetUp(self):
+        from app.asgi import create_asgi_app
+
+        class AsyncTestConfig(Config):
+            TESTING = True
+            # The async engine has to see the tables the sync engine creates
+            DATABASE_URI = file_database(self)
+            TASKS_PER_PAGE = 10
+
+        self.api = create_asgi_app(AsyncTestConfig)
+
+    async def asyncTearDown(self):
+        await self.api.logic.engine.dispose()
+        self.api.database.dispose()
+
+    async def call(self, method, path, body=None, headers=None):
+        """Send one request through the ASGI app; returns ``(status, headers, body)``."""
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+            'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        }
+        chunks = [json.dumps(body).encode() if not isinstance(body, (bytes, type(None))) else (body or b'')]
+        sent = []
+
+        async def receive():
+            if chunks:
+                return {'type': 'http.request', 'body': chunks.pop(0), 'more_body': False}
+            await asyncio.Event().wait()    # like a server: nothing more until the client goes away
+
+        async def send(message):
+            sent.append(message)
+
+        await self.api(scope, receive, send)
+        response_headers = {name.decode(): value.decode() for name, value in sent[0]['headers']}
+        return sent[0]['status'], response_headers, b''.join(m.get('body', b'') for m in sent[1:])
+
+    async def test_mutations_and_lists(self):
+        status, _, body = await self.call('POST', '/api/add', {'task_description': 'Async task'})
+        self.assertEqual(status, 201)
+        task_id = json.loads(body)['id']
+        status, _, body = await self.call('POST', '/api/batch', {'add': ['Second', 'Third']})
+        self.assertEqual([item['task'] for item in json.loads(body)['add']], ['Second', 'Third'])
+
+        status, _, body = await self.call('POST', '/api/archive', {'task_id': task_id})
+        self.assertEqual(status, 200)
+        archive_id = json.loads(body)['archived_task_id']
+        status, _, _ = await self.call('POST', '/api/archive', {'task_id': task_id})
+        self.assertEqual(status, 404)
+
+        status, headers, body = await self.call('GET', '/api/tasks')
+        self.assertEqual([task['TODO'] for task in json.loads(body)], ['Third', 'Second'])
+        status, _, _ = await self.call('GET', '/api/tasks', headers={'If-None-Match': headers['etag']})
+        self.assertEqual(status, 304)
+        status, _, body = await self.call('GET', '/api/archives?before_id=1000')
+        self.assertEqual(json.loads(body)['archives'], [{'id': archive_id, 'Finished': 'Async task'}])
+        status, _, body = await self.call('GET', '/api/tasks?total=1')
+        self.assertEqual((json.loads(body)['total'], json.loads(body)['pages']), (2, 1))
+
+        status, _, _ = await self.call('POST', '/api/perm_delete', {'archive_id': archive_id})
+        self.assertEqual(status, 200)
+        status, _, body = await self.call('GET', '/api/stats')
+        self.assertEqual(json.loads(body), {'tasks': 2, 'archives': 0})
+        status, _, body = await self.call('POST', '/api/sync', {'fetch_totals': True})
+        self.assertEqual((json.loads(body)['tasks_total'], json.loads(body)['archives_total']), (2, 0))
+        status, _, body = await self.call('GET', '/api/nothing')
+        self.assertEqual((status, json.loads(body)), (404, {'error': 'Not Found'}))
+        status, _, _ = await self.call('GET', '/api/add')
+        self.assertEqual(status, 405)
+
+    async def test_sync_search_and_export(self):
+        await self.call('POST', '/api/add', {'task_description': 'Before'})
+        _, _, body = await self.call('POST', '/api/sync', {'fetch_tasks': True})
+        rev = json.loads(body)['rev']
+        await self.call('POST', '/api/batch', {'add': ['Buy milk', 'Walk dog']})
+        _, _, body = await self.call('POST', '/api/sync', {'since_rev': rev})
+        changes = json.loads(body)['changes']
+        self.assertEqual([row['TODO'] for row in changes['tasks']['upserted']], ['Walk dog', 'Buy milk'])
+
+        _, _, body = await self.call('GET', '/api/search?q=mil*&scope=tasks')
+        self.assertEqual([hit['TODO'] for hit in json.loads(body)['tasks']['results']], ['Buy milk'])
+
+        status, headers, body = await self.call('GET', '/api/export')
+        self.assertEqual(headers['content-type'], 'application/x-ndjson')
+        self.assertEqual(len(body.decode().splitlines()), 3)
+        exported = body
+        status, _, body = await self.call('POST', '/api/import', exported)
+        self.assertEqual((status, json.loads(body)['tasks']), (200, 3))
+        status, _, body = await self.call('POST', '/api/import?keep_ids=1', exported)
+        self.assertEqual((status, json.loads(body)['error']), (400, 'records 1-3 reuse an id that already exists'))
+
+        for bad in ({'fetch_tasks': True, 'tasks_before_id': [1]}, {'fetch_archives': True, 'archives_page': 'x'}):
+            status, _, _ = await self.call('POST', '/api/sync', bad)
+            self.assertEqual(status, 400, bad)
+
+        _, _, body = await self.call('POST', '/api/sync', {'fetch_task_ids': [1, 999, 1], 'fetch_tasks': True})
+        data = json.loads(body)
+        self.assertEqual((data['tasks_by_id'], data['missing_task_ids']), ([{'id': 1, 'TODO': 'Before'}], [999]))
+        self.assertEqual(len(data['tasks']), 6)
+
+    async def test_compression_and_columnar_format(self):
+        import gzip
+        await self.call('POST', '/api/batch', {'add': [f'Compressible task number {i} ' * 5 for i in range(40)]})
+        _, plain_headers, plain = await self.call('GET', '/api/tasks')
+        status, headers, body = await self.call('GET', '/api/tasks', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual((status, headers['content-encoding']), (200, 'gzip'))
+        self.assertEqual(gzip.decompress(body), plain)
+        self.assertEqual(headers['vary'], 'Accept, Accept-Encoding')
+        status, _, _ = await self.call('GET', '/api/tasks', headers={'If-None-Match': headers['etag']})
+        self.assertEqual(status, 304)
+
+        _, headers, body = await self.call('GET', '/api/export', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(len(gzip.decompress(body).decode().splitlines()), 40)
+
+        _, headers, body = await self.call('GET', '/api/tasks', headers={'Accept': 'application/vnd.todo.columnar+json'})
+        self.assertEqual(headers['content-type'], 'application/vnd.todo.columnar+json')
+        self.assertEqual(json.loads(body)['ids'], [task['id'] for task in json.loads(plain)])
+
+
+def post_concurrently(app, url, bodies):
+    """POST every body from its own thread, all released at once; returns ``[(status, json)]`` in order."""
+    from concurrent.futures import ThreadPoolExecutor
+    import threading
+    start = threading.Barrier(len(bodies))
+
+    def post(body):
+        client = app.test_client()
+        start.wait()
+        response = client.post(url, data=json.dumps(body), content_type='application/json')
+        return response.status_code, response.get_json()
+
+    with ThreadPoolExecutor(len(bodies)) as pool:
+        return list(pool.map(post, bodies))
+
+
+class ConcurrentMoveTestCase(unittest.TestCase):
+    """Parallel archive/unArchive requests move every row exactly once."""
+
+    def setUp(self):
+        class TestConfig(Config):
+            TESTING = True
+            DATABASE_URI = file_database(self)
+
+        self.app = create_app(TestConfig)
+
+    def tearDown(self):
+        self.app.extensions['database'].dispose()
+
+    def test_parallel_archives_of_one_task(self):
+        task_id = self.app.test_client().post('/api/add', data=json.dumps({'task_description': 'Contended'}),
+                                              content_type='application/json').get_json()['id']
+        results = post_concurrently(self.app, '/api/archive', [{'task_id': task_id}] * 8)
+        self.assertEqual(sorted(status for status, _ in results), [200] + [404] * 7)
+        with self.app.app_context():
+            db_session = get_db_session()
+            self.assertEqual([a.Finished for a in db_session.query(Archived).all()], ['Contended'])
+            self.assertEqual(db_session.query(Tasks).count(), 0)
+            self.assertEqual(db_session.query(ChangeLog).filter_by(op='move').count(), 1)
+
+    def test_parallel_moves_in_both_directions(self):
+        client = self.app.test_client()
+        task_ids = [client.post('/api/add', data=json.dumps({'task_description': f'Task {i}'}),
+                                content_type='application/json').get_json()['id'] for i in range(6)]
+        archive_ids = [client.post('/api/archive', data=json.dumps({'task_id': task_id}),
+                                   content_type='application/json').get_json()['archived_task_id']
+                       for task_id in task_ids[3:]]
+
+        archived = post_concurrently(self.app, '/api/archive', [{'task_id': i} for i in task_ids[:3]] * 3)
+        restored = post_concurrently(self.app, '/api/unArchive', [{'archive_id': i} for i in archive_ids] * 3)
+        self.assertEqual(sum(status == 200 for status, _ in archived), 3)
+        self.assertEqual(sum(status == 200 for status, _ in restored), 3)
+        with self.app.app_context():
+            db_session = get_db_session()
+            self.assertEqual(sorted(t.TODO for t in db_session.query(Tasks).all()), ['Task 3', 'Task 4', 'Task 5'])
+            self.assertEqual(sorted(a.Finished for a in db_session.query(Archived).all()), ['Task 0', 'Task 1', 'Task 2'])
+
+
+class ConcurrentCounterTestCase(unittest.TestCase):
+    """The row counters behind /api/stats stay equal to COUNT(*) under concurrent writes."""
+
+    def setUp(self):
+        class TestConfig(Config):
+            TESTING = True
+            DATABASE_URI = file_database(self)
+
+        self.app = create_app(TestConfig)
+
+    def tearDown(self):
+        self.app.extensions['database'].dispose()
+
+    def assert_counters_exact(self):
+        with self.app.app_context():
+            db_session = get_db_session()
+            stats = self.app.test_client().get('/api/stats').get_json()
+            self.assertEqual(stats, {'tasks': db_session.query(Tasks).count(),
+                                     'archives': db_session.query(Archived).count()})
+            close_db_session()
+        return stats
+
+    def test_counters_exact_under_concurrent_mutations(self):
+        from concurrent.futures import ThreadPoolExecutor
+        client = self.app.test_client()
+        ids = [item['id'] for item in client.post('/api/batch', data=json.dumps({'add': [f'Task {i}' for i in range(20)]}),
+                                                  content_type='application/json').get_json()['add']]
+        archive_ids = [item['archived_task_id'] for item in client.post(
+            '/api/batch', data=json.dumps({'archive': ids[10:]}), content_type='application/json').get_json()['archive']]
+
+        # Every id is contended: some requests for it win, the rest find nothing to move or delete
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda args: post_concurrently(self.app, *args), [
+                ('/api/add', [{'task_description': f'New {i}'} for i in range(8)]),
+                ('/api/archive', [{'task_id': task_id} for task_id in ids[:6]] * 2),
+                ('/api/unArchive', [{'archive_id': archive_id} for archive_id in archive_ids[:4]] * 2),
+                ('/api/perm_delete', [{'archive_id': archive_id} for archive_id in archive_ids[2:8]] * 2),
+            ]))
+        self.assertEqual(sum(status == 201 for status, _ in results[0]), 8)
+        self.assertEqual(sum(status == 200 for status, _ in results[1]), 6)
+        stats = self.assert_counters_exact()
+        self.assertEqual(stats['tasks'] + stats['archives'], 28 - sum(status == 200 for status, _ in results[3]))
+
+
+class AdmissionTestCase(unittest.TestCase):
+    """Requests beyond the read and write limits are shed with a fast 503."""
+
+    def setUp(self):
+        class TestConfig(Config):
+            TESTING = True
+            DATABASE_URI = file_database(self)
+            ADMISSION_ENABLED = True
+            ADMISSION_WRITE_LIMIT = 1
+            ADMISSION_WRITE_QUEUE = 1
+            ADMISSION_WRITE_TIMEOUT_MS = 50
+            ADMISSION_RETRY_AFTER_SECONDS = 2
+
+        self.app = create_app(TestConfig)
+
+    def tearDown(self):
+        self.app.extensions['database'].dispose()
+
+    def test_gate_queues_in_order_then_sheds(self):
+        import threading
+        from app.admission import Gate
+        gate = Gate(limit=1, queue_size=1, timeout=5)
+        self.assertTrue(gate.acquire())
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(gate.acquire()))
+        waiter.start()
+        while not gate.waiting:
+            pass
+        self.assertFalse(gate.acquire())      # queue full
+        gate.release()                        # handed to the waiter
+        waiter.join()
+        self.assertEqual((results, gate.active, gate.shed_full), ([True], 1, 1))
+        gate.timeout = 0.01
+        self.assertFalse(gate.acquire())      # waited too long
+        gate.release()
+        self.assertEqual((gate.active, gate.waiting, gate.shed_timeout, gate.admitted), (0, 0, 1, 2))
+
+    def test_saturated_writes_are_shed_while_reads_pass(self):
+        import threading
+        from unittest import mock
+        from app.control_endpoints import controller
+        release = threading.Event()
+        entered = threading.Event()
+        add_todo = controller.add_todo
+
+        def slow_add(task):
+            entered.set()
+            release.wait(5)
+            return add_todo(task)
+
+        client = self.app.test_client()
+        with mock.patch.object(controller, 'add_todo', slow_add):
+            holder = threading.Thread(target=lambda: self.app.test_client().post(
+                '/api/add', json={'task_description': 'Holds the write slot'}))
+            holder.start()
+            entered.wait(5)
+            # The one queue place times out, and so does any write after it
+            response = client.post('/api/add', json={'task_description': 'Shed'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '2')
+            self.assertEqual(client.post('/api/lists/other/archive', json={'task_id': 1}).status_code, 503)
+            self.assertFalse(os.path.exists(os.path.join(self.app.config['LISTS_DIR'], 'other.db')))
+            # Reads have slots of their own
+            self.assertEqual(client.get('/api/tasks').status_code, 200)
+            self.assertEqual(client.post('/api/sync', json={'fetch_tasks': True}).status_code, 200)
+            release.set()
+            holder.join()
+
+        self.assertEqual(client.post('/api/add', json={'task_description': 'After'}).status_code, 201)
+        self.assertEqual([task['TODO'] for task in client.get('/api/tasks').get_json()],
+                         ['After', 'Holds the write slot'])
+        metrics = client.get('/api/metrics').data.decode()
+        self.assertIn('todo_admission_write_shed_timeout_total 2', metrics)
+        self.assertIn('todo_admission_write_active 0', metrics)
+        self.assertIn('todo_admission_read_admitted_total 3', metrics)
+
+
+class SyncSnapshotTestCase(unittest.TestCase):
+    """The reads of one /api/sync request all see the database at the same moment."""
+
+    def setUp(self):
+        class TestConfig(Config):
+            TESTING = True
+            DATABASE_URI = file_database(self)
+
+        self.app = create_app(TestConfig)
+
+    def tearDown(self):
+        self.app.extensions['database'].dispose()
+
+    def test_reads_in_snapshot_ignore_concurrent_writes(self):
+        import threading
+        from app.control_endpoints import controller
+        client = self.app.test_client()
+        client.post('/api/add', data=json.dumps({'task_description': 'Before'}), content_type='application/json')
+
+        def add_from_other_thread():
+            thread = threading.Thread(target=lambda: self.app.test_client().post(
+                '/api/add', data=json.dumps({'task_description': 'During'}), content_type='application/json'))
+            thread.start()
+            thread.join()
+
+        with self.app.app_context():
+            with controller.read_snapshot():
+                rev = controller.get_head_rev()
+                add_from_other_thread()
+                self.assertEqual(controller.get_head_rev(), rev)
+                self.assertEqual([row[1] for row in controller.get_task_rows()], ['Before'])
+            self.assertEqual(controller.get_head_rev(), rev + 1)
+            self.assertEqual([row[1] for row in controller.get_task_rows()], ['During', 'Before'])
+            close_db_session()
+
+
+class WriteQueueTestCase(unittest.TestCase):
+    """Concurrent /api/add and /api/archive requests are group-committed by the writer thread."""
+
+    def setUp(self):
+        class QueuedConfig(Config):
+            TESTING = True
+            WRITE_QUEUE_ENABLED = True
+            WRITE_QUEUE_MAX_DELAY_MS = 50
+            DATABASE_URI = file_database(self)
+
+        self.app = create_app(QueuedConfig)
+
+    def tearDown(self):
+        self.app.extensions['write_queue'].stop()
+        self.app.extensions['database'].dispose()
+
+    def test_concurrent_adds_share_commits(self):
+        write_queue = self.app.extensions['write_queue']
+        results = post_concurrently(self.app, '/api/add', [{'task_description': f'Queued {i}'} for i in range(20)])
+        self.assertEqual({status for status, _ in results}, {201})
+        with self.app.app_context():
+            stored = {task.id: task.TODO for task in get_db_session().query(Tasks).all()}
+        # Every caller got the id of its own row
+        self.assertEqual({body['id']: body['task'] for _, body in results}, stored)
+        self.assertEqual(write_queue.items, 20)
+        self.assertLess(write_queue.batches, 20)
+
+    def test_concurrent_archives_of_one_task(self):
+        task_id = self.app.test_client().post('/api/add', data=json.dumps({'task_description': 'Once'}),
+                                              content_type='application/json').get_json()['id']
+        results = post_concurrently(self.app, '/api/archive', [{'task_id': task_id}] * 4 + [{'task_id': 999}])
+        self.assertEqual(sorted(status for status, _ in results), [200, 404, 404, 404, 404])
+        with self.app.app_context():
+            self.assertEqual(get_db_session().query(Archived).count(), 1)
+            self.assertEqual(get_db_session().query(Tasks).count(), 0)
+
+    def test_bad_item_only_fails_itself(self):
+        from concurrent.futures import ThreadPoolExecutor
+        write_queue = self.app.extensions['write_queue']
+        # Rejected before it reaches the queue
+        results = post_concurrently(self.app, '/api/add', [{'task_description': f'Valid {i}'} for i in range(5)]
+                                    + [{'task_description': 5}])
+        self.assertEqual([status for status, _ in results], [201] * 5 + [400])
+        # One that breaks its batch anyway is retried alone, and the rest of the batch commits
+        values = ['Good 0', 'Good 1', 5, 'Good 2']
+        with ThreadPoolExecutor(len(values)) as pool:
+            new_ids = list(pool.map(lambda value: write_queue.submit('add', value), values))
+        self.assertIsNone(new_ids[2])
+        with self.app.app_context():
+            stored = {task.id: task.TODO for task in get_db_session().query(Tasks).all()}
+        self.assertEqual([stored[new_ids[i]] for i in (0, 1, 3)], ['Good 0', 'Good 1', 'Good 2'])
+        self.assertEqual(len(stored), 8)
+
+    def test_second_app_keeps_its_own_services(self):
+        other = create_app(type('OtherConfig', (Config,), {'TESTING': True, 'DATABASE_URI': 'sqlite:///:memory:'}))
+        self.addCleanup(other.extensions['database'].dispose)
+        for name in ('response_cache', 'event_hub', 'write_queue', 'list_registry', 'maintenance_worker', 'log_pipeline'):
+            self.assertIsNot(other.extensions[name], self.app.extensions[name])
+        # Creating the second app neither stopped this app's writer nor reconfigured its cache
+        self.assertTrue(self.app.extensions['write_queue'].running)
+        self.assertFalse(other.extensions['write_queue'].running)
+        other.extensions['response_cache'].enabled = False
+        self.assertTrue(self.app.extensions['response_cache'].enabled)
+        status, _ = post_concurrently(self.app, '/api/add', [{'task_description': 'Still queued'}])[0]
+        self.assertEqual(status, 201)
+        self.assertEqual(self.app.extensions['write_queue'].items, 1)
+
+
+class LogPipelineTestCase(unittest.TestCase):
+    """Log records are written by a listener thread through a bounded queue."""
+
+    def make_app(self, **settings):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.log_file = os.path.join(tmp_dir.name, 'app.log')
+        settings = dict(settings, TESTING=True, DATABASE_URI='sqlite:///:memory:', LOG_FILE=self.log_file)
+        app = create_app(type('LogConfig', (Config,), settings))
+        self.addCleanup(app.extensions['database'].dispose)
+        self.addCleanup(app.extensions['log_pipeline'].stop)
+        return app
+
+    def lines(self):
+        with open(self.log_file, encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_records_written_at_stop(self):
+        app = self.make_app()
+        log_pipeline = app.extensions['log_pipeline']
+        self.assertTrue(log_pipeline.running)
+        app.test_client().post('/api/add', data=json.dumps({'task_description': 'Logged'}), content_type='application/json')
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            app.logger.exception('Failed with %s', 'details')
+        log_pipeline.stop()
+        text = '\n'.join(self.lines())
+        self.assertIn('INFO in control: Task 1 added.', text)
+        self.assertIn('ERROR in test_app: Failed with details', text)
+        self.assertIn('ValueError: boom', text)
+
+    def test_full_queue_drops_and_counts(self):
+        import threading
+        app = self.make_app(LOG_QUEUE_SIZE=2)
+        log_pipeline = app.extensions['log_pipeline']
+        gate = threading.Event()
+        # Hold the listener on the first record so the queue fills up
+        log_pipeline._listener.handlers[0].addFilter(lambda record: gate.wait() or True)
+        for i in range(10):
+            app.logger.warning('Record %d', i)
+        self.assertGreaterEqual(log_pipeline.dropped, 7)
+        self.assertIn(f'todo_log_dropped_total {log_pipeline.dropped}', app.test_client().get('/api/metrics').get_data(as_text=True))
+        gate.set()
+        log_pipeline.stop()
+        records = [line for line in self.lines() if 'Record' in line]
+        self.assertEqual(len(records) + log_pipeline.dropped, 10)
+
+    def test_info_sampling(self):
+        app = self.make_app(LOG_INFO_SAMPLE_EVERY=3)
+        log_pipeline = app.extensions['log_pipeline']
+        for i in range(9):
+            app.logger.info('Task %d added.', i)
+        app.logger.warning('Never sampled %d', 1)
+        log_pipeline.stop()
+        self.assertEqual([line.split(': ', 1)[1] for line in self.lines() if 'added' in line or 'sampled' in line],
+                         ['Task 0 added.', 'Task 3 added.', 'Task 6 added.', 'Never sampled 1'])
+        self.assertEqual(log_pipeline.sampled, 6)
+
+
+class ReadModelTestCase(unittest.TestCase):
+    """With READ_MODEL_ENABLED, task reads are answered from memory at the exact version requested."""
+
+    def make_app(self, **settings):
+        settings = dict({'TESTING': True, 'DATABASE_URI': 'sqlite:///:memory:', 'READ_MODEL_ENABLED': True,
+                         'RESPONSE_CACHE_ENABLED': False, 'TASKS_PER_PAGE': 10}, **settings)
+        self.app = create_app(type('ReadModelConfig', (Config,), settings))
+        self.addCleanup(self.app.extensions['database'].dispose)
+        self.model = self.app.extensions['read_model']
+        self.addCleanup(self.model.stop)
+        self.client = self.app.test_client()
+        return self.app
+
+    def post(self, url, body):
+        return self.client.post(url, data=json.dumps(body), content_type='application/json').get_json()
+
+    def assert_matches_database(self):
+        """The model is at the current version with the rows of the database (a check finds no difference)."""
+        engine = self.app.extensions['database'].engine
+        loads, mismatches = self.model.loads, self.model.mismatches
+        self.assertTrue(self.model.load(engine))
+        self.assertEqual((self.model.loads, self.model.mismatches), (loads, mismatches))
+
+    def test_pages_and_lookups_match_sql(self):
+        from app.control_endpoints import controller
+        self.make_app()
+        added = [item['id'] for item in self.post('/api/batch', {'add': [f'Task {i}' for i in range(25)]})['add']]
+        self.post('/api/batch', {'archive': added[3:8]})
+        archive_id = self.post('/api/archive', {'task_id': added[0]})['archived_task_id']
+        restored_id = self.post('/api/unArchive', {'archive_id': archive_id})['task_id']
+        self.post('/api/add', {'task_description': 'Last'})
+        self.assert_matches_database()
+
+        with self.app.app_context():
+            version = controller.get_versions('Tasks')['Tasks']
+            bounds = [{'page': page} for page in (1, 2, 3, 4)] + [
+                {'before_id': added[12]}, {'after_id': added[5]}, {'after_id': added[20]}, {'before_id': 1}]
+            for bound in bounds:
+                sql_rows = controller._page_rows(Tasks, bound.get('page', 1), bound.get('before_id'), bound.get('after_id'))
+                self.assertEqual(controller.get_task_rows(version=version, **bound), [tuple(row) for row in sql_rows])
+            ids = [added[10], added[4], 999, restored_id, added[10]]
+            self.assertEqual(controller.get_rows_by_id(Tasks, ids, version),
+                             tuple(list(part) for part in controller.get_rows_by_id(Tasks, ids)))
+            self.assertEqual(controller.get_task_by_id(added[1], version).TODO, 'Task 1')
+            self.assertIsNone(controller.get_task_by_id(added[4], version))
+            close_db_session()
+
+        hits = self.model.hits
+        first = self.client.get('/api/tasks').get_json()
+        self.assertEqual([task['TODO'] for task in first[:2]], ['Last', 'Task 0'])
+        data = self.post('/api/sync', {'fetch_tasks': True, 'fetch_task_ids': [added[2], added[3]]})
+        self.assertEqual(data['tasks'], first)
+        self.assertEqual(data['tasks_by_id'], [{'id': added[2], 'TODO': 'Task 2'}])
+        self.assertEqual(data['missing_task_ids'], [added[3]])
+        self.assertEqual(self.model.hits, hits + 3)
+        self.assertIn(f'todo_read_model_rows {self.model.rows}', self.client.get('/api/metrics').get_data(as_text=True))
+
+    def test_deltas_applied_in_version_order(self):
+        from app.models.read_model import TaskDelta
+        self.make_app()
+        self.post('/api/add', {'task_description': 'First'})
+        version = self.model.version
+        self.model.apply([TaskDelta(version + 2, [(1, None)], False)])
+        self.assertIsNone(self.model.page(version + 2, 10))
+        self.assertEqual(self.model.page(version, 10), [(1, 'First')])
+        self.model.apply([TaskDelta(version + 1, [(5, 'Fifth')], False)])
+        self.assertEqual(self.model.version, version + 2)
+        self.assertEqual(self.model.page(version + 2, 10), [(5, 'Fifth')])
+        # Deltas of versions already applied are ignored
+        self.model.apply([TaskDelta(version + 1, [(6, 'Sixth')], False)])
+        self.assertEqual(self.model.lookup(version + 2, [5, 6]), ([(5, 'Fifth')], [6]))
+
+    def test_import_and_outside_writes_fall_back_to_sql(self):
+        self.make_app()
+        self.post('/api/add', {'task_description': 'Before'})
+        response = self.client.post('/api/import', data=json.dumps({'type': 'task', 'TODO': 'Imported'}) + '\n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        # A bulk import cannot be followed row by row: SQL answers until the model is reloaded
+        self.assertIsNone(self.model.version)
+        misses = self.model.misses
+        self.assertEqual([task['TODO'] for task in self.client.get('/api/tasks').get_json()], ['Imported', 'Before'])
+        self.assertEqual(self.model.misses, misses + 1)
+        engine = self.app.extensions['database'].engine
+        self.assertTrue(self.model.load(engine))
+        self.assertEqual((self.model.loads, self.model.rows), (2, 2))
+
+        # A write that bypasses the app leaves the model behind the version requests read
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO Tasks (TODO) VALUES ('Outside')"))
+            conn.execute(text("UPDATE Counters SET value = value + 1 WHERE name = 'Tasks.version'"))
+        self.assertEqual(self.client.get('/api/tasks').get_json()[0]['TODO'], 'Outside')
+        self.assertEqual(self.model.misses, misses + 2)
+
+    def test_check_replaces_rows_that_differ(self):
+        self.make_app()
+        self.post('/api/add', {'task_description': 'Original'})
+        engine = self.app.extensions['database'].engine
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE Tasks SET TODO = 'Edited'"))
+        self.assertTrue(self.model.load(engine))
+        self.assertEqual(self.model.mismatches, 1)
+        self.assertEqual(self.model.page(self.model.version, 10), [(1, 'Edited')])
+
+    def test_over_budget_serves_from_sql(self):
+        self.make_app(READ_MODEL_MAX_BYTES=2000)
+        for i in range(30):
+            self.post('/api/add', {'task_description': f'Long enough task {i}'})
+        self.assertTrue(self.model.over_budget)
+        self.assertEqual(self.model.rows, 0)
+        self.assertEqual(len(self.client.get('/api/tasks').get_json()), 10)
+        self.assertFalse(self.model.load(self.app.extensions['database'].engine))
+
+    def test_async_writes_update_the_model(self):
+        from app.asgi import create_asgi_app
+        api = create_asgi_app(type('AsyncReadModelConfig', (Config,), {
+            'TESTING': True, 'DATABASE_URI': file_database(self), 'READ_MODEL_ENABLED': True}))
+        self.model = api.logic.read_model
+        self.addCleanup(api.database.dispose)
+        self.addCleanup(self.model.stop)
+
+        async def scenario():
+            task = await api.logic.add_todo('Async')
+            await api.logic.unArchive(await api.logic.archive(task.id))
+            await api.logic.apply_batch(add=['Batched'])
+            async with api.logic.read_snapshot():
+                version = await api.logic.read_model_version()
+                rows = await api.logic.get_task_rows(version=version)
+            await api.logic.engine.dispose()
+            return version, rows
+
+        version, rows = asyncio.run(scenario())
+        self.assertEqual((self.model.version, self.model.hits), (version, 1))
+        self.assertEqual([value for _, value in rows], ['Batched', 'Async'])
+        self.assertTrue(self.model.load(api.database.engine))
+        self.assertEqual((self.model.loads, self.model.mismatches), (1, 0))
+
+    def test_thread_reloads_after_outside_write(self):
+        import time
+        self.make_app(DATABASE_URI=file_database(self))
+        self.post('/api/add', {'task_description': 'Mine'})
+        engine = self.app.extensions['database'].engine
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO Tasks (TODO) VALUES ('Theirs')"))
+            conn.execute(text("UPDATE Counters SET value = value + 1 WHERE name = 'Tasks.version'"))
+        self.client.get('/api/tasks')
+        deadline = time.monotonic() + 5
+        while self.model.loads < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.model.loads, 2)
+        hits = self.model.hits
+        self.assertEqual([task['TODO'] for task in self.client.get('/api/tasks').get_json()], ['Theirs', 'Mine'])
+        self.assertEqual(self.model.hits, hits + 1)
+
+
+class NamedListsTestCase(unittest.TestCase):
+    """`/api/lists/<key>/...` serves the API from one SQLite file per list."""
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        class ListsConfig(Config):
+            TESTING = True
+            DATABASE_URI = 'sqlite:///:memory:'
+            LISTS_DIR = self.tmp_dir.name
+            LISTS_MAX_OPEN = 2
+
+        self.app = create_app(ListsConfig)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.app.extensions['list_registry'].close_all()
+        self.app.extensions['database'].dispose()
+        self.tmp_dir.cleanup()
+
+    def request(self, method, url, body=None):
+        """Send a request and close the response, which ends the list lease; returns ``(status, json)``."""
+        with self.client.open(url, method=method, json=body) as response:
+            return response.status_code, response.get_json()
+
+    def test_lists_are_isolated(self):
+        self.assertEqual(self.request('POST', '/api/lists/home/add', {'task_description': 'Water plants'})[0], 201)
+        self.request('POST', '/api/lists/work/batch', {'add': ['Report', 'Email']})
+        self.assertEqual([t['TODO'] for t in self.request('GET', '/api/lists/home/tasks')[1]], ['Water plants'])
+        self.assertEqual([t['TODO'] for t in self.request('GET', '/api/lists/work/tasks')[1]], ['Email', 'Report'])
+        self.assertEqual(self.request('GET', '/api/tasks')[1], [])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ['home.db', 'home.db-shm', 'home.db-wal',
+                                                                'work.db', 'work.db-shm', 'work.db-wal'])
+
+        status, body = self.request('POST', '/api/lists/home/archive', {'task_id': 1})
+        self.assertEqual((status, body['archived_task_id']), (200, 1))
+        with self.client.get('/api/lists/home/export') as response:
+            self.assertEqual(response.data.decode().splitlines(), ['{"type": "archive", "id": 1, "Finished": "Water plants"}'])
+        self.assertEqual(self.request('GET', '/api/lists/bad.key/tasks')[0], 404)
+
+    def test_least_recently_used_lists_are_closed(self):
+        list_registry = self.app.extensions['list_registry']
+        for key in ('a', 'b', 'c'):
+            self.request('POST', f'/api/lists/{key}/add', {'task_description': f'Task in {key}'})
+        self.assertEqual(list_registry.open_keys(), ['b', 'c'])
+        self.assertEqual((list_registry.opened, list_registry.closed), (3, 1))
+        # Reopened from its file
+        self.assertEqual(self.request('GET', '/api/lists/a/tasks')[1], [{'id': 1, 'TODO': 'Task in a'}])
+        self.assertEqual(list_registry.open_keys(), ['c', 'a'])
+
+    def test_writes_to_other_lists_do_not_wait(self):
+        import time
+        list_registry = self.app.extensions['list_registry']
+        self.request('POST', '/api/lists/busy/add', {'task_description': 'Setup'})
+        busy = list_registry.acquire('busy')
+        try:
+            with busy.engine.connect() as conn:
+                conn.exec_driver_sql('BEGIN IMMEDIATE')     # hold the write lock of "busy"
+                started = time.perf_counter()
+                status, _ = self.request('POST', '/api/lists/free/add', {'task_description': 'Not blocked'})
+                elapsed = time.perf_counter() - started
+                conn.exec_driver_sql('ROLLBACK')
+        finally:
+            list_registry.release(busy)
+        self.assertEqual(status, 201)
+        self.assertLess(elapsed, 1.0)
+
+    def test_events_are_scoped_to_their_list(self):
+        event_hub = self.app.extensions['event_hub']
+        default, home = event_hub.subscribe(), event_hub.subscribe(channel='home')
+        try:
+            self.request('POST', '/api/lists/home/add', {'task_description': 'Only home hears this'})
+            self.assertEqual(home.drain()[0], [(1, {'op': 'add', 'list': 'tasks', 'id': 1})])
+            self.assertEqual(default.drain()[0], [])
+        finally:
+            event_hub.unsubscribe(default)
+            event_hub.unsubscribe(home)
+
+
+class MaintenanceTestCase(unittest.TestCase):
+    """Retention and incremental vacuum on a database file; in memory there are no pages to hand back."""
+
+    def setUp(self):
+        class MaintenanceConfig(Config):
+            TESTING = True
+            DATABASE_URI = file_database(self)
+
+        self.app = create_app(MaintenanceConfig)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.app.extensions['database'].dispose()
+
+    def test_maintenance_reclaims_free_pages(self):
+        from app.maintenance import run_maintenance
+        self.client.post('/api/batch', json={'add': ['x' * 200 for _ in range(2000)]})
+        self.client.post('/api/batch', json={'archive': list(range(1, 2001))})
+        config = dict(self.app.config, RETENTION_MAX_ARCHIVES=0, RETENTION_BATCH_PAUSE_MS=0)
+        with self.app.app_context():
+            report = run_maintenance(config)
+            with get_engine().connect() as conn:
+                free_pages = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+        self.assertEqual(report['purged'], 2000)
+        self.assertGreater(report['bytes_reclaimed'], 400000)
+        self.assertEqual(free_pages, 0)
+
+
+class EngineSetupTestCase(unittest.TestCase):
+    def test_sqlite_file_engine_settings(self):
+        import tempfile
+        from app.models.database import build_engine, describe_engine
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            class FileConfig(Config):
+                DATABASE_URI = 'sqlite:///' + os.path.join(tmp_dir, 'tuned.db')
+                DB_POOL_SIZE = 3
+
+            tuned_engine = build_engine(FileConfig)
+            try:
+                settings = describe_engine(tuned_engine)
+            finally:
+                tuned_engine.dispose()
+
+        self.assertEqual(settings['journal_mode'], 'wal')
+        self.assertEqual(settings['synchronous'], 1)  # NORMAL
+        self.assertEqual(settings['busy_timeout'], Config.SQLITE_BUSY_TIMEOUT_MS)
+        self.assertEqual(settings['cache_size'], Config.SQLITE_CACHE_SIZE)
+        self.assertEqual(settings['temp_store'], 2)  # MEMORY
+        self.assertEqual(settings['pool'], 'QueuePool')
+        self.assertEqual(settings['pool_size'], 3)
+
+    def test_memory_engine_skips_wal(self):
+        from app.models.database import build_engine, describe_engine
+
+        class MemoryConfig(Config):
+            DATABASE_URI = 'sqlite:///:memory:'
+
+        memory_engine = build_engine(MemoryConfig)
+        settings = describe_engine(memory_engine)
+        memory_engine.dispose()
+        self.assertEqual(settings['journal_mode'], 'memory')
+        self.assertNotIn('pool_size', settings)
+
+class MigrationsTestCase(unittest.TestCase):
+    """Versioned migrations bring databases created by older releases up to date."""
+
+    def setUp(self):
+        import sqlite3
+        import tempfile
+        from app.models.database import build_engine
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp_dir.name, 'old.db')
+        # The schema of the first release: no timestamps, no schema_version
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute('CREATE TABLE "Tasks" (id INTEGER PRIMARY KEY, "TODO" VARCHAR(255) NOT NULL)')
+            conn.execute('CREATE TABLE "Archived" (id INTEGER PRIMARY KEY, "Finished" VARCHAR(255) NOT NULL)')
+            conn.executemany('INSERT INTO "Archived" ("Finished") VALUES (?)', [(f'Old {i}',) for i in range(10)])
+        conn.close()
+
+        class OldConfig(Config):
+            DATABASE_URI = 'sqlite:///' + path
+            MIGRATION_BATCH_SIZE = 3
+            MIGRATION_BATCH_PAUSE_MS = 0
+
+        self.config = OldConfig
+        self.engine = build_engine(OldConfig)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_old_database_migrated_in_batches(self):
+        from app.models.migrations import MIGRATIONS, migration_history, pending_migrations
+        init_db(self.engine, self.config)
+        with self.engine.connect() as conn:
+            nulls = conn.exec_driver_sql('SELECT count(*) FROM "Archived" WHERE archived_at IS NULL OR created_at IS NULL').scalar()
+            indexes = {row[1] for row in conn.exec_driver_sql('PRAGMA index_list("Archived")')}
+            task_columns = {row[1] for row in conn.exec_driver_sql('PRAGMA table_info("Tasks")')}
+        self.assertEqual(nulls, 0)
+        self.assertIn('ix_Archived_archived_at', indexes)
+        self.assertIn('created_at', task_columns)
+
+        history = migration_history(self.engine)
+        self.assertEqual([row['version'] for row in history], [m.version for m in MIGRATIONS])
+        backfill = next(step for step in history[0]['steps'] if step['step'] == 'backfill Archived.archived_at')
+        self.assertEqual((backfill['rows'], backfill['batches']), (10, 4))
+        self.assertEqual(pending_migrations(self.engine), [])
+        # Row counters start from the rows the old database already had
+        with self.engine.connect() as conn:
+            counts = dict(conn.exec_driver_sql('SELECT name, value FROM "Counters" WHERE name LIKE \'%.count\'').all())
+        self.assertEqual(counts, {'Tasks.count': 0, 'Archived.count': 10})
+
+        # Nothing left to do on the next start
+        init_db(self.engine, self.config)
+        self.assertEqual(len(migration_history(self.engine)), len(MIGRATIONS))
+
+    def test_migrations_can_wait_for_the_command(self):
+        from app.models.migrations import migrate, pending_migrations
+        self.config.MIGRATE_ON_STARTUP = False
+        init_db(self.engine, self.config)
+        self.assertEqual(len(pending_migrations(self.engine)), 2)
+        reports = migrate(self.engine, batch_size=4, pause=0)
+        self.assertEqual([report['version'] for report in reports], [1, 2])
+        self.assertEqual(pending_migrations(self.engine), [])
+
+    def test_new_database_is_stamped(self):
+        from app.models.database import build_engine
+        from app.models.migrations import migration_history
+
+        class NewConfig(Config):
+            DATABASE_URI = 'sqlite:///' + os.path.join(self.tmp_dir.name, 'new.db')
+
+        new_engine = build_engine(NewConfig)
+        try:
+            init_db(new_engine, NewConfig)
+            history = migration_history(new_engine)
+        finally:
+            new_engine.dispose()
+        self.assertEqual([row['version'] for row in history], [1, 2])
+        self.assertTrue(all(row['steps'] == [] for row in history))
+
+
 if __name__ == '__main__':
     unittest.main()